@@ -0,0 +1,197 @@
+# chat/admission.py
+"""
+Admission control for the predict endpoint.
+
+Inference is CPU-bound, so letting every request start at once only makes all
+of them slow. Each worker admits at most MAX_IN_FLIGHT predictions at a time
+and lets at most MAX_QUEUE more wait for a slot. A request is shed when the
+queue is full or when its deadline (BUDGET_MS after it arrived, counting time
+spent in the proxy/socket backlog when the proxy sends X-Request-Start)
+passes before it gets a slot. Shed requests get a 503 with Retry-After, or
+the keyword fallback when OVERLOAD_ACTION is 'fallback'.
+"""
+import math
+import threading
+import time
+from contextlib import contextmanager
+
+from django.conf import settings
+from django.core.signals import setting_changed
+from django.dispatch import receiver
+
+
+class Overloaded(Exception):
+    def __init__(self, reason, retry_after):
+        super().__init__(reason)
+        self.reason = reason
+        self.retry_after = retry_after
+
+
+class AdmissionController:
+    def __init__(self, max_in_flight=1, max_queue=8):
+        self.max_in_flight = max_in_flight
+        self.max_queue = max_queue
+        self._cond = threading.Condition()
+        self.in_flight = 0
+        self.queued = 0
+        self.max_queued = 0
+        self.admitted = 0
+        self.shed = {'queue_full': 0, 'deadline': 0}
+        self.downgraded = 0
+        # Moving average of how long an admitted request holds its slot
+        self.service_time = 0.0
+
+    def retry_after(self):
+        """Seconds until a client retrying now would likely get a slot."""
+        backlog = (self.queued + self.in_flight) / max(1, self.max_in_flight)
+        return max(1, math.ceil(self.service_time * backlog))
+
+    def _shed(self, reason):
+        self.shed[reason] += 1
+        raise Overloaded(reason, self.retry_after())
+
+    @contextmanager
+    def admit(self, deadline=None):
+        """
+        Hold an inference slot for the duration of the block.
+
+        Raises Overloaded right away if the queue is full, or once `deadline`
+        (a time.time() value) passes while waiting.
+        """
+        with self._cond:
+            if deadline is not None and time.time() >= deadline:
+                self._shed('deadline')
+            if self.in_flight >= self.max_in_flight or self.queued:
+                if self.queued >= self.max_queue:
+                    self._shed('queue_full')
+                self.queued += 1
+                self.max_queued = max(self.max_queued, self.queued)
+                try:
+                    while self.in_flight >= self.max_in_flight:
+                        timeout = None if deadline is None else deadline - time.time()
+                        if timeout is not None and timeout <= 0:
+                            self._shed('deadline')
+                        self._cond.wait(timeout)
+                finally:
+                    self.queued -= 1
+            self.in_flight += 1
+            self.admitted += 1
+
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            elapsed = time.perf_counter() - start
+            with self._cond:
+                self.in_flight -= 1
+                self.service_time = elapsed if not self.service_time else 0.8 * self.service_time + 0.2 * elapsed
+                # Every waiter re-checks for a slot, so one that has just given up
+                # (deadline) can't swallow the wakeup while others keep waiting
+                self._cond.notify_all()
+
+    def record_downgrade(self):
+        with self._cond:
+            self.downgraded += 1
+
+    def snapshot(self):
+        with self._cond:
+            return {
+                'in_flight': self.in_flight,
+                'queue_depth': self.queued,
+                'max_queue_depth': self.max_queued,
+                'max_in_flight': self.max_in_flight,
+                'max_queue': self.max_queue,
+                'admitted': self.admitted,
+                'shed_queue_full': self.shed['queue_full'],
+                'shed_deadline': self.shed['deadline'],
+                'downgraded': self.downgraded,
+                'service_time_seconds': round(self.service_time, 4),
+            }
+
+
+def request_arrival(request):
+    """
+    When the request reached the front of the stack: X-Request-Start from the
+    proxy ('t=<epoch>' in s, ms or us, as nginx/Heroku send it) if present,
+    otherwise now.
+    """
+    header = request.headers.get('X-Request-Start', '')
+    value = header[2:] if header.startswith('t=') else header
+    try:
+        start = float(value)
+    except ValueError:
+        return time.time()
+    # Normalise microseconds / milliseconds to seconds
+    while start > 1e11:
+        start /= 1000
+    return min(start, time.time())
+
+
+def request_deadline(request):
+    budget = settings.ADMISSION.get('BUDGET_MS', 0)
+    if budget <= 0:
+        return None
+    return request_arrival(request) + budget / 1000
+
+
+_controller = None
+_controller_lock = threading.Lock()
+
+
+def get_admission_controller():
+    global _controller
+    if _controller is None:
+        with _controller_lock:
+            if _controller is None:
+                conf = settings.ADMISSION
+                _controller = AdmissionController(
+                    max_in_flight=conf.get('MAX_IN_FLIGHT', 1),
+                    max_queue=conf.get('MAX_QUEUE', 8),
+                )
+    return _controller
+
+
+@receiver(setting_changed)
+def _reset_admission(setting, **kwargs):
+    global _controller
+    if setting == 'ADMISSION':
+        _controller = None
+
+
+def prometheus_metrics(snapshot, worker_id, breaker=None, shadow=None):
+    """Render a controller (circuit breaker, shadow pool) snapshot in the Prometheus text exposition format."""
+    labels = f'worker="{worker_id}"'
+    lines = [
+        '# TYPE predict_in_flight gauge',
+        f'predict_in_flight{{{labels}}} {snapshot["in_flight"]}',
+        '# TYPE predict_queue_depth gauge',
+        f'predict_queue_depth{{{labels}}} {snapshot["queue_depth"]}',
+        '# TYPE predict_queue_depth_max gauge',
+        f'predict_queue_depth_max{{{labels}}} {snapshot["max_queue_depth"]}',
+        '# TYPE predict_admitted_total counter',
+        f'predict_admitted_total{{{labels}}} {snapshot["admitted"]}',
+        '# TYPE predict_shed_total counter',
+        f'predict_shed_total{{{labels},reason="queue_full"}} {snapshot["shed_queue_full"]}',
+        f'predict_shed_total{{{labels},reason="deadline"}} {snapshot["shed_deadline"]}',
+        '# TYPE predict_downgraded_total counter',
+        f'predict_downgraded_total{{{labels}}} {snapshot["downgraded"]}',
+        '# TYPE predict_service_time_seconds gauge',
+        f'predict_service_time_seconds{{{labels}}} {snapshot["service_time_seconds"]}',
+    ]
+    if breaker is not None:
+        lines += [
+            '# TYPE predict_model_circuit_open gauge',
+            f'predict_model_circuit_open{{{labels}}} {int(breaker["state"] != "closed")}',
+            '# TYPE predict_model_failures gauge',
+            f'predict_model_failures{{{labels}}} {breaker["failures"]}',
+        ]
+    if shadow is not None:
+        lines += [
+            '# TYPE predict_shadow_queue_depth gauge',
+            f'predict_shadow_queue_depth{{{labels}}} {shadow["queue_depth"]}',
+            '# TYPE predict_shadow_total counter',
+            f'predict_shadow_total{{{labels},outcome="submitted"}} {shadow["submitted"]}',
+            f'predict_shadow_total{{{labels},outcome="dropped"}} {shadow["dropped"]}',
+            f'predict_shadow_total{{{labels},outcome="failed"}} {shadow["failed"]}',
+        ]
+    return '\n'.join(lines) + '\n'
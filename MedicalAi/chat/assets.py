@@ -0,0 +1,239 @@
+# chat/assets.py
+"""
+Static asset build and serving.
+
+`StaticAssetStorage` is the collectstatic backend. On top of Django's
+manifest storage (content-hashed names plus staticfiles.json) it
+  * minifies JS and CSS with rjsmin/rcssmin (when installed) and compacts
+    JSON before the files are hashed,
+  * concatenates the STATIC_BUNDLES groups into one hashed file each,
+  * writes .gz and .br (when brotli is installed) next to every text file.
+
+`StaticAssetMiddleware` serves STATIC_ROOT from Django itself: it picks the
+precompressed variant the client accepts and marks fingerprinted files as
+immutable, so repeat visits make no requests for them at all.
+"""
+import gzip
+import json
+import mimetypes
+import os
+
+from django.conf import settings
+from django.contrib.staticfiles.storage import ManifestStaticFilesStorage, staticfiles_storage
+from django.core.exceptions import SuspiciousFileOperation
+from django.core.files.base import ContentFile
+from django.http import FileResponse, HttpResponseNotModified
+from django.utils._os import safe_join
+from django.utils.http import http_date
+from django.views.static import was_modified_since
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+try:
+    import rjsmin
+except ImportError:
+    rjsmin = None
+
+try:
+    import rcssmin
+except ImportError:
+    rcssmin = None
+
+COMPRESS_EXTENSIONS = ('.js', '.css', '.json', '.svg', '.html', '.txt', '.xml', '.map', '.ico')
+# Below this the compressed file plus Content-Encoding header isn't worth it
+COMPRESS_MIN_SIZE = 256
+
+IMMUTABLE = 'public, max-age=31536000, immutable'
+# Unhashed names can change under the same URL; let browsers revalidate them
+REVALIDATE = 'public, max-age=0, must-revalidate'
+
+
+def minify(name, content):
+    """Minified text of a static file, or None to keep it as is."""
+    if name.endswith(('.min.js', '.min.css')):
+        return None
+    if name.endswith('.js') and rjsmin:
+        return rjsmin.jsmin(content)
+    if name.endswith('.css') and rcssmin:
+        return rcssmin.cssmin(content)
+    if name.endswith('.json'):
+        try:
+            return json.dumps(json.loads(content), separators=(',', ':'), ensure_ascii=False)
+        except ValueError:
+            return None
+    return None
+
+
+class StaticAssetStorage(ManifestStaticFilesStorage):
+    # Templates reference a few files that don't exist; render their plain URL instead of failing
+    manifest_strict = False
+
+    def stored_name(self, name):
+        try:
+            return super().stored_name(name)
+        except ValueError:
+            return name
+
+    def post_process(self, paths, dry_run=False, **options):
+        if dry_run:
+            yield from super().post_process(paths, dry_run, **options)
+            return
+
+        # Minify the collected copies and hash those instead of the source files
+        paths = dict(paths)
+        for name in paths:
+            if self.minify_file(name):
+                paths[name] = (self, name)
+
+        yield from super().post_process(paths, dry_run, **options)
+
+        for name, hashed_name in self.build_bundles():
+            yield name, hashed_name, True
+        self.save_manifest()
+
+        for name in list(self.hashed_files.values()) + list(self.hashed_files):
+            self.compress_file(name)
+
+    def minify_file(self, name):
+        if not name.endswith(('.js', '.css', '.json')):
+            return False
+        with self.open(name) as f:
+            try:
+                content = f.read().decode('utf-8')
+            except UnicodeDecodeError:
+                return False
+        minified = minify(name, content)
+        if minified is None or len(minified) >= len(content):
+            return False
+        self.delete(name)
+        self._save(name, ContentFile(minified.encode('utf-8')))
+        return True
+
+    def build_bundles(self):
+        """
+        Concatenate the hashed (already minified and URL-rewritten) members of
+        each bundle. Bundles sit in the same directory as their members, so
+        relative url()s in CSS stay valid.
+        """
+        for bundle, members in getattr(settings, 'STATIC_BUNDLES', {}).items():
+            separator = b'\n;\n' if bundle.endswith('.js') else b'\n'
+            parts = []
+            for member in members:
+                with self.open(self.stored_name(member)) as f:
+                    parts.append(f.read().strip())
+            content = ContentFile(separator.join(parts) + b'\n')
+
+            if self.exists(bundle):
+                self.delete(bundle)
+            self._save(bundle, content)
+            hashed_name = self.hashed_name(bundle, content)
+            if self.exists(hashed_name):
+                self.delete(hashed_name)
+            self._save(hashed_name, content)
+            self.hashed_files[self.hash_key(self.clean_name(bundle))] = hashed_name
+            yield bundle, hashed_name
+
+    def compress_file(self, name):
+        if not name.endswith(COMPRESS_EXTENSIONS) or not self.exists(name):
+            return
+        path = self.path(name)
+        with open(path, 'rb') as f:
+            data = f.read()
+        if len(data) < COMPRESS_MIN_SIZE:
+            return
+
+        variants = [('.gz', gzip.compress(data, compresslevel=9, mtime=0))]
+        if brotli:
+            variants.append(('.br', brotli.compress(data, quality=11)))
+        for suffix, compressed in variants:
+            # Keep only variants that actually save something
+            if len(compressed) < len(data) * 0.95:
+                with open(path + suffix, 'wb') as f:
+                    f.write(compressed)
+
+
+def accepted_encodings(header):
+    """
+    {coding: q} of the content codings an Accept-Encoding header allows.
+    Codings with q=0 are refused, and '*' stands for every coding not listed.
+    """
+    qvalues = {}
+    for part in header.split(','):
+        coding, *params = part.split(';')
+        coding = coding.strip().lower()
+        if not coding:
+            continue
+        q = 1.0
+        for param in params:
+            key, _, value = param.partition('=')
+            if key.strip().lower() == 'q':
+                try:
+                    q = float(value)
+                except ValueError:
+                    q = 0.0
+        qvalues[coding] = q
+    return qvalues
+
+
+def _q(qvalues, coding):
+    return qvalues.get(coding, qvalues.get('*', 0.0))
+
+
+class StaticAssetMiddleware:
+    """Serve collected static files with precompression and far-future caching."""
+
+    encodings = (('br', '.br'), ('gzip', '.gz'))
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        self.prefix = settings.STATIC_URL if settings.STATIC_URL.startswith('/') else '/' + settings.STATIC_URL
+        self.root = settings.STATIC_ROOT
+        self._hashed = None
+
+    @property
+    def hashed(self):
+        """Fingerprinted names from the manifest (empty when not built)."""
+        if self._hashed is None:
+            self._hashed = set(getattr(staticfiles_storage, 'hashed_files', {}).values())
+        return self._hashed
+
+    def __call__(self, request):
+        if request.method in ('GET', 'HEAD') and request.path.startswith(self.prefix) and self.root:
+            response = self.serve(request, request.path[len(self.prefix):])
+            if response is not None:
+                return response
+        return self.get_response(request)
+
+    def serve(self, request, name):
+        try:
+            path = safe_join(self.root, name)
+        except SuspiciousFileOperation:
+            return None
+        if not os.path.isfile(path):
+            return None
+
+        stat = os.stat(path)
+        if name not in self.hashed and not was_modified_since(
+            request.headers.get('If-Modified-Since'), stat.st_mtime
+        ):
+            return HttpResponseNotModified()
+
+        qvalues = accepted_encodings(request.headers.get('Accept-Encoding', ''))
+        encoding, served = None, path
+        # Highest q first; on a tie, the order of self.encodings (smallest file first)
+        for candidate, suffix in sorted(self.encodings, key=lambda e: -_q(qvalues, e[0])):
+            if _q(qvalues, candidate) > 0 and os.path.isfile(path + suffix):
+                encoding, served = candidate, path + suffix
+                break
+
+        content_type, _ = mimetypes.guess_type(name)
+        response = FileResponse(open(served, 'rb'), content_type=content_type or 'application/octet-stream')
+        if encoding:
+            response['Content-Encoding'] = encoding
+        response['Vary'] = 'Accept-Encoding'
+        response['Last-Modified'] = http_date(stat.st_mtime)
+        response['Cache-Control'] = IMMUTABLE if name in self.hashed else REVALIDATE
+        return response
@@ -0,0 +1,170 @@
+# chat/authentication.py
+"""
+Token authentication with cached token -> user resolution.
+
+DRF's TokenAuthentication runs a token/user join on every request. This
+backend keeps the user's pk, username and active flag for each token in a
+small per-process TTL cache, optionally backed by a shared Django cache
+(TOKEN_AUTH_CACHE['SHARED_CACHE']) so workers can warm each other. Nothing
+else about the user (in particular not the password hash) is cached: a hit
+yields a User whose other fields are deferred and loaded on first access, so
+views on the hot path should stick to pk, str(user) and is_active.
+
+Entries are dropped when a token is deleted (LogoutView) or its user is
+saved or deleted (deactivation, password change). Invalidation reaches the
+shared cache and the local cache of the process that made the change;
+other workers' local copies live at most LOCAL_TTL seconds, so keep that
+short when running several workers.
+
+QuerySet.update() and bulk_update() don't send post_save: call
+invalidate_users() after using them on is_active or password, or the old
+entries are honoured until they expire.
+"""
+import threading
+import time
+from collections import OrderedDict
+
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.core.cache import caches
+from django.core.signals import setting_changed
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
+from rest_framework import exceptions
+from rest_framework.authentication import TokenAuthentication
+from rest_framework.authtoken.models import Token
+
+# Bumped whenever the cached entry changes shape, so old entries are never read
+SHARED_KEY_PREFIX = 'auth-token:v2:'
+
+
+class TTLCache:
+    """Thread-safe LRU map whose entries expire `ttl` seconds after being set."""
+
+    def __init__(self, ttl, max_entries):
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self._data = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        with self._lock:
+            item = self._data.get(key)
+            if item is None:
+                return None
+            value, expires = item
+            if expires < time.monotonic():
+                del self._data[key]
+                return None
+            self._data.move_to_end(key)
+            return value
+
+    def set(self, key, value):
+        with self._lock:
+            self._data[key] = (value, time.monotonic() + self.ttl)
+            self._data.move_to_end(key)
+            while len(self._data) > self.max_entries:
+                self._data.popitem(last=False)
+
+    def delete(self, key):
+        with self._lock:
+            self._data.pop(key, None)
+
+    def clear(self):
+        with self._lock:
+            self._data.clear()
+
+    def __len__(self):
+        return len(self._data)
+
+
+def _config():
+    return getattr(settings, 'TOKEN_AUTH_CACHE', {})
+
+
+_local = None
+_local_lock = threading.Lock()
+
+
+def local_cache():
+    global _local
+    if _local is None:
+        with _local_lock:
+            if _local is None:
+                config = _config()
+                _local = TTLCache(config.get('LOCAL_TTL', 30), config.get('LOCAL_MAX_ENTRIES', 10000))
+    return _local
+
+
+@receiver(setting_changed)
+def _reset_local_cache(setting, **kwargs):
+    global _local
+    if setting == 'TOKEN_AUTH_CACHE':
+        _local = None
+
+
+def shared_cache():
+    alias = _config().get('SHARED_CACHE')
+    return caches[alias] if alias else None
+
+
+def invalidate_tokens(keys):
+    """Forget cached users for the given token keys in every tier."""
+    keys = list(keys)
+    if not keys:
+        return
+    local = local_cache()
+    for key in keys:
+        local.delete(key)
+    shared = shared_cache()
+    if shared is not None:
+        shared.delete_many([SHARED_KEY_PREFIX + key for key in keys])
+
+
+def invalidate_users(user_ids):
+    """Forget cached entries for every token of the given users."""
+    invalidate_tokens(Token.objects.filter(user_id__in=list(user_ids)).values_list('key', flat=True))
+
+
+class CachedTokenAuthentication(TokenAuthentication):
+    """
+    Drop-in replacement for TokenAuthentication (same header, same errors)
+    that only queries the database on a cache miss.
+    """
+
+    def authenticate_credentials(self, key):
+        local = local_cache()
+        entry = local.get(key)
+        if entry is None:
+            shared = shared_cache()
+            if shared is not None:
+                entry = shared.get(SHARED_KEY_PREFIX + key)
+            if entry is None:
+                # Raises AuthenticationFailed for unknown keys and inactive users
+                user, token = super().authenticate_credentials(key)
+                entry = (user.pk, user.get_username(), user.is_active)
+                if shared is not None:
+                    shared.set(SHARED_KEY_PREFIX + key, entry, _config().get('SHARED_TTL', 300))
+                local.set(key, entry)
+                return user, token
+            local.set(key, entry)
+
+        pk, username, is_active = entry
+        if not is_active:
+            raise exceptions.AuthenticationFailed('User inactive or deleted.')
+        # A fresh instance per request; the remaining fields load on first access
+        User = get_user_model()
+        user = User.from_db(None, [User._meta.pk.attname, User.USERNAME_FIELD, 'is_active'], [pk, username, is_active])
+        return user, Token(key=key, user=user)
+
+
+@receiver(post_delete, sender=Token)
+def _token_deleted(sender, instance, **kwargs):
+    invalidate_tokens([instance.key])
+
+
+@receiver(post_save, sender=get_user_model())
+@receiver(post_delete, sender=get_user_model())
+def _user_changed(sender, instance, **kwargs):
+    # Covers deactivation and password changes as well as deletion
+    invalidate_users([instance.pk])
@@ -0,0 +1,72 @@
+# chat/catalog.py
+"""
+Versioned disease catalog.
+
+The records in 24-Disease.json are served once from /api/diseases/ under a
+content hash, so prediction responses (and the AI messages stored from them)
+can refer to diseases by catalog id instead of repeating whole records. The
+id of a disease is the explicit "id" field of its record, which must never
+be reused: compact AI messages stored in conversations keep pointing at it
+after records are reordered or added. The version changes whenever any record
+does, so clients holding an older catalog know to refetch.
+"""
+import hashlib
+import json
+import threading
+
+from django.core.exceptions import ImproperlyConfigured
+
+from .utils import load_disease_data
+
+_lock = threading.Lock()
+_catalog = None
+
+
+class Catalog:
+    def __init__(self, diseases):
+        ids = [disease.get('id') for disease in diseases]
+        if not all(isinstance(i, int) for i in ids) or len(set(ids)) != len(ids):
+            raise ImproperlyConfigured("Every record in 24-Disease.json needs a unique integer 'id'")
+        self.diseases = [dict(disease) for disease in diseases]
+        self._by_id = {disease['id']: disease for disease in self.diseases}
+        canonical = json.dumps(diseases, sort_keys=True, separators=(',', ':'), ensure_ascii=False)
+        self.version = hashlib.sha256(canonical.encode('utf-8')).hexdigest()[:16]
+        self.etag = f'"{self.version}"'
+        # Pre-rendered body: the same bytes for every request, so the ETag is strong
+        self.body = json.dumps(
+            {'version': self.version, 'diseases': self.diseases},
+            separators=(',', ':'), ensure_ascii=False,
+        ).encode('utf-8')
+        self._ids = {disease.get('name', '').lower(): disease['id'] for disease in diseases}
+
+    def disease_id(self, name):
+        return self._ids.get(name.lower())
+
+    def match(self, result, compact=False):
+        """
+        Turn classifier output (per input, a list of {'label', 'score'}) into
+        predictions: full disease records with a confidence, or just
+        {'id', 'confidence'} in compact mode. Unknown labels are skipped.
+        """
+        matched = []
+        for disease_scores in result:
+            for r in disease_scores:
+                disease_id = self.disease_id(r["label"])
+                if disease_id is None:
+                    continue
+                confidence = round(r["score"] * 100, 2)
+                if compact:
+                    matched.append({"id": disease_id, "confidence": confidence})
+                else:
+                    matched.append(dict(self._by_id[disease_id], confidence=confidence))
+        return matched
+
+
+def get_catalog():
+    """Catalog built from the disease data file, loaded once per process."""
+    global _catalog
+    if _catalog is None:
+        with _lock:
+            if _catalog is None:
+                _catalog = Catalog(load_disease_data())
+    return _catalog
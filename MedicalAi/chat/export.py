@@ -0,0 +1,121 @@
+# chat/export.py
+"""
+Streaming export of a user's conversation history.
+
+One record per message, grouped by conversation and oldest first, with the
+conversation it belongs to. Rows are read with iterator(chunk_size) (a
+server-side cursor on PostgreSQL, fetchmany() batches on SQLite), encoded as
+NDJSON or CSV and handed to StreamingHttpResponse in blocks of about
+BLOCK_SIZE bytes, optionally gzip-compressed on the fly. Memory use does not
+depend on the size of the history.
+"""
+import csv
+import io
+import json
+import zlib
+
+from .models import Conversation, Message
+
+FORMATS = {
+    'ndjson': 'application/x-ndjson',
+    'csv': 'text/csv',
+}
+
+FIELDS = (
+    'conversation_id', 'conversation_title', 'conversation_created_at',
+    'message_id', 'is_user', 'text', 'created_at',
+)
+
+BLOCK_SIZE = 64 * 1024
+
+
+def message_rows(user, chunk_size=2000):
+    """
+    (values in FIELDS order) for every message of `user`, grouped by
+    conversation. Conversations are read by a second iterator in the same
+    order and merged in, so their title and timestamp are converted once per
+    conversation instead of once per message, and nothing is cached.
+    """
+    conversations = (
+        Conversation.objects
+        .filter(user=user)
+        .order_by('id')
+        .values_list('id', 'title', 'created_at')
+        .iterator(chunk_size=chunk_size)
+    )
+    messages = (
+        Message.objects
+        .filter(conversation__user=user)
+        .order_by('conversation_id', 'id')
+        .values_list('conversation_id', 'id', 'is_user', 'text', 'created_at')
+        .iterator(chunk_size=chunk_size)
+    )
+    conversation = next(conversations, None)
+    for conversation_id, message_id, is_user, text, created_at in messages:
+        while conversation is not None and conversation[0] < conversation_id:
+            conversation = next(conversations, None)
+        if conversation is None or conversation[0] != conversation_id:
+            continue  # conversation created after the export started
+        yield conversation_id, conversation[1], conversation[2], message_id, is_user, text, created_at
+
+
+def encode_ndjson(rows):
+    for conversation_id, title, conversation_created_at, message_id, is_user, text, created_at in rows:
+        yield json.dumps({
+            'conversation_id': conversation_id,
+            'conversation_title': title,
+            'conversation_created_at': conversation_created_at.isoformat(),
+            'message_id': message_id,
+            'is_user': is_user,
+            'text': text,
+            'created_at': created_at.isoformat(),
+        }, ensure_ascii=False) + '\n'
+
+
+def encode_csv(rows):
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+
+    def line(values):
+        writer.writerow(values)
+        value = buffer.getvalue()
+        buffer.seek(0)
+        buffer.truncate()
+        return value
+
+    yield line(FIELDS)
+    for conversation_id, title, conversation_created_at, message_id, is_user, text, created_at in rows:
+        yield line((
+            conversation_id, title, conversation_created_at.isoformat(),
+            message_id, int(is_user), text, created_at.isoformat(),
+        ))
+
+
+def blocks(lines, block_size=BLOCK_SIZE):
+    """Join encoded lines into byte blocks of about `block_size`, so the server writes fewer, larger chunks."""
+    pending, size = [], 0
+    for line in lines:
+        data = line.encode('utf-8')
+        pending.append(data)
+        size += len(data)
+        if size >= block_size:
+            yield b''.join(pending)
+            pending, size = [], 0
+    if pending:
+        yield b''.join(pending)
+
+
+def gzipped(chunks, level=6):
+    compressor = zlib.compressobj(level, zlib.DEFLATED, 31)  # wbits 31 = gzip container
+    for chunk in chunks:
+        data = compressor.compress(chunk)
+        if data:
+            yield data
+    yield compressor.flush()
+
+
+def export_stream(user, fmt='ndjson', compress=False, chunk_size=2000):
+    """Byte chunks of `user`'s history in `fmt` ('ndjson' or 'csv')."""
+    encode = encode_csv if fmt == 'csv' else encode_ndjson
+    stream = blocks(encode(message_rows(user, chunk_size)))
+    return gzipped(stream) if compress else stream
@@ -0,0 +1,400 @@
+# chat/inference.py
+"""
+Loading and CPU tuning for the disease classifier served by PredictView, the
+circuit breaker around it, and the keyword engine used as its fallback.
+
+`forward` runs the classifier's model directly when the caller also wants the
+pooled sentence embedding (similar-case retrieval, chat/similar.py), so the
+predictions and the embedding come from a single forward pass.
+"""
+import os
+import re
+import threading
+import time
+from functools import lru_cache
+
+from django.conf import settings
+from django.core.signals import setting_changed
+from django.dispatch import receiver
+
+_classifier = None
+_classifier_lock = threading.Lock()
+_cpu_settings = None
+
+# Predictions returned per input, by the pipeline and by `forward`
+TOP_K = 3
+
+
+def parse_cpu_list(spec):
+    """Parse a core list such as '0-3,8' into a sorted list of core ids."""
+    cores = set()
+    for part in str(spec).split(','):
+        part = part.strip()
+        if not part:
+            continue
+        if '-' in part:
+            start, end = part.split('-', 1)
+            cores.update(range(int(start), int(end) + 1))
+        else:
+            cores.add(int(part))
+    return sorted(cores)
+
+
+def available_cores():
+    """Cores this process may run on (respects cgroup/taskset limits)."""
+    if hasattr(os, 'sched_getaffinity'):
+        return sorted(os.sched_getaffinity(0))
+    return list(range(os.cpu_count() or 1))
+
+
+def worker_cores(affinity, threads, worker_id, cores=None):
+    """
+    Pick the cores a worker should be pinned to.
+
+    'auto' splits the available cores into blocks of `threads` cores and gives
+    worker N the N-th block (wrapping around if there are more workers than
+    blocks). Anything else is treated as an explicit core list.
+    """
+    if not affinity:
+        return None
+    cores = sorted(cores) if cores is not None else available_cores()
+    if affinity == 'auto':
+        if threads <= 0 or threads >= len(cores):
+            return None
+        blocks = len(cores) // threads
+        start = (worker_id % blocks) * threads
+        return cores[start:start + threads]
+    return parse_cpu_list(affinity)
+
+
+def export_thread_env(threads):
+    """
+    Export OpenMP/MKL thread counts so the native libraries agree with torch.
+
+    These are only honoured if set before torch initialises its thread pools,
+    so existing values (e.g. from the Gunicorn environment) win.
+    """
+    if threads > 0:
+        for var in ('OMP_NUM_THREADS', 'MKL_NUM_THREADS'):
+            os.environ.setdefault(var, str(threads))
+
+
+def pin_process(cores):
+    """
+    Pin every thread of this process to `cores`. On Linux sched_setaffinity(0)
+    only moves the calling thread; threads started afterwards inherit the mask
+    of the thread that starts them.
+    """
+    try:
+        thread_ids = [int(tid) for tid in os.listdir('/proc/self/task')]
+    except OSError:
+        thread_ids = [0]
+    for tid in thread_ids:
+        try:
+            os.sched_setaffinity(tid, cores)
+        except ProcessLookupError:
+            pass  # the thread exited in the meantime
+
+
+def apply_cpu_settings(intra_op_threads=None, inter_op_threads=None, affinity=None, worker_id=None):
+    """
+    Apply thread counts and core pinning to the current process.
+
+    Arguments default to settings.INFERENCE; the worker id defaults to the
+    INFERENCE_WORKER_ID environment variable set by gunicorn.conf.py.
+    Returns the effective configuration.
+    """
+    conf = settings.INFERENCE
+    intra = conf.get('INTRA_OP_THREADS', 0) if intra_op_threads is None else intra_op_threads
+    inter = conf.get('INTER_OP_THREADS', 0) if inter_op_threads is None else inter_op_threads
+    affinity = conf.get('CPU_AFFINITY', '') if affinity is None else affinity
+    if worker_id is None:
+        worker_id = int(os.environ.get('INFERENCE_WORKER_ID', 0))
+
+    cores = worker_cores(affinity, intra, worker_id)
+    if cores and hasattr(os, 'sched_setaffinity'):
+        pin_process(cores)
+        # Never run more intra-op threads than the cores we are pinned to
+        if intra <= 0 or intra > len(cores):
+            intra = len(cores)
+
+    export_thread_env(intra)
+
+    import torch
+
+    if intra > 0:
+        torch.set_num_threads(intra)
+    if inter > 0:
+        try:
+            torch.set_num_interop_threads(inter)
+        except RuntimeError:
+            # Can only be set once, before any inter-op parallel work has started
+            pass
+
+    return {
+        'worker_id': worker_id,
+        'intra_op_threads': torch.get_num_threads(),
+        'inter_op_threads': torch.get_num_interop_threads(),
+        'cores': cores,
+    }
+
+
+def load_classifier(model_path=None):
+    """Load the tokenizer and model from `model_path` into a text-classification pipeline."""
+    from transformers import (
+        AutoConfig,
+        AutoTokenizer,
+        AutoModelForSequenceClassification,
+        TextClassificationPipeline,
+    )
+
+    model_path = model_path or settings.INFERENCE['MODEL_DIR']
+    if not os.path.isdir(model_path) or not os.path.exists(os.path.join(model_path, "config.json")):
+        raise FileNotFoundError(f"Model not found at path: {model_path}")
+
+    tokenizer = AutoTokenizer.from_pretrained(model_path, local_files_only=True)
+    config = AutoConfig.from_pretrained(model_path, local_files_only=True)
+    model = AutoModelForSequenceClassification.from_pretrained(
+        model_path, config=config, local_files_only=True
+    )
+    model.eval()
+    return TextClassificationPipeline(
+        model=model,
+        tokenizer=tokenizer,
+        return_all_scores=True,
+        top_k=TOP_K,
+        device=-1
+    )
+
+
+def configure_cpu():
+    """
+    Apply the CPU settings once per process. gunicorn.conf.py calls this as
+    each worker starts, before it runs any request thread; otherwise it runs
+    when the model is first loaded.
+    """
+    global _cpu_settings
+    if _cpu_settings is None:
+        _cpu_settings = apply_cpu_settings()
+        print(f"Applied CPU settings: {_cpu_settings}")
+    return _cpu_settings
+
+
+def _load_configured_classifier():
+    """Apply the CPU settings (once per process) and load the configured model."""
+    configure_cpu()
+    return load_classifier()
+
+
+def get_classifier():
+    """
+    Return the process-wide classifier, loading it on first use.
+
+    CPU settings are applied right before the first load so every worker
+    configures its own thread pool and core pinning once.
+    """
+    global _classifier
+    if _classifier is None:
+        with _classifier_lock:
+            if _classifier is None:
+                _classifier = _load_configured_classifier()
+    return _classifier
+
+
+class CircuitBreaker:
+    """
+    Stops sending requests to a failing model.
+
+    Closed: requests use the model; `failure_threshold` consecutive failures
+    (load or inference errors) open the breaker. Open: requests go straight
+    to the fallback. Once `cooldown` seconds have passed, one background
+    probe tries `probe()`; success closes the breaker, failure reopens it
+    with the cooldown doubled (up to `max_cooldown`).
+    """
+    CLOSED, OPEN, PROBING = 'closed', 'open', 'probing'
+
+    def __init__(self, probe, failure_threshold=3, cooldown=30.0, max_cooldown=600.0):
+        self.probe = probe
+        self.failure_threshold = failure_threshold
+        self.base_cooldown = cooldown
+        self.max_cooldown = max_cooldown
+        self.cooldown = cooldown
+        self.state = self.CLOSED
+        self.failures = 0
+        self.opened_at = None
+        self.last_error = None
+        self._lock = threading.Lock()
+        self._probe_thread = None
+
+    def allow(self):
+        """True if this request may use the model; may start a recovery probe."""
+        with self._lock:
+            if self.state == self.CLOSED:
+                return True
+            if self.state == self.OPEN and time.monotonic() - self.opened_at >= self.cooldown:
+                self.state = self.PROBING
+                self._probe_thread = threading.Thread(target=self._run_probe, name='model-probe', daemon=True)
+                self._probe_thread.start()
+            return False
+
+    def record_success(self):
+        with self._lock:
+            self.state = self.CLOSED
+            self.failures = 0
+            self.cooldown = self.base_cooldown
+
+    def record_failure(self, error):
+        with self._lock:
+            self.failures += 1
+            self.last_error = f"{type(error).__name__}: {error}"
+            if self.state == self.PROBING:
+                self.cooldown = min(self.cooldown * 2, self.max_cooldown)
+                self._open()
+            elif self.state == self.CLOSED and self.failures >= self.failure_threshold:
+                self._open()
+
+    def _open(self):
+        self.state = self.OPEN
+        self.opened_at = time.monotonic()
+        print(f"🔴 Model circuit open for {self.cooldown:.0f}s after {self.failures} failures: {self.last_error}")
+
+    def _run_probe(self):
+        try:
+            self.probe()
+        except Exception as e:
+            self.record_failure(e)
+        else:
+            print("🟢 Model recovered, circuit closed")
+            self.record_success()
+
+    def snapshot(self):
+        with self._lock:
+            return {
+                'state': self.state,
+                'failures': self.failures,
+                'cooldown_seconds': self.cooldown,
+            }
+
+
+def _probe_model():
+    """Load the model off the request path and check that it can classify."""
+    global _classifier
+    classifier = _load_configured_classifier()
+    classifier("fever and headache", truncation=True)
+    with _classifier_lock:
+        _classifier = classifier
+
+
+_breaker = None
+
+
+def get_breaker():
+    global _breaker
+    if _breaker is None:
+        with _classifier_lock:
+            if _breaker is None:
+                conf = settings.INFERENCE
+                _breaker = CircuitBreaker(
+                    _probe_model,
+                    failure_threshold=conf.get('BREAKER_FAILURES', 3),
+                    cooldown=conf.get('BREAKER_COOLDOWN', 30),
+                )
+    return _breaker
+
+
+@receiver(setting_changed)
+def _reset_inference(setting, **kwargs):
+    # A different model directory or breaker config starts from scratch
+    global _classifier, _breaker
+    if setting == 'INFERENCE':
+        _classifier = None
+        _breaker = None
+
+
+def forward(classifier, texts, top_k=TOP_K):
+    """
+    Run the pipeline's model once over `texts`.
+
+    Returns the predictions in the pipeline's output shape (per text, the
+    top_k {'label', 'score'} by softmax) and the L2-normalised mean of the
+    last encoder layer over each text's tokens, as a float32 (n, hidden) array.
+    """
+    import numpy as np
+    import torch
+
+    model = classifier.model
+    inputs = classifier.tokenizer(list(texts), truncation=True, padding=True, return_tensors='pt')
+    with torch.inference_mode():
+        outputs = model(**inputs, output_hidden_states=True)
+        scores, ids = outputs.logits.softmax(-1).topk(min(top_k, model.config.num_labels), dim=-1)
+        mask = inputs['attention_mask'].unsqueeze(-1).to(outputs.hidden_states[-1].dtype)
+        pooled = (outputs.hidden_states[-1] * mask).sum(1) / mask.sum(1).clamp(min=1)
+        pooled = torch.nn.functional.normalize(pooled, dim=-1)
+
+    id2label = model.config.id2label
+    results = [
+        [{'label': id2label[int(i)], 'score': float(s)} for s, i in zip(row_scores, row_ids)]
+        for row_scores, row_ids in zip(scores, ids)
+    ]
+    return results, np.ascontiguousarray(pooled.numpy(), dtype=np.float32)
+
+
+def classify(text, embed=False):
+    """
+    Classify `text` with the model, or with the keyword engine while the
+    model is failing. Returns (result, engine, embedding) with engine 'model'
+    or 'keyword'; embedding is the pooled sentence embedding when `embed` is
+    set and the model answered, otherwise None.
+    """
+    breaker = get_breaker()
+    if breaker.allow():
+        try:
+            classifier = get_classifier()
+            if embed:
+                result, embeddings = forward(classifier, [text])
+                embedding = embeddings[0]
+            else:
+                result, embedding = classifier(text, truncation=True), None
+        except Exception as e:
+            print(f"Model prediction error, using keyword fallback: {e}")
+            breaker.record_failure(e)
+        else:
+            breaker.record_success()
+            return result, 'model', embedding
+    return keyword_classifier(text), 'keyword', None
+
+
+# Words too common in symptom descriptions to say anything about a disease
+KEYWORD_STOP_WORDS = {
+    'and', 'the', 'have', 'has', 'had', 'been', 'with', 'for', 'that', 'this', 'are', 'was',
+    'feel', 'feeling', 'very', 'also', 'some', 'from', 'but', 'not', 'all', 'can', 'get',
+    'getting', 'really', 'lot', 'like', 'when', 'its', 'it', 'my', 'me', 'of', 'in', 'on',
+}
+
+
+def _keywords(text):
+    return {w for w in re.findall(r'[a-z]+', text.lower()) if len(w) > 2 and w not in KEYWORD_STOP_WORDS}
+
+
+@lru_cache(maxsize=1)
+def _disease_keywords():
+    from .catalog import get_catalog
+
+    return [
+        (disease['name'], _keywords(disease.get('name', '') + ' ' + disease.get('description', '')))
+        for disease in get_catalog().diseases
+    ]
+
+
+def keyword_classifier(text, top_k=3):
+    """
+    Cheap fallback engine: ranks diseases by the share of the text's keywords
+    found in their name and description. Same output shape as the model
+    pipeline ([[{'label', 'score'}, ...]]) so PredictView handles both alike.
+    """
+    words = _keywords(text)
+    if not words:
+        return [[]]
+    scored = [(len(words & keywords) / len(words), name) for name, keywords in _disease_keywords()]
+    scored = sorted((s for s in scored if s[0] > 0), reverse=True)[:top_k]
+    return [[{'label': name, 'score': score} for score, name in scored]]
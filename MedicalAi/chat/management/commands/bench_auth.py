@@ -0,0 +1,145 @@
+"""
+Queries per request and latency of the API authentication backends.
+
+Runs a minimal authenticated view (it only reads the user's pk and
+str(user), as PredictView does) through the session and authentication
+middleware for a token-bearing request, as chat.js sends it, with:
+  * the previous project defaults (SessionAuthentication, then
+    TokenAuthentication) for a browser that also holds a session cookie
+  * DRF's TokenAuthentication
+  * CachedTokenAuthentication with the in-process cache
+  * CachedTokenAuthentication with only the shared tier (local TTL 0; a
+    LocMemCache stands in for Redis/Memcached, so network time is excluded)
+
+    python manage.py bench_auth --requests 2000
+"""
+import statistics
+import time
+
+from django.contrib.auth import BACKEND_SESSION_KEY, HASH_SESSION_KEY, SESSION_KEY
+from django.contrib.auth.middleware import AuthenticationMiddleware
+from django.contrib.auth.models import User
+from django.contrib.sessions.backends.db import SessionStore
+from django.contrib.sessions.middleware import SessionMiddleware
+from django.core.management.base import BaseCommand
+from django.db import connection, transaction
+from django.test import RequestFactory, override_settings
+from django.test.utils import CaptureQueriesContext
+from rest_framework.authentication import SessionAuthentication, TokenAuthentication
+from rest_framework.exceptions import AuthenticationFailed
+from rest_framework.authtoken.models import Token
+from rest_framework.permissions import IsAuthenticated
+from rest_framework.response import Response
+from rest_framework.views import APIView
+
+from chat.authentication import CachedTokenAuthentication
+
+
+class Rollback(Exception):
+    pass
+
+
+class WhoAmI(APIView):
+    permission_classes = [IsAuthenticated]
+
+    def get(self, request):
+        # str(user) as well, as PredictView logs it: it must not cost a query either
+        return Response({'id': request.user.pk, 'user': str(request.user)})
+
+
+BENCH_CACHES = {
+    'default': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache'},
+    'auth': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache', 'LOCATION': 'bench-auth'},
+}
+
+BACKENDS = [
+    ('session + token (old default)', [SessionAuthentication, TokenAuthentication], None, True),
+    ('token', [TokenAuthentication], None, False),
+    ('cached token, local', [CachedTokenAuthentication], {'LOCAL_TTL': 30}, False),
+    ('cached token, shared only', [CachedTokenAuthentication], {'LOCAL_TTL': 0, 'SHARED_CACHE': 'auth'}, False),
+]
+
+
+class Command(BaseCommand):
+    help = "Benchmark queries per request and latency of the token authentication backends."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--requests', type=int, default=2000)
+
+    def handle(self, *args, **options):
+        try:
+            with transaction.atomic():
+                self.run(options['requests'])
+                raise Rollback
+        except Rollback:
+            pass
+
+    def run(self, n):
+        user = User.objects.create_user(username=f"bench-auth-{time.time_ns()}", password='x')
+        token = Token.objects.create(user=user)
+        session = SessionStore()
+        session[SESSION_KEY] = str(user.pk)
+        session[BACKEND_SESSION_KEY] = 'django.contrib.auth.backends.ModelBackend'
+        session[HASH_SESSION_KEY] = user.get_session_auth_hash()
+        session.create()
+
+        factory = RequestFactory()
+        session_middleware = SessionMiddleware(lambda request: None)
+        auth_middleware = AuthenticationMiddleware(lambda request: None)
+
+        self.stdout.write(f"\n{'backend':<32}{'queries/req':>12}{'p50 us':>10}{'p95 us':>10}")
+        for name, classes, cache_config, with_session in BACKENDS:
+            view = WhoAmI.as_view(authentication_classes=classes)
+            with override_settings(CACHES=BENCH_CACHES, TOKEN_AUTH_CACHE=cache_config or {}):
+                timings, queries = [], 0
+                for i in range(n + 1):
+                    request = factory.get('/bench/', HTTP_AUTHORIZATION=f'Token {token.key}')
+                    if with_session:
+                        request.COOKIES['sessionid'] = session.session_key
+                    with CaptureQueriesContext(connection) as captured:
+                        t0 = time.perf_counter()
+                        session_middleware.process_request(request)
+                        auth_middleware.process_request(request)
+                        response = view(request)
+                        elapsed = time.perf_counter() - t0
+                    assert response.status_code == 200, response.data
+                    if i == 0:
+                        continue  # first request fills the caches
+                    timings.append(elapsed)
+                    queries += len(captured)
+
+            timings.sort()
+            self.stdout.write(
+                f"{name:<32}{queries / n:>12.2f}{statistics.median(timings) * 1e6:>10.0f}"
+                f"{timings[int(0.95 * (len(timings) - 1))] * 1e6:>10.0f}"
+            )
+
+        # Invalidation: logout and deactivation must take effect immediately in this process
+        self.stdout.write("")
+        with override_settings(TOKEN_AUTH_CACHE={'LOCAL_TTL': 30}):
+            backend = CachedTokenAuthentication()
+            for label, revoke in self.revocations(user, token):
+                key = revoke()
+                try:
+                    backend.authenticate_credentials(key)
+                    self.stdout.write(f"{label}: still authenticated from cache (FAIL)")
+                except AuthenticationFailed:
+                    self.stdout.write(f"{label}: rejected (OK)")
+
+    def revocations(self, user, token):
+        """(label, callable) pairs that cache a token, revoke it and return its key."""
+        backend = CachedTokenAuthentication()
+
+        def logout():
+            backend.authenticate_credentials(token.key)
+            token.delete()  # what LogoutView does
+            return token.key
+
+        def deactivate():
+            new_token = Token.objects.create(user=user)
+            backend.authenticate_credentials(new_token.key)
+            user.is_active = False
+            user.save()
+            return new_token.key
+
+        return [('logout (token deleted)', logout), ('user deactivated', deactivate)]
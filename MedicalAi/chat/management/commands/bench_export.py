@@ -0,0 +1,115 @@
+"""
+Memory and throughput of the streaming history export.
+
+Creates a throw-away user with N messages inside a transaction that is
+rolled back at the end, then downloads /api/conversations/export/ in every
+format, consuming the stream chunk by chunk as a client would, and reports
+rows/s, bytes and the peak Python heap (tracemalloc, which also slows the
+run down, so rows/s is a lower bound) while streaming. With
+--compare-list, the same is measured for the ConversationViewSet list the
+export replaces (keep N small for that one: it holds the whole history).
+
+    python manage.py bench_export --messages 2000000
+    python manage.py bench_export --messages 100000 --compare-list
+"""
+import json
+import random
+import time
+import tracemalloc
+
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from django.test import Client
+from django.test.utils import setup_test_environment
+from rest_framework.authtoken.models import Token
+
+from chat.models import Conversation, Message
+from chat.utils import load_symptom_cases
+
+
+class Rollback(Exception):
+    pass
+
+
+class Command(BaseCommand):
+    help = "Benchmark memory and throughput of the streaming conversation export."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--messages', type=int, default=2000000)
+        parser.add_argument('--per-conversation', type=int, default=20)
+        parser.add_argument('--compare-list', action='store_true')
+        parser.add_argument('--seed', type=int, default=42)
+
+    def handle(self, *args, **options):
+        setup_test_environment()
+        try:
+            with transaction.atomic():
+                self.run(options)
+                raise Rollback
+        except Rollback:
+            pass
+
+    def populate(self, user, total, per_conversation, rng):
+        cases = load_symptom_cases()
+        created = 0
+        while created < total:
+            batch = min(10000, total - created)
+            conversations = Conversation.objects.bulk_create(
+                Conversation(user=user, title=rng.choice(cases)[1][:50])
+                for _ in range(-(-batch // per_conversation))
+            )
+            messages = []
+            for i in range(batch):
+                label, text = rng.choice(cases)
+                messages.append(Message(
+                    conversation=conversations[i // per_conversation],
+                    is_user=i % 2 == 0,
+                    text=text if i % 2 == 0 else json.dumps({'predictions': [{'id': 3, 'confidence': 91.2}]}),
+                ))
+            Message.objects.bulk_create(messages)
+            created += batch
+
+    def download(self, client, url):
+        """Consume a response like a client would; returns (bytes, seconds, peak heap bytes)."""
+        tracemalloc.start()
+        t0 = time.perf_counter()
+        response = client.get(url)
+        assert response.status_code == 200, response.status_code
+        size = 0
+        if response.streaming:
+            for chunk in response.streaming_content:
+                size += len(chunk)
+        else:
+            size = len(response.content)
+        elapsed = time.perf_counter() - t0
+        _, peak = tracemalloc.get_traced_memory()
+        tracemalloc.stop()
+        return size, elapsed, peak
+
+    def run(self, options):
+        rng = random.Random(options['seed'])
+        user = User.objects.create_user(username=f"bench-export-{rng.getrandbits(32)}")
+        token = Token.objects.create(user=user)
+
+        start = time.perf_counter()
+        self.populate(user, options['messages'], options['per_conversation'], rng)
+        n = options['messages']
+        self.stdout.write(f"Created {n:,} messages in {time.perf_counter() - start:.1f}s")
+
+        client = Client(HTTP_AUTHORIZATION=f'Token {token.key}')
+        runs = [
+            ('ndjson', '/api/conversations/export/?fmt=ndjson'),
+            ('csv', '/api/conversations/export/?fmt=csv'),
+            ('ndjson + gzip', '/api/conversations/export/?fmt=ndjson&gzip=1'),
+            ('csv + gzip', '/api/conversations/export/?fmt=csv&gzip=1'),
+        ]
+        if options['compare_list']:
+            runs.append(('list (JSON)', '/api/conversations/'))
+
+        self.stdout.write(f"\n{'endpoint':<16}{'seconds':>9}{'rows/s':>11}{'MB':>9}{'peak heap MB':>14}")
+        for label, url in runs:
+            size, elapsed, peak = self.download(client, url)
+            self.stdout.write(
+                f"{label:<16}{elapsed:>9.1f}{n / elapsed:>11,.0f}{size / 1e6:>9.1f}{peak / 1e6:>14.1f}"
+            )
@@ -0,0 +1,116 @@
+"""
+Bytes on the wire for full vs compact prediction payloads.
+
+Builds PredictView responses for dataset texts (using the real catalog join,
+with top-3 scores drawn around the true label so no model is needed), stores
+them in a throw-away conversation as PredictView does, and reports, raw and
+gzipped:
+  * one /api/chat/predict/ response
+  * one /api/conversations/<id>/ history load of --exchanges turns
+  * the one-off /api/diseases/ catalog download a compact client pays first
+
+    python manage.py bench_payloads --exchanges 20
+"""
+import gzip
+import json
+import random
+
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from rest_framework.renderers import JSONRenderer
+
+from chat.catalog import get_catalog
+from chat.models import Conversation, Message
+from chat.serializers import ConversationDetailSerializer
+from chat.utils import load_symptom_cases
+
+
+class Rollback(Exception):
+    pass
+
+
+def _sizes(body):
+    return len(body), len(gzip.compress(body))
+
+
+def _fake_result(rng, label, labels):
+    others = rng.sample([l for l in labels if l != label], 2)
+    top = rng.uniform(0.7, 0.98)
+    rest = rng.uniform(0, 1 - top)
+    return [[
+        {'label': label, 'score': top},
+        {'label': others[0], 'score': rest},
+        {'label': others[1], 'score': (1 - top - rest) / 2},
+    ]]
+
+
+class Command(BaseCommand):
+    help = "Compare full and compact prediction payload sizes per prediction and per history load."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--exchanges', type=int, default=20, help="User/AI message pairs per conversation")
+        parser.add_argument('--samples', type=int, default=200, help="Predictions to average over")
+        parser.add_argument('--seed', type=int, default=42)
+
+    def handle(self, *args, **options):
+        try:
+            with transaction.atomic():
+                self.run(options)
+                raise Rollback
+        except Rollback:
+            pass
+
+    def response(self, catalog, result, compact):
+        data = {'predictions': catalog.match(result, compact=compact), 'conversation_id': '1'}
+        if compact:
+            data['catalog_version'] = catalog.version
+        return {'status': 'success', 'data': data, 'conversation_id': '1', 'is_new_conversation': False}
+
+    def run(self, options):
+        rng = random.Random(options['seed'])
+        renderer = JSONRenderer()
+        catalog = get_catalog()
+        labels = [d['name'] for d in catalog.diseases]
+        cases = [(label, text) for label, text in load_symptom_cases() if catalog.disease_id(label) is not None]
+        samples = [rng.choice(cases) for _ in range(options['samples'])]
+        results = [(text, _fake_result(rng, label, labels)) for label, text in samples]
+
+        rows = []
+        for compact in (False, True):
+            sizes = [_sizes(renderer.render(self.response(catalog, result, compact))) for _, result in results]
+            per_prediction = tuple(sum(s[i] for s in sizes) / len(sizes) for i in range(2))
+
+            user = User.objects.create_user(username=f"bench-payloads-{rng.getrandbits(32)}")
+            conversation = Conversation.objects.create(user=user, title="Payload benchmark")
+            messages = []
+            for text, result in results[:options['exchanges']]:
+                messages.append(Message(conversation=conversation, is_user=True, text=text))
+                # Stored exactly as PredictView stores the AI reply
+                ai_text = json.dumps(self.response(catalog, result, compact)['data'])
+                messages.append(Message(conversation=conversation, is_user=False, text=ai_text))
+            Message.objects.bulk_create(messages)
+            conversation = Conversation.objects.prefetch_related('messages').get(pk=conversation.pk)
+            history = _sizes(renderer.render(ConversationDetailSerializer(conversation).data))
+            rows.append(('compact' if compact else 'full', per_prediction, history))
+
+        catalog_sizes = _sizes(catalog.body)
+        self.stdout.write(f"\n{'':<10}{'predict raw':>14}{'predict gz':>12}{'history raw':>14}{'history gz':>12}")
+        for name, (raw, gz), (h_raw, h_gz) in rows:
+            self.stdout.write(f"{name:<10}{raw:>14,.0f}{gz:>12,.0f}{h_raw:>14,}{h_gz:>12,}")
+
+        (_, full, full_history), (_, compact, compact_history) = rows
+        self.stdout.write(
+            f"\nPer prediction: {full[0] - compact[0]:,.0f} bytes saved raw "
+            f"({1 - compact[0] / full[0]:.0%}), {full[1] - compact[1]:,.0f} gzipped ({1 - compact[1] / full[1]:.0%})"
+        )
+        self.stdout.write(
+            f"Per history load ({options['exchanges']} exchanges): {full_history[0] - compact_history[0]:,} bytes saved raw "
+            f"({1 - compact_history[0] / full_history[0]:.0%}), {full_history[1] - compact_history[1]:,} gzipped "
+            f"({1 - compact_history[1] / full_history[1]:.0%})"
+        )
+        saved_gz = full[1] - compact[1]
+        self.stdout.write(
+            f"Catalog (version {catalog.version}): {catalog_sizes[0]:,} bytes raw, {catalog_sizes[1]:,} gzipped, "
+            f"fetched once and then cached; repaid after ~{catalog_sizes[1] / saved_gz:.1f} gzipped predictions"
+        )
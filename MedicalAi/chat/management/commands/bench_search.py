@@ -0,0 +1,124 @@
+"""
+Compare server-side conversation search with the client-side localStorage scan.
+
+Creates a throw-away user with N conversations inside a transaction that is
+rolled back at the end, then measures:
+  * server: chat.search.search_conversations latency per query and response size
+  * client: bytes of full history the browser has to download and cache, plus
+    the cost of what search.js does on every keystroke (JSON.parse of the whole
+    blob and a lowercase substring test over every title and message),
+    reproduced in Python.
+
+    python manage.py bench_search --conversations 10000
+"""
+import json
+import random
+import statistics
+import time
+
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from rest_framework.renderers import JSONRenderer
+
+from chat.models import Conversation, Message
+from chat.search import search_conversations
+from chat.serializers import ConversationSerializer
+from chat.utils import load_symptom_cases
+
+
+class Rollback(Exception):
+    pass
+
+
+def _percentiles(timings):
+    timings = sorted(timings)
+    return statistics.median(timings) * 1000, timings[int(0.95 * (len(timings) - 1))] * 1000
+
+
+class Command(BaseCommand):
+    help = "Benchmark server-side full-text search against the client-side localStorage scan."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--conversations', type=int, default=10000)
+        parser.add_argument('--messages', type=int, default=4, help="Messages per conversation")
+        parser.add_argument('--queries', type=int, default=50)
+        parser.add_argument('--seed', type=int, default=42)
+
+    def handle(self, *args, **options):
+        try:
+            with transaction.atomic():
+                self.run(options)
+                raise Rollback
+        except Rollback:
+            pass
+
+    def run(self, options):
+        rng = random.Random(options['seed'])
+        cases = load_symptom_cases()
+        user = User.objects.create_user(username=f"bench-search-{rng.getrandbits(32)}")
+
+        start = time.perf_counter()
+        conversations = Conversation.objects.bulk_create(
+            Conversation(user=user, title=rng.choice(cases)[1][:50]) for _ in range(options['conversations'])
+        )
+        messages = []
+        for conversation in conversations:
+            for i in range(options['messages']):
+                label, text = rng.choice(cases)
+                # Alternate user messages and stored AI prediction payloads, as PredictView does
+                messages.append(Message(
+                    conversation=conversation,
+                    is_user=i % 2 == 0,
+                    text=text if i % 2 == 0 else json.dumps({'predictions': [{'name': label, 'confidence': 91.2}]}),
+                ))
+        Message.objects.bulk_create(messages, batch_size=5000)
+        self.stdout.write(
+            f"Created {len(conversations)} conversations / {len(messages)} messages "
+            f"in {time.perf_counter() - start:.1f}s (index maintained by triggers)"
+        )
+
+        words = [w for _, text in cases for w in text.lower().split() if len(w) > 4 and w.isalpha()]
+        queries = [rng.choice(words) for _ in range(options['queries'])]
+
+        # Server-side: one indexed query per search request
+        renderer = JSONRenderer()
+        timings, sizes = [], []
+        for query in queries:
+            t0 = time.perf_counter()
+            total, hits = search_conversations(user, query, page=1, page_size=20)
+            body = renderer.render({'query': query, 'count': total, 'results': hits})
+            timings.append(time.perf_counter() - t0)
+            sizes.append(len(body))
+        server_p50, server_p95 = _percentiles(timings)
+
+        # Client-side: the full history the browser must hold, scanned per keystroke
+        t0 = time.perf_counter()
+        history = ConversationSerializer(
+            Conversation.objects.filter(user=user).prefetch_related('messages'), many=True
+        ).data
+        blob = renderer.render(history)
+        export_seconds = time.perf_counter() - t0
+
+        timings = []
+        for query in queries:
+            t0 = time.perf_counter()
+            q = query.lower()
+            matches = [
+                c for c in json.loads(blob)
+                if q in (c['title'] or '').lower() or any(q in m['text'].lower() for m in c['messages'])
+            ]
+            timings.append(time.perf_counter() - t0)
+        client_p50, client_p95 = _percentiles(timings)
+
+        self.stdout.write(f"\n{'':<28}{'p50 ms':>10}{'p95 ms':>10}{'bytes':>14}")
+        self.stdout.write(
+            f"{'server FTS (per request)':<28}{server_p50:>10.1f}{server_p95:>10.1f}{int(statistics.mean(sizes)):>14,}"
+        )
+        self.stdout.write(
+            f"{'client scan (per keystroke)':<28}{client_p50:>10.1f}{client_p95:>10.1f}{len(blob):>14,}"
+        )
+        self.stdout.write(
+            f"\nClient also needs the full history download first ({len(blob):,} bytes, "
+            f"{export_seconds:.1f}s to serialize on the server); last scan matched {len(matches)} conversations."
+        )
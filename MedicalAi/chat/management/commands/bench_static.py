@@ -0,0 +1,89 @@
+"""
+First-load and repeat-load static transfer for the UI pages.
+
+Builds the assets with collectstatic into a temporary STATIC_ROOT, then for
+each page compares
+  * before: the individual source files as the page referenced them (no
+    minification or compression, no Cache-Control, so a repeat visit
+    revalidates every file)
+  * after: what StaticAssetMiddleware serves for the built page with
+    Accept-Encoding: br, gzip; on a repeat visit immutable files are not
+    requested at all and the rest are revalidated (304, no body).
+Every /static/ URL the page mentions is counted, including the JSON files its
+scripts fetch. Sizes are response bodies only; CDN assets (Tailwind, jQuery)
+are excluded.
+
+    python manage.py bench_static
+"""
+import re
+import tempfile
+
+from django.contrib.staticfiles import finders
+from django.core.management import call_command
+from django.core.management.base import BaseCommand
+from django.test import Client, override_settings
+from django.test.utils import setup_test_environment
+
+STATIC_REF = re.compile(r'"(/static/[^"]+)"')
+
+
+def _body(response):
+    if response.streaming:
+        return b''.join(response.streaming_content)
+    return response.content
+
+
+class Command(BaseCommand):
+    help = "Report first-load and repeat-load static transfer sizes before and after the asset pipeline."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--pages', nargs='+', default=['/chat/chat/', '/chat/welcome/', '/chat/faq/'])
+
+    def handle(self, *args, **options):
+        setup_test_environment()
+        with tempfile.TemporaryDirectory() as root:
+            with override_settings(STATIC_ROOT=root, DEBUG=False, ALLOWED_HOSTS=['testserver']):
+                call_command('collectstatic', interactive=False, verbosity=0)
+                after = {page: self.measure_built(page) for page in options['pages']}
+            with override_settings(DEBUG=True, ALLOWED_HOSTS=['testserver']):
+                before = {page: self.measure_sources(page) for page in options['pages']}
+
+        self.stdout.write(
+            f"\n{'page':<16}{'':<8}{'files':>6}{'first load':>13}{'repeat reqs':>13}{'repeat bytes':>14}"
+        )
+        for page in options['pages']:
+            for label, (files, first, repeat_requests, repeat_bytes) in (('before', before[page]), ('after', after[page])):
+                self.stdout.write(
+                    f"{page:<16}{label:<8}{files:>6}{first:>13,}{repeat_requests:>13}{repeat_bytes:>14,}"
+                )
+
+    def static_refs(self, page):
+        html = _body(Client().get(page)).decode('utf-8')
+        return list(dict.fromkeys(STATIC_REF.findall(html)))
+
+    def measure_sources(self, page):
+        """Raw source files; every one is revalidated on a repeat visit."""
+        files, first = 0, 0
+        for url in self.static_refs(page):
+            path = finders.find(url[len('/static/'):])
+            if path:
+                files += 1
+                with open(path, 'rb') as f:
+                    first += len(f.read())
+        return files, first, files, 0
+
+    def measure_built(self, page):
+        client = Client(HTTP_ACCEPT_ENCODING='br, gzip')
+        files, first, repeat_requests, repeat_bytes = 0, 0, 0, 0
+        for url in self.static_refs(page):
+            response = client.get(url)
+            if response.status_code != 200:
+                continue
+            files += 1
+            first += len(_body(response))
+            if 'immutable' in response.get('Cache-Control', ''):
+                continue
+            repeat = client.get(url, HTTP_IF_MODIFIED_SINCE=response['Last-Modified'])
+            repeat_requests += 1
+            repeat_bytes += len(_body(repeat))
+        return files, first, repeat_requests, repeat_bytes
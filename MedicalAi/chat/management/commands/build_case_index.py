@@ -0,0 +1,80 @@
+"""
+Build the similar-case index PredictView answers `"similar": true` from.
+
+Embeds the dataset texts with the served model (same pooling as the
+prediction pass), writes the memory-mapped index to SIMILAR_CASES['INDEX_DIR']
+and reports what retrieval adds to a prediction: the search time, and the
+cost of the embedding-returning forward pass over the plain pipeline call.
+
+    python manage.py build_case_index
+    python manage.py build_case_index --dataset Symptom2Disease.csv --ivf-min-cases 0
+"""
+import statistics
+import time
+
+import numpy as np
+from django.conf import settings
+from django.core.management.base import BaseCommand
+
+from chat.inference import apply_cpu_settings, forward, load_classifier
+from chat.similar import CaseIndex, model_fingerprint, write_index
+from chat.utils import load_symptom_cases
+
+
+def _p50_ms(fn, repeat):
+    timings = []
+    for _ in range(repeat):
+        t0 = time.perf_counter()
+        fn()
+        timings.append(time.perf_counter() - t0)
+    return statistics.median(timings) * 1000
+
+
+class Command(BaseCommand):
+    help = "Embed the training dataset with the served model and write the similar-case index."
+
+    def add_arguments(self, parser):
+        conf = settings.SIMILAR_CASES
+        parser.add_argument('--dataset', default='AugmentedSymptom2Disease.csv')
+        parser.add_argument('--output', default=conf['INDEX_DIR'])
+        parser.add_argument('--batch-size', type=int, default=32)
+        parser.add_argument('--ivf-min-cases', type=int, default=conf.get('IVF_MIN_CASES', 50000),
+                            help="Build an IVF index from this many cases on (0 = always)")
+        parser.add_argument('--nlist', type=int, default=None, help="IVF lists (default 4 * sqrt(cases))")
+        parser.add_argument('--repeat', type=int, default=50, help="Queries timed for the latency report")
+
+    def handle(self, *args, **options):
+        apply_cpu_settings()
+        model_dir = settings.INFERENCE['MODEL_DIR']
+        classifier = load_classifier(model_dir)
+        cases = load_symptom_cases(options['dataset'])
+        texts = [text for _, text in cases]
+
+        start = time.perf_counter()
+        batches = []
+        for i in range(0, len(texts), options['batch_size']):
+            batches.append(forward(classifier, texts[i:i + options['batch_size']])[1])
+        embeddings = np.concatenate(batches)
+        self.stdout.write(f"Embedded {len(texts)} cases in {time.perf_counter() - start:.1f}s")
+
+        meta = write_index(
+            options['output'], embeddings, cases, model_fingerprint(model_dir),
+            ivf_min_cases=options['ivf_min_cases'], nlist=options['nlist'],
+        )
+        self.stdout.write(self.style.SUCCESS(
+            f"Wrote {meta['kind']} index of {meta['count']} x {meta['dim']} to {options['output']}"
+        ))
+
+        # Added latency: search over the mmapped index, and the forward pass vs the pipeline
+        index = CaseIndex.load(options['output'], nprobe=settings.SIMILAR_CASES.get('NPROBE', 16))
+        k = settings.SIMILAR_CASES.get('TOP_K', 5)
+        queries = iter(np.resize(embeddings, (options['repeat'] * 2 + 1, embeddings.shape[1])))
+        search_ms = _p50_ms(lambda: index.search(next(queries), k), options['repeat'])
+        text = texts[0]
+        classifier(text, truncation=True)  # warm-up
+        pipeline_ms = _p50_ms(lambda: classifier(text, truncation=True), options['repeat'])
+        forward_ms = _p50_ms(lambda: forward(classifier, [text]), options['repeat'])
+        self.stdout.write(
+            f"p50 per prediction: pipeline {pipeline_ms:.2f} ms, forward with embedding {forward_ms:.2f} ms, "
+            f"search top-{k} {search_ms:.2f} ms"
+        )
@@ -0,0 +1,503 @@
+"""
+End-to-end load test: simulated chat sessions against a running server.
+
+Every virtual user goes through what chat.js does in a session:
+register/ -> login/ -> a loop of chat/predict/ with symptom texts sampled
+from Dataset/. The loop is interleaved with conversations/ list and detail
+fetches and an occasional conversations/delete_all/. Users start following a
+ramp profile and wait an exponentially distributed think time between
+requests (0 = as fast as possible). Each user holds one keep-alive
+connection.
+
+    constant  all users start at once
+    linear    users start evenly over --ramp-time
+    step      users start in --steps equal batches over --ramp-time
+
+The report has per-endpoint throughput, latency percentiles, error rates
+and status codes, plus requests/s and active users per second. It is
+written as JSON and HTML to --output-dir. Pass an earlier JSON report to
+--compare to print the change per endpoint and add it to the HTML.
+
+    python manage.py runserver --noreload   # or gunicorn, in another shell
+    python manage.py loadtest --users 20 --ramp linear --ramp-time 30 --duration 120 --label before
+    python manage.py loadtest --users 20 --ramp linear --ramp-time 30 --duration 120 --label after \\
+        --compare ../.cache/loadtest/before.json
+
+The client runs in this process's threads. When the server is on the same
+machine, the client competes with it for CPU, so compare runs that used
+the same settings.
+"""
+import html
+import http.client
+import json
+import math
+import os
+import random
+import threading
+import time
+from datetime import datetime
+from urllib.parse import urlsplit
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+
+from chat.utils import load_symptom_cases
+
+ENDPOINTS = ('register', 'login', 'predict', 'conversations', 'conversation', 'delete_all')
+
+# Relative weights of the actions a logged-in user picks between
+DEFAULT_MIX = 'predict=6,conversations=2,conversation=2,delete_all=0.2'
+
+
+def _percentile(values, q):
+    if not values:
+        return None
+    return values[int(q * (len(values) - 1))]
+
+
+def parse_mix(value):
+    mix = {}
+    for part in value.split(','):
+        name, _, weight = part.partition('=')
+        name = name.strip()
+        if name not in ('predict', 'conversations', 'conversation', 'delete_all'):
+            raise CommandError(f"Unknown action in --mix: {name!r}")
+        try:
+            mix[name] = float(weight)
+        except ValueError:
+            raise CommandError(f"Bad weight for {name!r} in --mix: {weight!r} (expected e.g. {name}=2)")
+        if mix[name] < 0:
+            raise CommandError(f"Negative weight for {name!r} in --mix")
+    if not mix.get('predict'):
+        raise CommandError("--mix needs a positive predict weight")
+    return mix
+
+
+def start_offset(i, users, ramp, ramp_time, steps):
+    """Seconds after the start of the run at which user `i` (of `users`) starts."""
+    if ramp == 'linear':
+        return ramp_time * i / users
+    if ramp == 'step':
+        return ramp_time * (i * steps // users) / steps
+    return 0.0
+
+
+class Recorder:
+    """Samples of every request: (endpoint, start offset s, latency ms, HTTP status or 0)."""
+
+    def __init__(self):
+        self.started = time.perf_counter()
+        self.samples = []
+        self.sessions = []  # (start offset, end offset) of each user
+        self._lock = threading.Lock()
+
+    def now(self):
+        return time.perf_counter() - self.started
+
+    def add(self, endpoint, started, latency_ms, status):
+        with self._lock:
+            self.samples.append((endpoint, started, latency_ms, status))
+
+    def add_session(self, started, ended):
+        with self._lock:
+            self.sessions.append((started, ended))
+
+
+class Session:
+    """One virtual user with its own connection, token and current conversation."""
+
+    def __init__(self, base_url, cases, recorder, rng, timeout):
+        parts = urlsplit(base_url)
+        self.connection_class = http.client.HTTPSConnection if parts.scheme == 'https' else http.client.HTTPConnection
+        self.host, self.port = parts.hostname, parts.port
+        self.prefix = parts.path.rstrip('/')
+        self.cases = cases
+        self.recorder = recorder
+        self.rng = rng
+        self.timeout = timeout
+        self.conn = None
+        self.token = None
+        self.conversation_id = None
+
+    def request(self, endpoint, method, path, body=None):
+        """Send one request and record it; returns (status, parsed JSON or None). Status 0 = no response."""
+        headers = {'Accept': 'application/json'}
+        if body is not None:
+            body = json.dumps(body)
+            headers['Content-Type'] = 'application/json'
+        if self.token:
+            headers['Authorization'] = f'Token {self.token}'
+        started = self.recorder.now()
+        t0 = time.perf_counter()
+        status, data, payload = 0, None, b''
+        try:
+            if self.conn is None:
+                self.conn = self.connection_class(self.host, self.port, timeout=self.timeout)
+            self.conn.request(method, self.prefix + path, body=body, headers=headers)
+            response = self.conn.getresponse()
+            payload = response.read()
+            status = response.status
+            if response.will_close:
+                self.close()
+        except (OSError, http.client.HTTPException):
+            self.close()
+        latency_ms = (time.perf_counter() - t0) * 1000
+        self.recorder.add(endpoint, started, latency_ms, status)
+        if status and payload:
+            try:
+                data = json.loads(payload)
+            except ValueError:
+                pass
+        return status, data
+
+    def close(self):
+        if self.conn is not None:
+            self.conn.close()
+            self.conn = None
+
+    def login(self, username, password):
+        self.request('register', 'POST', '/api/register/', {'username': username, 'password': password})
+        # Log in even if registering failed (e.g. the user exists from an earlier run)
+        status, data = self.request('login', 'POST', '/api/login/', {'username': username, 'password': password})
+        if status == 200 and data:
+            self.token = data.get('token')
+        return self.token is not None
+
+    def predict(self):
+        _, text = self.rng.choice(self.cases)
+        body = {'message': text}
+        if self.conversation_id:
+            body['conversation_id'] = self.conversation_id
+        status, data = self.request('predict', 'POST', '/api/chat/predict/', body)
+        if status == 200 and data and data.get('conversation_id'):
+            self.conversation_id = data['conversation_id']
+
+    def open_conversation(self):
+        # With no current conversation, pick one from the sidebar list like the chat page
+        # does, rather than sending some other request in place of this action
+        if not self.conversation_id:
+            status, data = self.request('conversations', 'GET', '/api/conversations/')
+            if isinstance(data, dict):
+                data = data.get('results')
+            if status != 200 or not data:
+                return
+            self.conversation_id = str(data[0]['id'])
+        self.request('conversation', 'GET', f'/api/conversations/{self.conversation_id}/')
+
+    def act(self, action, new_conversation):
+        if action == 'conversations':
+            self.request('conversations', 'GET', '/api/conversations/')
+        elif action == 'conversation':
+            self.open_conversation()
+        elif action == 'delete_all':
+            self.request('delete_all', 'POST', '/api/conversations/delete_all/')
+            self.conversation_id = None
+        else:
+            if self.rng.random() < new_conversation:
+                self.conversation_id = None
+            self.predict()
+
+
+def run_session(session, username, password, start_at, deadline, mix, think_time, new_conversation):
+    recorder = session.recorder
+    delay = start_at - recorder.now()
+    if delay > 0:
+        time.sleep(delay)
+    began = recorder.now()
+    actions, weights = list(mix), list(mix.values())
+    try:
+        if not session.login(username, password):
+            return
+        # Every session starts the way the chat page does: one prediction
+        session.predict()
+        while recorder.now() < deadline:
+            if think_time:
+                time.sleep(min(session.rng.expovariate(1 / think_time), max(0.0, deadline - recorder.now())))
+                if recorder.now() >= deadline:
+                    break
+            session.act(session.rng.choices(actions, weights)[0], new_conversation)
+    finally:
+        session.close()
+        recorder.add_session(began, recorder.now())
+
+
+def summarise(recorder, duration):
+    """Per-endpoint statistics and a per-second timeline of the recorded samples."""
+    by_endpoint = {}
+    for endpoint, _, latency_ms, status in recorder.samples:
+        by_endpoint.setdefault(endpoint, []).append((latency_ms, status))
+
+    endpoints = {}
+    for endpoint in ENDPOINTS + tuple(sorted(set(by_endpoint) - set(ENDPOINTS))):
+        samples = by_endpoint.get(endpoint)
+        if not samples:
+            continue
+        latencies = sorted(latency for latency, _ in samples)
+        statuses = {}
+        for _, status in samples:
+            statuses[str(status)] = statuses.get(str(status), 0) + 1
+        errors = sum(1 for _, status in samples if not 200 <= status < 400)
+        endpoints[endpoint] = {
+            'requests': len(samples),
+            'errors': errors,
+            'error_rate': round(errors / len(samples), 4),
+            'rps': round(len(samples) / duration, 2),
+            'mean_ms': round(sum(latencies) / len(latencies), 1),
+            'p50_ms': round(_percentile(latencies, 0.5), 1),
+            'p90_ms': round(_percentile(latencies, 0.9), 1),
+            'p95_ms': round(_percentile(latencies, 0.95), 1),
+            'p99_ms': round(_percentile(latencies, 0.99), 1),
+            'max_ms': round(latencies[-1], 1),
+            'status_codes': dict(sorted(statuses.items())),
+        }
+
+    seconds = max(1, math.ceil(duration))
+    timeline = [{'second': s, 'requests': 0, 'errors': 0, 'active_users': 0} for s in range(seconds)]
+    for _, started, _, status in recorder.samples:
+        bucket = timeline[min(int(started), seconds - 1)]
+        bucket['requests'] += 1
+        bucket['errors'] += not 200 <= status < 400
+    for began, ended in recorder.sessions:
+        for s in range(int(began), min(seconds, int(ended) + 1)):
+            timeline[s]['active_users'] += 1
+
+    total = len(recorder.samples)
+    errors = sum(e['errors'] for e in endpoints.values())
+    overall = {
+        'requests': total,
+        'errors': errors,
+        'error_rate': round(errors / total, 4) if total else None,
+        'rps': round(total / duration, 2),
+        'sessions': len(recorder.sessions),
+    }
+    return overall, endpoints, timeline
+
+
+def compare(report, baseline):
+    """Per-endpoint change from `baseline` (an earlier report) for rps, p50, p95 and error rate."""
+    rows = {}
+    for endpoint, stats in report['endpoints'].items():
+        before = baseline['endpoints'].get(endpoint)
+        if before is None:
+            continue
+        row = {}
+        for key in ('rps', 'p50_ms', 'p95_ms', 'p99_ms', 'error_rate'):
+            old, new = before.get(key), stats.get(key)
+            change = None if not old or new is None else round((new - old) / old, 4)
+            row[key] = {'before': old, 'after': new, 'change': change}
+        rows[endpoint] = row
+    return {'label': baseline.get('config', {}).get('label'), 'endpoints': rows}
+
+
+def render_html(report):
+    config, overall = report['config'], report['overall']
+    esc = html.escape
+
+    def cell(value, fmt='{}'):
+        return '<td>-</td>' if value is None else f'<td>{esc(fmt.format(value))}</td>'
+
+    endpoint_rows = ''.join(
+        f"<tr><th>{esc(name)}</th>{cell(s['requests'])}{cell(s['rps'], '{:.2f}')}"
+        f"{cell(s['error_rate'], '{:.2%}')}{cell(s['p50_ms'], '{:.1f}')}{cell(s['p90_ms'], '{:.1f}')}"
+        f"{cell(s['p95_ms'], '{:.1f}')}{cell(s['p99_ms'], '{:.1f}')}{cell(s['max_ms'], '{:.1f}')}"
+        f"<td>{esc(', '.join(f'{code}: {n}' for code, n in s['status_codes'].items()))}</td></tr>"
+        for name, s in report['endpoints'].items()
+    )
+
+    comparison = ''
+    if report.get('comparison'):
+        def delta(value, worse_if_higher):
+            change = value['change']
+            if change is None:
+                return cell(value['after'])
+            worse = change > 0.1 if worse_if_higher else change < -0.1
+            return (
+                f"<td class=\"{'worse' if worse else ''}\">{esc(str(value['before']))} &rarr; "
+                f"{esc(str(value['after']))} ({change:+.1%})</td>"
+            )
+
+        rows = ''.join(
+            f"<tr><th>{esc(name)}</th>{delta(row['rps'], False)}{delta(row['p50_ms'], True)}"
+            f"{delta(row['p95_ms'], True)}{delta(row['p99_ms'], True)}{delta(row['error_rate'], True)}</tr>"
+            for name, row in report['comparison']['endpoints'].items()
+        )
+        comparison = (
+            f"<h2>Compared with {esc(str(report['comparison']['label'] or 'baseline'))}</h2>"
+            "<table><tr><th>endpoint</th><th>req/s</th><th>p50 ms</th><th>p95 ms</th><th>p99 ms</th>"
+            f"<th>error rate</th></tr>{rows}</table>"
+        )
+
+    # Requests/s (bars) and active users (line) per second
+    timeline = report['timeline']
+    width, height = 800, 200
+    peak = max([t['requests'] for t in timeline] + [1])
+    peak_users = max([t['active_users'] for t in timeline] + [1])
+    step = width / len(timeline)
+    bars = ''.join(
+        f"<rect x=\"{i * step:.1f}\" y=\"{height - t['requests'] / peak * height:.1f}\" width=\"{max(step - 1, 1):.1f}\" "
+        f"height=\"{t['requests'] / peak * height:.1f}\" fill=\"{'#d9534f' if t['errors'] else '#5b9bd5'}\">"
+        f"<title>{t['second']}s: {t['requests']} requests, {t['errors']} errors, {t['active_users']} users</title></rect>"
+        for i, t in enumerate(timeline)
+    )
+    users = ' '.join(
+        f"{(i + 0.5) * step:.1f},{height - t['active_users'] / peak_users * height:.1f}" for i, t in enumerate(timeline)
+    )
+
+    return f"""<!DOCTYPE html>
+<html><head><meta charset="utf-8"><title>Load test {esc(config['label'])}</title>
+<style>
+body {{ font-family: sans-serif; margin: 2em; }}
+table {{ border-collapse: collapse; margin-bottom: 2em; }}
+th, td {{ border: 1px solid #ccc; padding: 4px 10px; text-align: right; }}
+th:first-child {{ text-align: left; }}
+.worse {{ background: #f8d7da; }}
+</style></head><body>
+<h1>Load test {esc(config['label'])}</h1>
+<p>{esc(config['url'])}, {config['users']} users, {esc(config['ramp'])} ramp over {config['ramp_time']}s,
+{config['duration']}s, think time {config['think_time']}s, started {esc(config['started_at'])}</p>
+<p>{overall['requests']} requests, {overall['rps']:.2f} req/s, error rate
+{'-' if overall['error_rate'] is None else f"{overall['error_rate']:.2%}"}</p>
+<table><tr><th>endpoint</th><th>requests</th><th>req/s</th><th>error rate</th><th>p50 ms</th><th>p90 ms</th>
+<th>p95 ms</th><th>p99 ms</th><th>max ms</th><th>status codes</th></tr>{endpoint_rows}</table>
+{comparison}
+<h2>Requests per second (red: with errors) and active users</h2>
+<svg width="{width}" height="{height}" style="border: 1px solid #ccc">{bars}
+<polyline points="{users}" fill="none" stroke="#333" stroke-width="2"/></svg>
+</body></html>
+"""
+
+
+class Command(BaseCommand):
+    help = "Replay simulated chat sessions against a running server and report per-endpoint latency and errors."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--url', default='http://127.0.0.1:8000', help="Base URL of the server")
+        parser.add_argument('--users', type=int, default=10, help="Concurrent virtual users")
+        parser.add_argument('--ramp', choices=('constant', 'linear', 'step'), default='linear')
+        parser.add_argument('--ramp-time', type=float, default=10, help="Seconds until all users have started")
+        parser.add_argument('--steps', type=int, default=4, help="Batches for --ramp step")
+        parser.add_argument('--duration', type=float, default=60, help="Seconds of the whole run, ramp included")
+        parser.add_argument('--think-time', type=float, default=1.0, help="Mean pause between requests (s)")
+        parser.add_argument('--mix', default=DEFAULT_MIX, help="Relative weights of the actions")
+        parser.add_argument('--new-conversation', type=float, default=0.2,
+                            help="Probability that a prediction starts a new conversation")
+        parser.add_argument('--dataset', default='AugmentedSymptom2Disease.csv')
+        parser.add_argument('--timeout', type=float, default=30)
+        parser.add_argument('--seed', type=int, default=42)
+        parser.add_argument('--label', default=None, help="Name of this run (default: its start time)")
+        parser.add_argument('--output-dir', default=os.path.join(settings.BASE_DIR.parent, '.cache', 'loadtest'))
+        parser.add_argument('--compare', default=None, help="Earlier JSON report to compare with")
+
+    def handle(self, *args, **options):
+        if options['users'] < 1 or options['duration'] <= 0:
+            raise CommandError("--users and --duration must be positive")
+        mix = parse_mix(options['mix'])
+        baseline = None
+        if options['compare']:
+            with open(options['compare'], encoding='utf-8') as f:
+                baseline = json.load(f)
+
+        started_at = datetime.now()
+        label = options['label'] or started_at.strftime('%Y%m%d-%H%M%S')
+        cases = load_symptom_cases(options['dataset'])
+        run_rng = random.Random(options['seed'])
+        # Unique per run, so repeated runs against the same database register new users
+        run_id = f"{started_at:%Y%m%d%H%M%S}-{run_rng.getrandbits(16):04x}"
+
+        recorder = Recorder()
+        deadline = options['duration']
+        threads = []
+        for i in range(options['users']):
+            session = Session(options['url'], cases, recorder, random.Random(f"{options['seed']}-{i}"), options['timeout'])
+            thread = threading.Thread(
+                target=run_session,
+                args=(
+                    session, f"loadtest-{run_id}-{i}", f"lt-{run_rng.getrandbits(64):016x}",
+                    start_offset(i, options['users'], options['ramp'], options['ramp_time'], options['steps']),
+                    deadline, mix, options['think_time'], options['new_conversation'],
+                ),
+                name=f'loadtest-user-{i}',
+                daemon=True,
+            )
+            threads.append(thread)
+
+        self.stdout.write(
+            f"🚀 {options['users']} users against {options['url']} for {options['duration']:.0f}s "
+            f"({options['ramp']} ramp over {options['ramp_time']:.0f}s)"
+        )
+        recorder.started = time.perf_counter()
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        duration = max(recorder.now(), 1e-9)
+
+        overall, endpoints, timeline = summarise(recorder, duration)
+        report = {
+            'config': {
+                'label': label,
+                'url': options['url'],
+                'started_at': started_at.isoformat(timespec='seconds'),
+                'users': options['users'],
+                'ramp': options['ramp'],
+                'ramp_time': options['ramp_time'],
+                'steps': options['steps'],
+                'duration': options['duration'],
+                'think_time': options['think_time'],
+                'mix': mix,
+                'new_conversation': options['new_conversation'],
+                'dataset': options['dataset'],
+                'seed': options['seed'],
+            },
+            'elapsed': round(duration, 2),
+            'overall': overall,
+            'endpoints': endpoints,
+            'timeline': timeline,
+        }
+        if baseline is not None:
+            report['comparison'] = compare(report, baseline)
+
+        os.makedirs(options['output_dir'], exist_ok=True)
+        path = os.path.join(options['output_dir'], label)
+        with open(f"{path}.json", 'w', encoding='utf-8') as f:
+            json.dump(report, f, indent=2)
+        with open(f"{path}.html", 'w', encoding='utf-8') as f:
+            f.write(render_html(report))
+
+        self.print_report(report)
+        self.stdout.write(f"\n📄 Saved {path}.json and {path}.html")
+
+    def print_report(self, report):
+        def ms(value):
+            return '-' if value is None else f"{value:.1f}"
+
+        overall = report['overall']
+        self.stdout.write(
+            f"\n{overall['requests']} requests in {report['elapsed']:.1f}s ({overall['rps']:.2f} req/s), "
+            f"{overall['errors']} errors, {overall['sessions']} sessions"
+        )
+        self.stdout.write(
+            f"\n{'endpoint':<14}{'requests':>9}{'req/s':>8}{'errors':>8}{'p50 ms':>9}{'p95 ms':>9}{'p99 ms':>9}"
+            f"{'max ms':>9}  status codes"
+        )
+        for name, s in report['endpoints'].items():
+            codes = ' '.join(f"{code}:{n}" for code, n in s['status_codes'].items())
+            self.stdout.write(
+                f"{name:<14}{s['requests']:>9}{s['rps']:>8.2f}{s['error_rate']:>8.1%}{ms(s['p50_ms']):>9}"
+                f"{ms(s['p95_ms']):>9}{ms(s['p99_ms']):>9}{ms(s['max_ms']):>9}  {codes}"
+            )
+
+        comparison = report.get('comparison')
+        if not comparison:
+            return
+
+        def change(value):
+            return '-' if value['change'] is None else f"{value['change']:+.1%}"
+
+        self.stdout.write(f"\nChange from {comparison['label'] or 'baseline'}:")
+        self.stdout.write(f"{'endpoint':<14}{'req/s':>9}{'p50':>9}{'p95':>9}{'p99':>9}{'errors':>9}")
+        for name, row in comparison['endpoints'].items():
+            self.stdout.write(
+                f"{name:<14}{change(row['rps']):>9}{change(row['p50_ms']):>9}{change(row['p95_ms']):>9}"
+                f"{change(row['p99_ms']):>9}{change(row['error_rate']):>9}"
+            )
@@ -0,0 +1,105 @@
+"""
+Summarise the shadow evaluation store written by chat/shadow.py.
+
+Per shadow model: inputs scored, top-1 agreement with the primary, mean
+top-k overlap, p50/p95 latency next to the primary's on the same inputs,
+and errors.
+
+    python manage.py shadow_report
+    python manage.py shadow_report --since 24 --json
+"""
+import json
+import os
+import sqlite3
+import time
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+
+
+def _percentile(values, q):
+    if not values:
+        return None
+    values = sorted(values)
+    return values[int(q * (len(values) - 1))]
+
+
+def summarise(conn, since=None):
+    where, params = '', ()
+    if since is not None:
+        where, params = 'WHERE created_at >= ?', (since,)
+    rows = conn.execute(
+        f"SELECT shadow_model, primary_model, agree, overlap, primary_ms, shadow_ms, error "
+        f"FROM shadow_results {where} ORDER BY shadow_model", params
+    ).fetchall()
+
+    models = {}
+    for shadow_model, primary_model, agree, overlap, primary_ms, shadow_ms, error in rows:
+        stats = models.setdefault(shadow_model, {
+            'scored': 0, 'errors': 0, 'agree': 0, 'overlap': 0.0,
+            'primary_ms': [], 'shadow_ms': [], 'primary_models': set(),
+        })
+        stats['primary_models'].add(primary_model)
+        if error is not None:
+            stats['errors'] += 1
+            continue
+        stats['scored'] += 1
+        stats['agree'] += agree
+        stats['overlap'] += overlap
+        stats['primary_ms'].append(primary_ms)
+        stats['shadow_ms'].append(shadow_ms)
+
+    report = {}
+    for name, stats in models.items():
+        scored = stats['scored']
+        report[name] = {
+            'scored': scored,
+            'errors': stats['errors'],
+            'agreement': round(stats['agree'] / scored, 4) if scored else None,
+            'topk_overlap': round(stats['overlap'] / scored, 4) if scored else None,
+            'primary_p50_ms': _percentile(stats['primary_ms'], 0.5),
+            'primary_p95_ms': _percentile(stats['primary_ms'], 0.95),
+            'shadow_p50_ms': _percentile(stats['shadow_ms'], 0.5),
+            'shadow_p95_ms': _percentile(stats['shadow_ms'], 0.95),
+            'primary_models': sorted(stats['primary_models']),
+        }
+    return report
+
+
+class Command(BaseCommand):
+    help = "Report agreement, top-k overlap and latency of the shadow models against the primary."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--store', default=settings.SHADOW_MODELS['STORE'])
+        parser.add_argument('--since', type=float, default=None, help="Only the last N hours")
+        parser.add_argument('--json', action='store_true', help="Print the report as JSON")
+
+    def handle(self, *args, **options):
+        if not os.path.exists(options['store']):
+            raise CommandError(f"No shadow store at {options['store']} (is SHADOW_MODELS set?)")
+        since = time.time() - options['since'] * 3600 if options['since'] else None
+        conn = sqlite3.connect(options['store'])
+        try:
+            report = summarise(conn, since)
+        finally:
+            conn.close()
+
+        if options['json']:
+            self.stdout.write(json.dumps(report, indent=2))
+            return
+
+        def ms(value):
+            return '-' if value is None else f"{value:.1f}"
+
+        self.stdout.write(
+            f"\n{'shadow model':<24}{'scored':>8}{'errors':>8}{'agree':>8}{'overlap':>9}"
+            f"{'p50 ms':>9}{'p95 ms':>9}{'primary p50':>13}{'primary p95':>13}"
+        )
+        for name, stats in report.items():
+            agreement = '-' if stats['agreement'] is None else f"{stats['agreement']:.1%}"
+            overlap = '-' if stats['topk_overlap'] is None else f"{stats['topk_overlap']:.2f}"
+            self.stdout.write(
+                f"{name:<24}{stats['scored']:>8}{stats['errors']:>8}{agreement:>8}{overlap:>9}"
+                f"{ms(stats['shadow_p50_ms']):>9}{ms(stats['shadow_p95_ms']):>9}"
+                f"{ms(stats['primary_p50_ms']):>13}{ms(stats['primary_p95_ms']):>13}"
+            )
@@ -0,0 +1,175 @@
+"""
+Benchmark workers x intra-op threads combinations for CPU inference.
+
+Each combination starts `workers` fresh processes that pin themselves the same
+way a Gunicorn worker would (chat.inference.apply_cpu_settings), load the
+classifier and classify dataset texts as fast as they can for a fixed time.
+The combination with the highest aggregate throughput is recommended.
+
+    python manage.py tune_inference --workers 1,2,4 --threads 1,2,4 --duration 10
+"""
+import json
+import multiprocessing
+import queue
+import statistics
+import threading
+import time
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+
+from chat.inference import available_cores
+from chat.utils import load_symptom_cases
+
+
+def _int_list(value):
+    return [int(v) for v in value.split(',') if v.strip()]
+
+
+def _bench_worker(worker_id, threads, affinity, model_dir, texts, duration, barrier, results, setup_timeout):
+    """Runs in a spawned process: configure CPU, load the model, classify until time runs out."""
+    # Always report something, so the parent never waits for a worker that gave up
+    outcome = {'worker_id': worker_id, 'error': 'exited before reporting'}
+    try:
+        import django
+        django.setup()
+
+        from chat.inference import apply_cpu_settings, load_classifier
+
+        try:
+            apply_cpu_settings(intra_op_threads=threads, inter_op_threads=1, affinity=affinity, worker_id=worker_id)
+            classifier = load_classifier(model_dir)
+            classifier(texts[0])  # warm-up
+        except Exception:
+            barrier.abort()
+            raise
+
+        try:
+            barrier.wait(timeout=setup_timeout)
+        except threading.BrokenBarrierError:
+            outcome['error'] = 'another worker failed to start'
+            return
+
+        latencies = []
+        start = time.perf_counter()
+        i = 0
+        while time.perf_counter() - start < duration:
+            t0 = time.perf_counter()
+            classifier(texts[i % len(texts)])
+            latencies.append(time.perf_counter() - t0)
+            i += 1
+        outcome = {'worker_id': worker_id, 'elapsed': time.perf_counter() - start, 'latencies': latencies}
+    except Exception as e:
+        outcome['error'] = f"{type(e).__name__}: {e}"
+    finally:
+        results.put(outcome)
+
+
+def _collect(procs, results, timeout):
+    """One outcome per worker; workers that died without reporting or overran `timeout` count as errors."""
+    outcomes = []
+    deadline = time.monotonic() + timeout
+    while len(outcomes) < len(procs):
+        try:
+            outcomes.append(results.get(timeout=1.0))
+            continue
+        except queue.Empty:
+            pass
+        if any(p.is_alive() for p in procs) and time.monotonic() < deadline:
+            continue
+        # Killed hard (OOM, segfault) or hung: nothing more will arrive
+        for p in procs:
+            if p.is_alive():
+                p.terminate()
+        exit_codes = [p.exitcode for p in procs]
+        outcomes.extend(
+            {'error': f"worker exited without a result (exit codes {exit_codes})"}
+            for _ in range(len(procs) - len(outcomes))
+        )
+    return outcomes
+
+
+class Command(BaseCommand):
+    help = "Sweep Gunicorn workers x torch threads on this machine and recommend the fastest setting."
+
+    def add_arguments(self, parser):
+        cores = len(available_cores())
+        powers = [n for n in (1, 2, 4, 8, 16, 32, 64) if n <= cores]
+        default = ','.join(str(n) for n in powers)
+        parser.add_argument('--workers', default=default, help=f"Comma-separated worker counts (default: {default})")
+        parser.add_argument('--threads', default=default, help=f"Comma-separated intra-op thread counts (default: {default})")
+        parser.add_argument('--duration', type=float, default=10.0, help="Seconds to measure each combination")
+        parser.add_argument('--samples', type=int, default=200, help="Number of dataset texts to cycle through")
+        parser.add_argument('--affinity', choices=['auto', 'none'], default='auto', help="Pin workers to core blocks")
+        parser.add_argument('--oversubscribe', action='store_true', help="Also try workers x threads > cores")
+        parser.add_argument('--setup-timeout', type=float, default=300.0,
+                            help="Seconds a worker may take to load the model")
+        parser.add_argument('--model-dir', default=None, help="Model directory (default: INFERENCE['MODEL_DIR'])")
+        parser.add_argument('--json', dest='json_path', default=None, help="Write raw results to this JSON file")
+
+    def handle(self, *args, **options):
+        cores = len(available_cores())
+        model_dir = options['model_dir'] or settings.INFERENCE['MODEL_DIR']
+        affinity = '' if options['affinity'] == 'none' else 'auto'
+        texts = [text for _, text in load_symptom_cases(limit=options['samples'])]
+
+        combos = [
+            (w, t) for w in _int_list(options['workers']) for t in _int_list(options['threads'])
+            if options['oversubscribe'] or w * t <= cores
+        ]
+        if not combos:
+            raise CommandError(f"No combination fits in {cores} cores; pass --oversubscribe to run anyway.")
+
+        self.stdout.write(f"{cores} cores available, {len(combos)} combinations, {options['duration']}s each\n")
+        self.stdout.write(f"{'workers':>7} {'threads':>7} {'req/s':>9} {'p50 ms':>9} {'p95 ms':>9}")
+
+        ctx = multiprocessing.get_context('spawn')
+        rows = []
+        for workers, threads in combos:
+            barrier = ctx.Barrier(workers)
+            results = ctx.Queue()
+            procs = [
+                ctx.Process(
+                    target=_bench_worker,
+                    args=(i, threads, affinity, model_dir, texts, options['duration'], barrier, results,
+                          options['setup_timeout']),
+                )
+                for i in range(workers)
+            ]
+            for p in procs:
+                p.start()
+            outcomes = _collect(procs, results, options['setup_timeout'] + options['duration'] + 60)
+            for p in procs:
+                p.join()
+
+            errors = [o['error'] for o in outcomes if 'error' in o]
+            if errors:
+                raise CommandError(f"Benchmark worker failed: {errors[0]}")
+
+            latencies = sorted(l for o in outcomes for l in o['latencies'])
+            throughput = sum(len(o['latencies']) / o['elapsed'] for o in outcomes)
+            row = {
+                'workers': workers,
+                'threads': threads,
+                'throughput': throughput,
+                'p50_ms': statistics.median(latencies) * 1000,
+                'p95_ms': latencies[int(0.95 * (len(latencies) - 1))] * 1000,
+            }
+            rows.append(row)
+            self.stdout.write(
+                f"{workers:>7} {threads:>7} {throughput:>9.2f} {row['p50_ms']:>9.1f} {row['p95_ms']:>9.1f}"
+            )
+
+        best = max(rows, key=lambda r: r['throughput'])
+        self.stdout.write(self.style.SUCCESS(
+            f"\nRecommended: {best['workers']} workers x {best['threads']} threads "
+            f"({best['throughput']:.2f} req/s, p95 {best['p95_ms']:.1f} ms)"
+        ))
+        self.stdout.write(
+            f"  GUNICORN_WORKERS={best['workers']} INFERENCE_INTRA_OP_THREADS={best['threads']} "
+            f"INFERENCE_INTER_OP_THREADS=1" + (" INFERENCE_CPU_AFFINITY=auto" if affinity else "")
+        )
+
+        if options['json_path']:
+            with open(options['json_path'], 'w') as f:
+                json.dump({'cores': cores, 'results': rows, 'recommended': best}, f, indent=2)
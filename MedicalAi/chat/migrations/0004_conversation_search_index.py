@@ -0,0 +1,101 @@
+from django.db import migrations
+
+# SQLite: FTS5 copies of message text and conversation titles, tagged with the
+# owning user and kept in sync by triggers (ORM cascades delete row by row, so
+# the delete triggers also cover ConversationViewSet.delete_all).
+SQLITE_FORWARD = [
+    """
+    CREATE VIRTUAL TABLE IF NOT EXISTS chat_message_fts USING fts5(
+        text, conversation_id UNINDEXED, user_id UNINDEXED, tokenize = 'porter unicode61'
+    )
+    """,
+    """
+    CREATE VIRTUAL TABLE IF NOT EXISTS chat_conversation_fts USING fts5(
+        title, user_id UNINDEXED, tokenize = 'porter unicode61'
+    )
+    """,
+    """
+    CREATE TRIGGER IF NOT EXISTS chat_message_fts_insert AFTER INSERT ON chat_message BEGIN
+        INSERT INTO chat_message_fts (rowid, text, conversation_id, user_id)
+        SELECT new.id, new.text, new.conversation_id, c.user_id FROM chat_conversation c WHERE c.id = new.conversation_id;
+    END
+    """,
+    """
+    CREATE TRIGGER IF NOT EXISTS chat_message_fts_update AFTER UPDATE OF text, conversation_id ON chat_message BEGIN
+        DELETE FROM chat_message_fts WHERE rowid = old.id;
+        INSERT INTO chat_message_fts (rowid, text, conversation_id, user_id)
+        SELECT new.id, new.text, new.conversation_id, c.user_id FROM chat_conversation c WHERE c.id = new.conversation_id;
+    END
+    """,
+    """
+    CREATE TRIGGER IF NOT EXISTS chat_message_fts_delete AFTER DELETE ON chat_message BEGIN
+        DELETE FROM chat_message_fts WHERE rowid = old.id;
+    END
+    """,
+    """
+    CREATE TRIGGER IF NOT EXISTS chat_conversation_fts_insert AFTER INSERT ON chat_conversation BEGIN
+        INSERT INTO chat_conversation_fts (rowid, title, user_id) VALUES (new.id, new.title, new.user_id);
+    END
+    """,
+    """
+    CREATE TRIGGER IF NOT EXISTS chat_conversation_fts_update AFTER UPDATE OF title, user_id ON chat_conversation BEGIN
+        DELETE FROM chat_conversation_fts WHERE rowid = old.id;
+        INSERT INTO chat_conversation_fts (rowid, title, user_id) VALUES (new.id, new.title, new.user_id);
+    END
+    """,
+    """
+    CREATE TRIGGER IF NOT EXISTS chat_conversation_fts_delete AFTER DELETE ON chat_conversation BEGIN
+        DELETE FROM chat_conversation_fts WHERE rowid = old.id;
+    END
+    """,
+    # Index what is already there
+    """
+    INSERT INTO chat_message_fts (rowid, text, conversation_id, user_id)
+    SELECT m.id, m.text, m.conversation_id, c.user_id FROM chat_message m JOIN chat_conversation c ON c.id = m.conversation_id
+    """,
+    "INSERT INTO chat_conversation_fts (rowid, title, user_id) SELECT id, title, user_id FROM chat_conversation",
+]
+
+SQLITE_BACKWARD = [
+    "DROP TRIGGER IF EXISTS chat_message_fts_insert",
+    "DROP TRIGGER IF EXISTS chat_message_fts_update",
+    "DROP TRIGGER IF EXISTS chat_message_fts_delete",
+    "DROP TRIGGER IF EXISTS chat_conversation_fts_insert",
+    "DROP TRIGGER IF EXISTS chat_conversation_fts_update",
+    "DROP TRIGGER IF EXISTS chat_conversation_fts_delete",
+    "DROP TABLE IF EXISTS chat_message_fts",
+    "DROP TABLE IF EXISTS chat_conversation_fts",
+]
+
+# PostgreSQL: expression GIN indexes match the to_tsvector() calls in
+# chat/search.py, so there is no extra column to keep in sync.
+POSTGRES_FORWARD = [
+    "CREATE INDEX IF NOT EXISTS chat_message_text_fts ON chat_message USING gin (to_tsvector('english', text))",
+    "CREATE INDEX IF NOT EXISTS chat_conversation_title_fts ON chat_conversation USING gin (to_tsvector('english', title))",
+]
+
+POSTGRES_BACKWARD = [
+    "DROP INDEX IF EXISTS chat_message_text_fts",
+    "DROP INDEX IF EXISTS chat_conversation_title_fts",
+]
+
+
+def _run(statements_by_vendor):
+    def run(apps, schema_editor):
+        for statement in statements_by_vendor.get(schema_editor.connection.vendor, []):
+            schema_editor.execute(statement)
+    return run
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('chat', '0003_rename_timestamp_message_created_at'),
+    ]
+
+    operations = [
+        migrations.RunPython(
+            _run({'sqlite': SQLITE_FORWARD, 'postgresql': POSTGRES_FORWARD}),
+            _run({'sqlite': SQLITE_BACKWARD, 'postgresql': POSTGRES_BACKWARD}),
+        ),
+    ]
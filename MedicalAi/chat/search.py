@@ -0,0 +1,175 @@
+# chat/search.py
+"""
+Full-text search over a user's conversations and messages.
+
+SQLite uses the FTS5 tables created in migration 0004 (kept in sync by
+triggers); PostgreSQL uses to_tsvector/ts_rank against the GIN index created
+by the same migration. Other databases fall back to a case-insensitive scan.
+Hits are grouped per conversation (best-matching message or title), ranked,
+paginated and returned with an HTML-escaped snippet in which the matched
+terms are wrapped in <mark>.
+"""
+import html
+import re
+
+from django.db import connection
+
+from .models import Conversation, Message
+
+# Private-use characters as highlight markers, swapped for <mark> after escaping
+MARK_START = '\ue000'
+MARK_END = '\ue001'
+
+SNIPPET_TOKENS = 12
+# Title matches count for more than a match somewhere in a long message
+TITLE_WEIGHT = 2.0
+
+
+def query_terms(query):
+    return re.findall(r'\w+', query.lower())
+
+
+def render_snippet(snippet):
+    """Escape stored text for HTML and turn the markers into <mark> tags."""
+    return (
+        html.escape(snippet or '')
+        .replace(MARK_START, '<mark>')
+        .replace(MARK_END, '</mark>')
+    )
+
+
+def _fts5_query(terms):
+    # Quote every term so user input can't inject FTS5 syntax; the last term is
+    # a prefix match so results update while the user is still typing.
+    quoted = [f'"{t}"' for t in terms]
+    quoted[-1] += '*'
+    return ' '.join(quoted)
+
+
+SQLITE_SEARCH_SQL = f"""
+WITH hits AS (
+    SELECT conversation_id, rowid AS message_id, bm25(chat_message_fts) AS score,
+           snippet(chat_message_fts, 0, '{MARK_START}', '{MARK_END}', '…', {SNIPPET_TOKENS}) AS snippet
+    FROM chat_message_fts
+    WHERE chat_message_fts MATCH %s AND user_id = %s
+    UNION ALL
+    SELECT rowid AS conversation_id, NULL AS message_id, bm25(chat_conversation_fts) * {TITLE_WEIGHT} AS score,
+           highlight(chat_conversation_fts, 0, '{MARK_START}', '{MARK_END}') AS snippet
+    FROM chat_conversation_fts
+    WHERE chat_conversation_fts MATCH %s AND user_id = %s
+),
+best AS (
+    SELECT *, row_number() OVER (PARTITION BY conversation_id ORDER BY score) AS rn FROM hits
+)
+SELECT conversation_id, message_id, score, snippet, count(*) OVER () AS total
+FROM best WHERE rn = 1
+ORDER BY score, conversation_id DESC
+LIMIT %s OFFSET %s
+"""
+
+
+def _search_sqlite(user, terms, limit, offset):
+    match = _fts5_query(terms)
+    with connection.cursor() as cursor:
+        cursor.execute(SQLITE_SEARCH_SQL, [match, user.id, match, user.id, limit, offset])
+        rows = cursor.fetchall()
+    total = rows[0][4] if rows else 0
+    # bm25() is lower-is-better; expose a higher-is-better score
+    return total, [(conv_id, msg_id, -score, snippet) for conv_id, msg_id, score, snippet, _ in rows]
+
+
+POSTGRES_SEARCH_SQL = f"""
+WITH q AS (SELECT to_tsquery('english', %s) AS query),
+hits AS (
+    SELECT m.conversation_id, m.id AS message_id,
+           ts_rank(to_tsvector('english', m.text), q.query) AS score,
+           ts_headline('english', m.text, q.query,
+                       'StartSel={MARK_START}, StopSel={MARK_END}, MaxWords=20, MinWords=8') AS snippet
+    FROM chat_message m JOIN chat_conversation c ON c.id = m.conversation_id, q
+    WHERE c.user_id = %s AND to_tsvector('english', m.text) @@ q.query
+    UNION ALL
+    SELECT c.id, NULL, ts_rank(to_tsvector('english', c.title), q.query) * {TITLE_WEIGHT},
+           ts_headline('english', c.title, q.query, 'StartSel={MARK_START}, StopSel={MARK_END}')
+    FROM chat_conversation c, q
+    WHERE c.user_id = %s AND to_tsvector('english', c.title) @@ q.query
+),
+best AS (
+    SELECT *, row_number() OVER (PARTITION BY conversation_id ORDER BY score DESC) AS rn FROM hits
+)
+SELECT conversation_id, message_id, score, snippet, count(*) OVER () AS total
+FROM best WHERE rn = 1
+ORDER BY score DESC, conversation_id DESC
+LIMIT %s OFFSET %s
+"""
+
+
+def _search_postgresql(user, terms, limit, offset):
+    # Same prefix-on-last-term behaviour as the SQLite query
+    tsquery = ' & '.join(terms) + ':*'
+    with connection.cursor() as cursor:
+        cursor.execute(POSTGRES_SEARCH_SQL, [tsquery, user.id, user.id, limit, offset])
+        rows = cursor.fetchall()
+    total = rows[0][4] if rows else 0
+    return total, [(conv_id, msg_id, float(score), snippet) for conv_id, msg_id, score, snippet, _ in rows]
+
+
+def _search_fallback(user, terms, limit, offset):
+    """Unindexed scan for databases without full-text support."""
+    messages = Message.objects.filter(conversation__user=user)
+    titles = Conversation.objects.filter(user=user)
+    for term in terms:
+        messages = messages.filter(text__icontains=term)
+        titles = titles.filter(title__icontains=term)
+
+    best = {}
+    for conv_id, msg_id, text in messages.order_by('-created_at').values_list('conversation_id', 'id', 'text'):
+        best.setdefault(conv_id, (msg_id, 1.0, text))
+    for conv_id, title in titles.values_list('id', 'title'):
+        best[conv_id] = (None, TITLE_WEIGHT, title)
+
+    pattern = re.compile('(' + '|'.join(re.escape(t) for t in terms) + ')', re.IGNORECASE)
+    ranked = sorted(best.items(), key=lambda item: (-item[1][1], -item[0]))
+    hits = [
+        (conv_id, msg_id, score, pattern.sub(MARK_START + r'\1' + MARK_END, text[:300]))
+        for conv_id, (msg_id, score, text) in ranked[offset:offset + limit]
+    ]
+    return len(ranked), hits
+
+
+BACKENDS = {
+    'sqlite': _search_sqlite,
+    'postgresql': _search_postgresql,
+}
+
+
+def search_conversations(user, query, page=1, page_size=20):
+    """
+    Search `user`'s conversation titles and messages.
+
+    Returns (total, hits) where hits is a list of dicts with the conversation,
+    the best-matching message id (None for a title match), a relevance score
+    and a highlighted HTML snippet.
+    """
+    terms = query_terms(query)
+    if not terms:
+        return 0, []
+
+    offset = (page - 1) * page_size
+    backend = BACKENDS.get(connection.vendor, _search_fallback)
+    total, rows = backend(user, terms, page_size, offset)
+
+    conversations = Conversation.objects.in_bulk([conv_id for conv_id, _, _, _ in rows])
+    hits = []
+    for conv_id, msg_id, score, snippet in rows:
+        conversation = conversations.get(conv_id)
+        if conversation is None:
+            continue
+        hits.append({
+            'conversation_id': conv_id,
+            'title': conversation.title,
+            'created_at': conversation.created_at,
+            'message_id': msg_id,
+            'score': round(score, 4),
+            'snippet': render_snippet(snippet),
+        })
+    return total, hits
@@ -0,0 +1,280 @@
+# chat/shadow.py
+"""
+Shadow evaluation of candidate models.
+
+The model in INFERENCE['MODEL_DIR'] answers every request. Each model in
+SHADOW_MODELS['MODELS'] (name -> model directory) scores the same inputs off
+the request path, and the comparison with the primary answer is appended to
+a local SQLite store (SHADOW_MODELS['STORE']). Read it back with
+`manage.py shadow_report`.
+
+The request thread only does a non-blocking put on a bounded queue. When the
+queue is full the input is dropped, not waited for. A dispatcher thread
+hands queued inputs to a pool of spawned processes that run at lower CPU
+priority with their own small thread count, so shadow inference never runs
+inside the serving process's torch thread pool. If a shadow process dies
+(e.g. OOM-killed) its input is stored as an error so shadow_report counts
+it, and the pool is replaced before the next input is handed over.
+"""
+import hashlib
+import multiprocessing
+import os
+import queue
+import sqlite3
+import threading
+import time
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+
+from django.conf import settings
+from django.core.signals import setting_changed
+from django.dispatch import receiver
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS shadow_results (
+    id INTEGER PRIMARY KEY,
+    created_at REAL NOT NULL,
+    input_hash TEXT NOT NULL,
+    primary_model TEXT NOT NULL,
+    shadow_model TEXT NOT NULL,
+    primary_labels TEXT NOT NULL,
+    shadow_labels TEXT,
+    agree INTEGER,
+    overlap REAL,
+    primary_ms REAL NOT NULL,
+    shadow_ms REAL,
+    error TEXT
+)
+"""
+
+INSERT = (
+    "INSERT INTO shadow_results (created_at, input_hash, primary_model, shadow_model, primary_labels,"
+    " shadow_labels, agree, overlap, primary_ms, shadow_ms, error) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)"
+)
+
+
+def open_store(path):
+    if os.path.dirname(path):
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+    conn = sqlite3.connect(path, timeout=30)
+    # Several shadow processes append concurrently
+    conn.execute("PRAGMA journal_mode=WAL")
+    conn.execute(SCHEMA)
+    return conn
+
+
+def top_labels(result):
+    """Lower-cased labels, best first, of one input's classifier output."""
+    return [prediction['label'].lower() for prediction in result[0]]
+
+
+def result_row(text, primary, primary_ms, primary_model, name, labels=None, agree=None, overlap=None,
+               shadow_ms=None, error=None):
+    return (
+        time.time(), hashlib.sha1(text.encode('utf-8')).hexdigest(), primary_model, name,
+        ','.join(primary), None if labels is None else ','.join(labels),
+        None if agree is None else int(agree), overlap, primary_ms, shadow_ms, error,
+    )
+
+
+def compare(primary, shadow):
+    """(top-1 agreement, share of the primary's top-k also in the shadow's top-k)."""
+    if not primary or not shadow:
+        return False, 0.0
+    return primary[0] == shadow[0], len(set(primary) & set(shadow)) / len(primary)
+
+
+# State of a shadow worker process: its store connection and loaded models
+_worker = {}
+
+
+def _init_worker(models, store, threads):
+    import django
+    django.setup()
+
+    import torch
+
+    if hasattr(os, 'nice'):
+        os.nice(19)
+    torch.set_num_threads(threads)
+    _worker.update(models=models, conn=open_store(store), classifiers={})
+
+
+def _classifier(name):
+    from .inference import load_classifier
+
+    classifiers = _worker['classifiers']
+    if name not in classifiers:
+        classifiers[name] = load_classifier(_worker['models'][name])
+    return classifiers[name]
+
+
+def score_shadows(text, primary_result, primary_ms, primary_model):
+    """Score `text` with every shadow model and store how each compares to the primary."""
+    primary = top_labels(primary_result)
+    rows = []
+    for name in _worker['models']:
+        labels = agree = overlap = shadow_ms = error = None
+        try:
+            classifier = _classifier(name)
+            t0 = time.perf_counter()
+            result = classifier(text, truncation=True)
+            shadow_ms = (time.perf_counter() - t0) * 1000
+            labels = top_labels(result)
+            agree, overlap = compare(primary, labels)
+        except Exception as e:
+            error = f"{type(e).__name__}: {e}"
+        rows.append(result_row(
+            text, primary, primary_ms, primary_model, name, labels, agree, overlap, shadow_ms, error,
+        ))
+    with _worker['conn']:
+        _worker['conn'].executemany(INSERT, rows)
+    return len(rows)
+
+
+class ShadowPool:
+    def __init__(self, models, store, workers=1, threads=1, queue_size=256, sample_rate=1.0):
+        self.models = dict(models)
+        self.store = store
+        self.workers = workers
+        self.threads = threads
+        self.sample_rate = sample_rate
+        self.queue = queue.Queue(maxsize=queue_size)
+        self.submitted = 0
+        self.dropped = 0
+        self.failed = 0
+        self._sampled = 0.0
+        self._lock = threading.Lock()
+        self._executor = None
+        self._dispatcher = None
+
+    def submit(self, text, primary_result, primary_ms):
+        """Queue an input for shadow scoring; never blocks. Returns False if it was skipped."""
+        with self._lock:
+            # Deterministic sampling: every 1/sample_rate-th input
+            self._sampled += self.sample_rate
+            if self._sampled < 1:
+                return False
+            self._sampled -= 1
+            if self._dispatcher is None:
+                self._dispatcher = threading.Thread(target=self._dispatch, name='shadow-dispatch', daemon=True)
+                self._dispatcher.start()
+        try:
+            self.queue.put_nowait((text, primary_result, primary_ms))
+        except queue.Full:
+            with self._lock:
+                self.dropped += 1
+            return False
+        with self._lock:
+            self.submitted += 1
+        return True
+
+    def _start_executor(self):
+        return ProcessPoolExecutor(
+            max_workers=self.workers,
+            mp_context=multiprocessing.get_context('spawn'),
+            initializer=_init_worker,
+            initargs=(self.models, self.store, self.threads),
+        )
+
+    def _dispatch(self):
+        from .similar import model_fingerprint
+
+        primary_model = model_fingerprint(settings.INFERENCE['MODEL_DIR'])
+        self._executor = self._start_executor()
+        # At most one pending job per worker: the backlog stays in self.queue, where it is bounded
+        slots = threading.Semaphore(self.workers)
+        while True:
+            item = self.queue.get()
+            if item is None:
+                break
+            slots.acquire()
+            try:
+                future = self._executor.submit(score_shadows, *item, primary_model)
+            except BrokenProcessPool:
+                # A shadow process died since the last input (its own input was counted in
+                # _done): start a fresh pool and give it this input, which never ran
+                self._executor.shutdown(wait=False, cancel_futures=True)
+                self._executor = self._start_executor()
+                try:
+                    future = self._executor.submit(score_shadows, *item, primary_model)
+                except BrokenProcessPool as e:
+                    slots.release()
+                    self._failed(item, primary_model, e)
+                    continue
+            future.add_done_callback(lambda f, item=item: self._done(f, slots, item, primary_model))
+        self._executor.shutdown(wait=True)
+
+    def _done(self, future, slots, item, primary_model):
+        slots.release()
+        if future.exception() is not None:
+            self._failed(item, primary_model, future.exception())
+
+    def _failed(self, item, primary_model, error):
+        """Count an input that no shadow process scored, here and in the store."""
+        print(f"⚠️ Shadow scoring failed: {error}")
+        with self._lock:
+            self.failed += 1
+        text, primary_result, primary_ms = item
+        error = f"{type(error).__name__}: {error}"
+        rows = [
+            result_row(text, top_labels(primary_result), primary_ms, primary_model, name, error=error)
+            for name in self.models
+        ]
+        try:
+            conn = open_store(self.store)
+            try:
+                with conn:
+                    conn.executemany(INSERT, rows)
+            finally:
+                conn.close()
+        except sqlite3.Error as e:
+            print(f"⚠️ Could not record shadow failure: {e}")
+
+    def join(self, timeout=None):
+        """Stop accepting work and wait until everything queued has been scored."""
+        if self._dispatcher is None:
+            return
+        self.queue.put(None)
+        self._dispatcher.join(timeout)
+
+    def snapshot(self):
+        with self._lock:
+            return {
+                'models': sorted(self.models),
+                'queue_depth': self.queue.qsize(),
+                'submitted': self.submitted,
+                'dropped': self.dropped,
+                'failed': self.failed,
+            }
+
+
+_pool = None
+_pool_lock = threading.Lock()
+
+
+def get_shadow_pool():
+    """The process-wide shadow pool, or None when no shadow models are configured."""
+    global _pool
+    conf = settings.SHADOW_MODELS
+    if not conf.get('MODELS'):
+        return None
+    if _pool is None:
+        with _pool_lock:
+            if _pool is None:
+                _pool = ShadowPool(
+                    conf['MODELS'], conf['STORE'],
+                    workers=conf.get('WORKERS', 1),
+                    threads=conf.get('THREADS', 1),
+                    queue_size=conf.get('QUEUE_SIZE', 256),
+                    sample_rate=conf.get('SAMPLE_RATE', 1.0),
+                )
+    return _pool
+
+
+@receiver(setting_changed)
+def _reset_pool(setting, **kwargs):
+    global _pool
+    if setting in ('SHADOW_MODELS', 'INFERENCE'):
+        _pool = None
+
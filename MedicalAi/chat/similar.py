@@ -0,0 +1,236 @@
+# chat/similar.py
+"""
+Similar-case retrieval over the training dataset.
+
+`manage.py build_case_index` embeds every text of AugmentedSymptom2Disease.csv
+with the served classifier (chat.inference.forward, the same pooled embedding
+PredictView gets from its prediction pass) and writes the index to
+SIMILAR_CASES['INDEX_DIR']:
+
+    meta.json        model fingerprint, size, kind ('exact' or 'ivf')
+    embeddings.npy   float32, L2-normalised, one row per case
+    cases.json       [label, text] per row
+    centroids.npy    IVF only: k-means centroids of the embeddings
+    offsets.npy      IVF only: rows of list i are offsets[i]:offsets[i + 1]
+
+The arrays are memory-mapped, so workers share the pages and startup is
+instant. A rebuild is written to a temporary directory and swapped in, so
+workers still mapping the old files keep reading them intact. Small corpora
+are searched exactly (one matrix-vector product); from IVF_MIN_CASES rows
+on, rows are grouped by nearest centroid and a query only scores the NPROBE
+closest lists.
+"""
+import hashlib
+import json
+import math
+import os
+import shutil
+import tempfile
+import threading
+
+import numpy as np
+from django.conf import settings
+from django.core.signals import setting_changed
+from django.dispatch import receiver
+
+WEIGHT_FILES = ('model.safetensors', 'pytorch_model.bin')
+
+
+# (path, size, mtime_ns) -> sha256 of the file, so each worker hashes the weights once
+_file_digests = {}
+
+
+def file_digest(path, chunk_size=1 << 20):
+    stat = os.stat(path)
+    key = (os.path.abspath(path), stat.st_size, stat.st_mtime_ns)
+    if key not in _file_digests:
+        digest = hashlib.sha256()
+        with open(path, 'rb') as f:
+            for chunk in iter(lambda: f.read(chunk_size), b''):
+                digest.update(chunk)
+        _file_digests[key] = digest.hexdigest()
+    return _file_digests[key]
+
+
+def model_fingerprint(model_dir):
+    """Identifies the model an index was built with: its config and the content of its weight files."""
+    digest = hashlib.sha256()
+    with open(os.path.join(model_dir, 'config.json'), 'rb') as f:
+        digest.update(f.read())
+    for name in WEIGHT_FILES:
+        path = os.path.join(model_dir, name)
+        if os.path.exists(path):
+            digest.update(f'{name}:{file_digest(path)}'.encode())
+    return digest.hexdigest()[:16]
+
+
+def top_k(scores, k):
+    """Indices of the k highest scores, best first."""
+    k = min(k, len(scores))
+    if k <= 0:
+        return np.empty(0, dtype=np.int64)
+    best = np.argpartition(-scores, k - 1)[:k]
+    return best[np.argsort(-scores[best])]
+
+
+def kmeans(vectors, nlist, iterations=10, sample_size=None, seed=42):
+    """Spherical k-means (cosine) on a sample of `vectors`; returns normalised centroids."""
+    rng = np.random.default_rng(seed)
+    sample_size = min(len(vectors), sample_size or 64 * nlist)
+    sample = np.asarray(vectors[np.sort(rng.choice(len(vectors), sample_size, replace=False))])
+    centroids = sample[rng.choice(len(sample), nlist, replace=False)].copy()
+    for _ in range(iterations):
+        assignment = np.argmax(sample @ centroids.T, axis=1)
+        for i in range(nlist):
+            members = sample[assignment == i]
+            if len(members):
+                centroids[i] = members.sum(0)
+            else:
+                # Re-seed empty lists so every list ends up used
+                centroids[i] = sample[rng.integers(len(sample))]
+        centroids /= np.linalg.norm(centroids, axis=1, keepdims=True).clip(min=1e-12)
+    return centroids.astype(np.float32)
+
+
+def assign(vectors, centroids, chunk_size=65536):
+    return np.concatenate([
+        np.argmax(vectors[i:i + chunk_size] @ centroids.T, axis=1)
+        for i in range(0, len(vectors), chunk_size)
+    ])
+
+
+def write_index(path, embeddings, cases, fingerprint, ivf_min_cases=50000, nlist=None):
+    """
+    Write an index for `embeddings` (normalised float32 rows) and their
+    (label, text) cases, replacing any index already at `path`.
+    """
+    path = os.path.abspath(path)
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    staging = tempfile.mkdtemp(prefix=f'.{os.path.basename(path)}.', dir=os.path.dirname(path))
+    try:
+        os.chmod(staging, 0o755)
+        meta = _write_files(staging, embeddings, cases, fingerprint, ivf_min_cases, nlist)
+        if os.path.exists(path):
+            # Directories can't be replaced while non-empty: move the old one
+            # aside first. Its files stay readable through existing mmaps.
+            retired = staging + '.old'
+            os.replace(path, retired)
+            os.replace(staging, path)
+            shutil.rmtree(retired, ignore_errors=True)
+        else:
+            os.replace(staging, path)
+    except BaseException:
+        shutil.rmtree(staging, ignore_errors=True)
+        raise
+    return meta
+
+
+def _write_files(path, embeddings, cases, fingerprint, ivf_min_cases, nlist):
+    meta = {'model': fingerprint, 'count': len(cases), 'dim': int(embeddings.shape[1]), 'kind': 'exact'}
+
+    if len(cases) >= ivf_min_cases:
+        nlist = nlist or max(1, int(4 * math.sqrt(len(cases))))
+        centroids = kmeans(embeddings, nlist)
+        lists = assign(embeddings, centroids)
+        order = np.argsort(lists, kind='stable')
+        offsets = np.concatenate([[0], np.cumsum(np.bincount(lists, minlength=nlist))])
+        embeddings = embeddings[order]
+        cases = [cases[i] for i in order]
+        np.save(os.path.join(path, 'centroids.npy'), centroids)
+        np.save(os.path.join(path, 'offsets.npy'), offsets.astype(np.int64))
+        meta.update(kind='ivf', nlist=nlist)
+
+    np.save(os.path.join(path, 'embeddings.npy'), np.ascontiguousarray(embeddings, dtype=np.float32))
+    with open(os.path.join(path, 'cases.json'), 'w', encoding='utf-8') as f:
+        json.dump([list(case) for case in cases], f, ensure_ascii=False)
+    # Written last: an index without meta.json is incomplete and never loaded
+    with open(os.path.join(path, 'meta.json'), 'w', encoding='utf-8') as f:
+        json.dump(meta, f)
+    return meta
+
+
+class CaseIndex:
+    def __init__(self, meta, embeddings, cases, centroids=None, offsets=None, nprobe=16):
+        self.meta = meta
+        self.embeddings = embeddings
+        self.cases = cases
+        self.centroids = centroids
+        self.offsets = offsets
+        self.nprobe = nprobe
+
+    @classmethod
+    def load(cls, path, nprobe=16):
+        with open(os.path.join(path, 'meta.json'), encoding='utf-8') as f:
+            meta = json.load(f)
+        with open(os.path.join(path, 'cases.json'), encoding='utf-8') as f:
+            cases = json.load(f)
+        embeddings = np.load(os.path.join(path, 'embeddings.npy'), mmap_mode='r')
+        centroids = offsets = None
+        if meta['kind'] == 'ivf':
+            centroids = np.load(os.path.join(path, 'centroids.npy'))
+            offsets = np.load(os.path.join(path, 'offsets.npy'))
+        return cls(meta, embeddings, cases, centroids, offsets, nprobe)
+
+    def __len__(self):
+        return len(self.cases)
+
+    def search_rows(self, query, k):
+        """(rows, scores) of the k cases most similar to the normalised `query`."""
+        if self.centroids is None:
+            scores = self.embeddings @ query
+            rows = top_k(scores, k)
+            return rows, scores[rows]
+
+        lists = top_k(self.centroids @ query, self.nprobe)
+        # Each list is a contiguous block of rows, so only the probed pages are read
+        rows = np.concatenate([np.arange(self.offsets[i], self.offsets[i + 1]) for i in lists])
+        scores = np.concatenate([self.embeddings[self.offsets[i]:self.offsets[i + 1]] @ query for i in lists])
+        best = top_k(scores, k)
+        return rows[best], scores[best]
+
+    def search(self, query, k=5):
+        rows, scores = self.search_rows(query, k)
+        return [
+            {'label': self.cases[row][0], 'text': self.cases[row][1], 'score': round(float(score), 4)}
+            for row, score in zip(rows, scores)
+        ]
+
+
+_lock = threading.Lock()
+_index = None
+_loaded = False
+
+
+def get_case_index():
+    """
+    The process-wide index, or None if it hasn't been built or was built
+    with a different model than the one being served.
+    """
+    global _index, _loaded
+    if not _loaded:
+        with _lock:
+            if not _loaded:
+                conf = settings.SIMILAR_CASES
+                path = conf['INDEX_DIR']
+                if not os.path.exists(os.path.join(path, 'meta.json')):
+                    print(f"⚠️ No similar-case index at {path} (run manage.py build_case_index)")
+                else:
+                    index = CaseIndex.load(path, nprobe=conf.get('NPROBE', 16))
+                    try:
+                        fingerprint = model_fingerprint(settings.INFERENCE['MODEL_DIR'])
+                    except OSError:
+                        fingerprint = None
+                    if index.meta['model'] != fingerprint:
+                        print(f"⚠️ Similar-case index at {path} was built for another model, ignoring it")
+                    else:
+                        _index = index
+                _loaded = True
+    return _index
+
+
+@receiver(setting_changed)
+def _reset_index(setting, **kwargs):
+    global _index, _loaded
+    if setting in ('SIMILAR_CASES', 'INFERENCE'):
+        _index = None
+        _loaded = False
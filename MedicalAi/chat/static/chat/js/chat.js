@@ -22,9 +22,11 @@ async function getModelPrediction(userMessage) {
         const conversationId = window.currentConversationId || null;
         
         // Prepare the request data
+        // Ask for compact predictions (catalog ids) once the disease catalog is loaded
         const requestData = {
             message: userMessage,
-            conversation_id: conversationId
+            conversation_id: conversationId,
+            compact: Boolean(window.diseaseCatalogVersion)
         };
         
         console.log('🔄 [API REQUEST] Current conversation state:', {
@@ -343,6 +345,13 @@ async function processUserMessage(userMessage, loadingId, chatContainer) {
             try {
                 // Get the AI's prediction
                 const predictionResult = await getModelPrediction(userMessage);
+
+                // Compact ids refer to a newer catalog than the one loaded: refetch before joining
+                const catalogVersion = predictionResult?.data?.catalog_version;
+                if (catalogVersion && catalogVersion !== window.diseaseCatalogVersion && window.loadDiseaseData) {
+                    window.diseaseDataReady = window.loadDiseaseData(catalogVersion);
+                    await window.diseaseDataReady;
+                }
                 
                 // Remove loading message
                 const loadingMessage = document.getElementById(loadingId);
@@ -924,6 +933,11 @@ async function loadConversation(conversationId) {
 
         const conversation = await response.json();
 
+        // Stored AI messages may be compact and need the disease catalog to render
+        if (window.diseaseDataReady) {
+            await window.diseaseDataReady;
+        }
+
         // Clear chat UI
         const chatMessages = document.getElementById('chat-messages');
         if (chatMessages) {
@@ -20,13 +20,47 @@ let allPredictions = [];
 // Load disease data from JSON file
 let diseaseData = [];
 
-// Function to load disease data
-function loadDiseaseData() {
+// Version of the /api/diseases/ catalog that diseaseData came from (null for the static JSON)
+window.diseaseCatalogVersion = null;
+
+// Catalog URL pinned to `version`. The template pins the version the page was rendered with,
+// and that URL is cached as immutable, so a newer version must be requested under its own URL.
+function diseaseCatalogUrl(version) {
+    if (!version) {
+        return window.DISEASE_CATALOG_URL;
+    }
+    return `${window.DISEASE_CATALOG_URL.split('?')[0]}?v=${encodeURIComponent(version)}`;
+}
+
+// Function to load disease data: the versioned catalog first, the static JSON as a fallback
+function loadDiseaseData(version) {
+    if (window.DISEASE_CATALOG_URL) {
+        return fetch(diseaseCatalogUrl(version))
+            .then(response => {
+                if (!response.ok) {
+                    throw new Error(`HTTP error! status: ${response.status}`);
+                }
+                return response.json();
+            })
+            .then(catalog => {
+                console.log('Disease catalog loaded, version', catalog.version);
+                diseaseData = catalog.diseases;
+                window.diseaseCatalogVersion = catalog.version;
+            })
+            .catch(error => {
+                console.error('Error loading disease catalog:', error);
+                return loadDiseaseJson();
+            });
+    }
+    return loadDiseaseJson();
+}
+
+function loadDiseaseJson() {
     // Check if the URL is defined in the global scope
     if (typeof window.DISEASE_JSON_URL !== 'undefined' && window.DISEASE_JSON_URL) {
         console.log('Loading disease data from:', window.DISEASE_JSON_URL);
         
-        fetch(window.DISEASE_JSON_URL)
+        return fetch(window.DISEASE_JSON_URL)
             .then(response => {
                 if (!response.ok) {
                     throw new Error(`HTTP error! status: ${response.status}`);
@@ -43,7 +77,7 @@ function loadDiseaseData() {
                 if (window.DISEASE_JSON_URL.includes('data/24-Disease.json')) {
                     const fallbackUrl = window.DISEASE_JSON_URL.replace('data/24-Disease.json', '24-Disease.json');
                     console.log('Trying fallback URL:', fallbackUrl);
-                    fetch(fallbackUrl)
+                    return fetch(fallbackUrl)
                         .then(r => r.json())
                         .then(d => {
                             console.log('Successfully loaded disease data from fallback URL');
@@ -55,11 +89,29 @@ function loadDiseaseData() {
     } else {
         console.error('DISEASE_JSON_URL is not defined in the global scope');
         console.log('Available globals:', Object.keys(window).filter(k => k === 'DISEASE_JSON_URL' || k === 'TOPICS_JSON_URL' || k === 'API_URLS'));
+        return Promise.resolve();
     }
 }
 
 // Load disease data when the script loads
-loadDiseaseData();
+window.diseaseDataReady = loadDiseaseData();
+window.loadDiseaseData = loadDiseaseData;
+
+/**
+ * Join compact predictions ({id, confidence}) with the loaded catalog.
+ * Full predictions (stored before compact mode, or from the fallback engine) pass through.
+ * @param {Array} predictions - Predictions as returned by the API
+ * @returns {Array} Predictions carrying the full disease record
+ */
+function expandPredictions(predictions) {
+    return predictions.map(p => {
+        if (p.name !== undefined || p.id === undefined) {
+            return p;
+        }
+        const disease = diseaseData.find(d => d.id === p.id);
+        return disease ? Object.assign({}, disease, { confidence: p.confidence }) : p;
+    });
+}
 
 /**
  * Process AI response for disease diagnosis
@@ -74,6 +126,9 @@ function processDiseaseResponse(predictions) {
             return "I'm sorry, I couldn't process the prediction results.";
         }
 
+        // Compact predictions only carry catalog ids
+        predictions = expandPredictions(predictions);
+
         // Store all predictions for later use
         allPredictions = predictions;
         const topPrediction = predictions[0];
@@ -1,6 +1,9 @@
 // Search functionality for Clinexa Medical Chatbot
 
 document.addEventListener('DOMContentLoaded', function() {
+    let searchTimer = null;
+    let searchController = null;
+
     // Get DOM elements
     const searchButton = document.getElementById('search-button');
     const searchModal = document.getElementById('search-modal');
@@ -33,9 +36,11 @@ document.addEventListener('DOMContentLoaded', function() {
             }
         });
 
-        // Handle search input
+        // Handle search input (debounced so we send one request per pause in typing)
         searchInput.addEventListener('input', function() {
-            handleSearch(this.value.trim());
+            const query = this.value.trim();
+            clearTimeout(searchTimer);
+            searchTimer = setTimeout(() => handleSearch(query), 200);
         });
     }
 
@@ -86,14 +91,92 @@ document.addEventListener('DOMContentLoaded', function() {
     }
 
     // Function to handle search
-    function handleSearch(query) {
-        // Clear previous results
-        searchResults.innerHTML = '';
-        
+    async function handleSearch(query) {
         if (!query) {
             searchResults.innerHTML = '<div class="text-sm text-gray-500 dark:text-gray-400 text-center py-4">Type to search your conversations</div>';
             return;
         }
+
+        // Signed-in users search their history on the server
+        const authToken = localStorage.getItem('authToken');
+        if (!authToken) {
+            handleLocalSearch(query);
+            return;
+        }
+
+        // Drop the response of a query the user has already typed past
+        if (searchController) {
+            searchController.abort();
+        }
+        searchController = new AbortController();
+
+        try {
+            const response = await fetch(`/api/conversations/search/?q=${encodeURIComponent(query)}&page_size=20`, {
+                headers: { 'Authorization': `Token ${authToken}` },
+                signal: searchController.signal
+            });
+            if (!response.ok) {
+                throw new Error(`Search failed with status ${response.status}`);
+            }
+            const data = await response.json();
+            renderServerResults(data.results || []);
+        } catch (error) {
+            if (error.name === 'AbortError') {
+                return;
+            }
+            console.error('Server search failed, falling back to local search:', error);
+            handleLocalSearch(query);
+        }
+    }
+
+    // Render hits from /api/conversations/search/ (snippets are already HTML-escaped by the server)
+    function renderServerResults(results) {
+        searchResults.innerHTML = '';
+
+        if (results.length === 0) {
+            searchResults.innerHTML = '<div class="text-sm text-gray-500 dark:text-gray-400 text-center py-4">No matching conversations found</div>';
+            return;
+        }
+
+        results.forEach(hit => {
+            const resultItem = document.createElement('div');
+            resultItem.className = 'p-3 mb-2 rounded-md hover:bg-gray-100 dark:hover:bg-gray-700 cursor-pointer transition-colors';
+            resultItem.setAttribute('data-conversation-id', hit.conversation_id);
+
+            const title = document.createElement('div');
+            title.className = 'font-medium text-gray-900 dark:text-white';
+            title.textContent = hit.title || 'Untitled Conversation';
+
+            const preview = document.createElement('div');
+            preview.className = 'text-sm text-gray-500 dark:text-gray-400 truncate mt-1';
+            preview.innerHTML = hit.snippet || 'No preview available';
+
+            const date = document.createElement('div');
+            date.className = 'text-xs text-gray-400 dark:text-gray-500 mt-1';
+            date.textContent = new Date(hit.created_at).toLocaleDateString();
+
+            resultItem.appendChild(title);
+            resultItem.appendChild(preview);
+            resultItem.appendChild(date);
+
+            resultItem.addEventListener('click', function() {
+                const conversationId = this.getAttribute('data-conversation-id');
+                closeSearchModal();
+                if (typeof loadConversation === 'function') {
+                    loadConversation(conversationId);
+                } else {
+                    window.location.href = `/chat/chat/?conversation_id=${conversationId}`;
+                }
+            });
+
+            searchResults.appendChild(resultItem);
+        });
+    }
+
+    // Function to search conversations cached in localStorage (signed-out users)
+    function handleLocalSearch(query) {
+        // Clear previous results
+        searchResults.innerHTML = '';
         
         // Get conversations from localStorage
         const conversations = JSON.parse(localStorage.getItem('conversations') || '[]');
@@ -0,0 +1,25 @@
+from django import template
+from django.conf import settings
+from django.contrib.staticfiles.storage import staticfiles_storage
+from django.templatetags.static import static
+from django.utils.html import format_html_join
+
+register = template.Library()
+
+
+@register.simple_tag
+def static_bundle(name):
+    """
+    Script or stylesheet tags for a STATIC_BUNDLES entry: the single built
+    bundle once collectstatic has produced it, the individual files in
+    development (DEBUG, or no manifest entry for the bundle yet).
+    """
+    hashed_files = getattr(staticfiles_storage, 'hashed_files', {})
+    if not settings.DEBUG and name in hashed_files:
+        urls = [static(name)]
+    else:
+        urls = [static(member) for member in settings.STATIC_BUNDLES[name]]
+
+    if name.endswith('.css'):
+        return format_html_join('\n    ', '<link rel="stylesheet" href="{}">', ((url,) for url in urls))
+    return format_html_join('\n    ', '<script src="{}"></script>', ((url,) for url in urls))
@@ -1,2 +1,1168 @@
-from transformers import pipeline
-pipeline("text-classification", model="./model", tokenizer="./model", local_files_only=True)
+import os
+import shutil
+import tempfile
+import time
+from unittest import mock, skipUnless
+
+from django.conf import settings
+from django.test import LiveServerTestCase, TestCase, override_settings
+
+from . import inference
+
+REPO_MODEL_DIR = os.path.join(settings.BASE_DIR.parent, 'model')
+WEIGHT_FILES = ('model.safetensors', 'pytorch_model.bin')
+HAS_WEIGHTS = any(os.path.exists(os.path.join(REPO_MODEL_DIR, f)) for f in WEIGHT_FILES)
+
+
+@skipUnless(HAS_WEIGHTS, "model weights not downloaded (see download_model.py)")
+class ModelLoadTest(TestCase):
+    def test_pipeline_loads(self):
+        from transformers import pipeline
+        pipeline("text-classification", model=REPO_MODEL_DIR, tokenizer=REPO_MODEL_DIR, local_files_only=True)
+
+
+def build_tiny_model(path):
+    """A randomly initialised one-layer model with the repo's labels and tokenizer."""
+    from transformers import AutoConfig, AutoModelForSequenceClassification
+
+    config = AutoConfig.from_pretrained(REPO_MODEL_DIR)
+    config.update({'num_hidden_layers': 1, 'hidden_size': 32, 'num_attention_heads': 2, 'intermediate_size': 64})
+    AutoModelForSequenceClassification.from_config(config).save_pretrained(path)
+    copy_tokenizer(path)
+
+
+def copy_tokenizer(path):
+    for name in os.listdir(REPO_MODEL_DIR):
+        if name != 'config.json' and name not in WEIGHT_FILES:
+            shutil.copy(os.path.join(REPO_MODEL_DIR, name), path)
+
+
+class TuneInferenceTest(TestCase):
+    """tune_inference must report failed or crashed workers instead of waiting for them forever."""
+
+    def test_worker_that_cannot_load_the_model(self):
+        import io
+
+        from django.core.management import CommandError, call_command
+
+        missing = os.path.join(tempfile.gettempdir(), 'no-such-model')
+        with self.assertRaises(CommandError):
+            call_command('tune_inference', workers='2', threads='1', duration=0.1, samples=2,
+                         model_dir=missing, oversubscribe=True, stdout=io.StringIO())
+
+    def test_worker_killed_without_a_result(self):
+        import multiprocessing
+
+        from .management.commands.tune_inference import _collect
+
+        ctx = multiprocessing.get_context('spawn')
+        results = ctx.Queue()
+        procs = [ctx.Process(target=os._exit, args=(3,))]
+        procs[0].start()
+        outcomes = _collect(procs, results, timeout=60)
+        procs[0].join()
+        self.assertEqual(len(outcomes), 1)
+        self.assertIn('without a result', outcomes[0]['error'])
+
+
+@skipUnless(os.path.isdir('/proc/self/task') and hasattr(os, 'sched_setaffinity'), "Linux only")
+class CpuPinningTest(TestCase):
+    def test_every_thread_is_pinned(self):
+        import threading
+
+        started, release, native_ids = threading.Event(), threading.Event(), []
+
+        def request_thread():
+            native_ids.append(threading.get_native_id())
+            started.set()
+            release.wait(5)
+
+        thread = threading.Thread(target=request_thread, daemon=True)
+        thread.start()
+        self.addCleanup(thread.join, 5)
+        self.addCleanup(release.set)
+        started.wait(5)
+
+        cores = sorted(os.sched_getaffinity(0))[:1]
+        with mock.patch('os.sched_setaffinity') as setaffinity, \
+                mock.patch.dict(os.environ, {'OMP_NUM_THREADS': '1', 'MKL_NUM_THREADS': '1'}), \
+                mock.patch('torch.set_num_threads'):
+            settings_applied = inference.apply_cpu_settings(
+                intra_op_threads=1, inter_op_threads=0, affinity=str(cores[0]), worker_id=0
+            )
+        pinned = {call.args[0] for call in setaffinity.call_args_list}
+        self.assertEqual(settings_applied['cores'], cores)
+        # Not just the calling thread: the other thread of the process too
+        self.assertIn(threading.get_native_id(), pinned)
+        self.assertIn(native_ids[0], pinned)
+        self.assertTrue(all(call.args[1] == cores for call in setaffinity.call_args_list))
+
+    def test_configure_cpu_runs_once(self):
+        with mock.patch.object(inference, '_cpu_settings', None), \
+                mock.patch.object(inference, 'apply_cpu_settings', return_value={'cores': None}) as apply:
+            inference.configure_cpu()
+            inference.configure_cpu()
+        apply.assert_called_once_with()
+
+
+class ConversationSearchTest(TestCase):
+    """Full-text search: index kept in sync by the migration's triggers, scoped per user, safe with any input."""
+
+    def setUp(self):
+        from django.contrib.auth.models import User
+        from rest_framework.authtoken.models import Token
+
+        from .models import Conversation, Message
+
+        self.user = User.objects.create_user(username='searcher', password='x')
+        self.client.defaults['HTTP_AUTHORIZATION'] = f'Token {Token.objects.create(user=self.user).key}'
+        self.rash = Conversation.objects.create(user=self.user, title='Itchy rash')
+        self.message = Message.objects.create(conversation=self.rash, is_user=True, text='Red patches on my arms <b>')
+        self.fever = Conversation.objects.create(user=self.user, title='Feeling hot')
+        Message.objects.create(conversation=self.fever, is_user=True, text='High fever and chills since Monday')
+        other = User.objects.create_user(username='neighbour')
+        Message.objects.create(
+            conversation=Conversation.objects.create(user=other, title='Fever rash'), text='fever with a rash'
+        )
+
+    def search(self, query, **params):
+        response = self.client.get('/api/conversations/search/', {'q': query, **params})
+        self.assertEqual(response.status_code, 200, response.content)
+        return response.json()
+
+    def ids(self, query):
+        return [hit['conversation_id'] for hit in self.search(query)['results']]
+
+    def test_ranking_snippet_and_scoping(self):
+        body = self.search('fever')
+        self.assertEqual(body['count'], 1)
+        self.assertEqual([h['conversation_id'] for h in body['results']], [self.fever.id])
+        self.assertIn('<mark>fever</mark>', body['results'][0]['snippet'].lower())
+        # Title match, and the other user's "Fever rash" conversation is not visible
+        self.assertEqual(self.ids('rash'), [self.rash.id])
+        # Stored text is escaped in snippets
+        self.assertIn('&lt;b&gt;', self.search('patches')['results'][0]['snippet'])
+        # Prefix match on the last term
+        self.assertEqual(self.ids('chil'), [self.fever.id])
+
+    def test_triggers_keep_the_index_in_sync(self):
+        from django.db import connection
+
+        from .models import Conversation, Message
+
+        self.message.text = 'Blistering on my arms'
+        self.message.save()
+        self.assertEqual(self.ids('patches'), [])
+        self.assertEqual(self.ids('blistering'), [self.rash.id])
+
+        Conversation.objects.filter(pk=self.fever.pk).update(title='Night sweats')
+        self.assertEqual(self.ids('sweats'), [self.fever.id])
+
+        Message.objects.create(conversation=self.rash, is_user=True, text='Now also a headache')
+        self.assertEqual(self.ids('headache'), [self.rash.id])
+
+        self.message.delete()
+        self.assertEqual(self.ids('blistering'), [])
+
+        response = self.client.post('/api/conversations/delete_all/')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(self.search('fever')['count'], 0)
+        if connection.vendor == 'sqlite':
+            with connection.cursor() as cursor:
+                cursor.execute('SELECT user_id, count(*) FROM chat_message_fts GROUP BY user_id')
+                self.assertEqual([row[0] for row in cursor.fetchall()], [Conversation.objects.get().user_id])
+
+    def test_query_syntax_is_not_interpreted(self):
+        for query in ('"fever', 'fever"', '*', 'fever*', 'fever OR rash', 'NEAR(fever rash)', 'text:fever',
+                      '-fever', 'fever^2', "fever' --", '()', '"', '🤒 fever'):
+            with self.subTest(query=query):
+                self.search(query)
+        self.assertEqual(self.ids('"fever'), [self.fever.id])
+        # OR is a plain word: every term must match
+        self.assertEqual(self.ids('fever OR rash'), [])
+        self.assertEqual(self.search('*')['count'], 0)
+
+    def test_fallback_scan(self):
+        from . import search
+
+        with mock.patch.dict(search.BACKENDS, clear=True):
+            body = self.search('fever')
+            self.assertEqual([h['conversation_id'] for h in body['results']], [self.fever.id])
+            self.assertIn('<mark>fever</mark>', body['results'][0]['snippet'])
+            self.assertEqual(self.ids('rash'), [self.rash.id])
+            self.assertEqual(self.ids('"fever OR *'), [])
+            self.assertEqual(self.search('', page=1)['count'], 0)
+
+    def test_pagination(self):
+        from .models import Conversation
+
+        for i in range(5):
+            Conversation.objects.create(user=self.user, title=f'Cough {i}')
+        first = self.search('cough', page_size=2)
+        last = self.search('cough', page_size=2, page=3)
+        self.assertEqual(first['count'], 5)
+        self.assertEqual(len(first['results']), 2)
+        self.assertEqual(len(last['results']), 1)
+        self.assertEqual(self.client.get('/api/conversations/search/', {'q': 'x', 'page': 'a'}).status_code, 400)
+
+
+class DiseaseCatalogTest(TestCase):
+    """The versioned /api/diseases/ catalog and compact predictions that refer to it."""
+
+    RESULT = [[{'label': 'Psoriasis', 'score': 0.8}, {'label': 'Acne', 'score': 0.15}, {'label': 'unknown', 'score': 0.05}]]
+
+    def setUp(self):
+        from django.contrib.auth.models import User
+        from rest_framework.authtoken.models import Token
+
+        self.user = User.objects.create_user(username='catalog-reader', password='x')
+        self.client.defaults['HTTP_AUTHORIZATION'] = f'Token {Token.objects.create(user=self.user).key}'
+
+    def test_etag_and_caching(self):
+        from .catalog import get_catalog
+
+        catalog = get_catalog()
+        response = self.client.get('/api/diseases/')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response['ETag'], catalog.etag)
+        self.assertEqual(response['Cache-Control'], 'public, no-cache')
+        self.assertEqual(response.json()['version'], catalog.version)
+
+        for if_none_match in (catalog.etag, f'W/{catalog.etag}', f'"other", {catalog.etag}', '*'):
+            with self.subTest(if_none_match=if_none_match):
+                response = self.client.get('/api/diseases/', HTTP_IF_NONE_MATCH=if_none_match)
+                self.assertEqual(response.status_code, 304)
+                self.assertEqual(response.content, b'')
+                self.assertEqual(response['ETag'], catalog.etag)
+        self.assertEqual(self.client.get('/api/diseases/', HTTP_IF_NONE_MATCH='"stale"').status_code, 200)
+
+        pinned = self.client.get(f'/api/diseases/?v={catalog.version}')
+        self.assertEqual(pinned['Cache-Control'], 'public, max-age=31536000, immutable')
+        # An old pinned version must not be cached as immutable under its URL
+        self.assertEqual(self.client.get('/api/diseases/?v=0ld').get('Cache-Control'), 'public, no-cache')
+
+    def test_compact_predictions_expand_to_full_ones(self):
+        import json
+
+        from .models import Message
+
+        with mock.patch('chat.views.classify', return_value=(self.RESULT, 'model', None)):
+            full = self.client.post('/api/chat/predict/', {'message': 'silvery scales'}, content_type='application/json')
+            compact = self.client.post('/api/chat/predict/', {'message': 'silvery scales', 'compact': True},
+                                       content_type='application/json')
+        self.assertEqual(full.status_code, 200)
+        self.assertEqual(compact.status_code, 200)
+        full, compact = full.json()['data'], compact.json()['data']
+        catalog = self.client.get('/api/diseases/').json()
+        self.assertEqual(compact['catalog_version'], catalog['version'])
+        self.assertEqual([set(p) for p in compact['predictions']], [{'id', 'confidence'}] * 2)
+
+        # What disease-chat.js expandPredictions does
+        by_id = {disease['id']: disease for disease in catalog['diseases']}
+        expanded = [dict(by_id[p['id']], confidence=p['confidence']) for p in compact['predictions']]
+        self.assertEqual(expanded, full['predictions'])
+        self.assertEqual([p['name'] for p in expanded], ['Psoriasis', 'Acne'])
+
+        stored = json.loads(Message.objects.filter(is_user=False).order_by('id').last().text)
+        self.assertEqual(stored['predictions'], compact['predictions'])
+
+    def test_ids_survive_reordering(self):
+        from django.core.exceptions import ImproperlyConfigured
+
+        from .catalog import Catalog
+        from .utils import load_disease_data
+
+        diseases = load_disease_data()
+        before = Catalog(diseases)
+        after = Catalog([{'id': 99, 'name': 'New disease'}] + list(reversed(diseases)))
+        for disease in diseases:
+            self.assertEqual(after.disease_id(disease['name']), before.disease_id(disease['name']))
+        self.assertEqual(after.match(self.RESULT, compact=True), before.match(self.RESULT, compact=True))
+        self.assertEqual(after.match(self.RESULT)[0]['name'], 'Psoriasis')
+        self.assertNotEqual(after.version, before.version)
+
+        with self.assertRaises(ImproperlyConfigured):
+            Catalog([{'id': 1, 'name': 'A'}, {'id': 1, 'name': 'B'}])
+        with self.assertRaises(ImproperlyConfigured):
+            Catalog([{'name': 'No id'}])
+
+
+class StaticAssetTest(TestCase):
+    def setUp(self):
+        self.root = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.root, ignore_errors=True)
+        os.makedirs(os.path.join(self.root, 'chat', 'js'))
+        for name, content in (('app.js', b'raw'), ('app.js.gz', b'gzip'), ('app.js.br', b'brotli'),
+                              ('app.0123456789ab.js', b'hashed')):
+            with open(os.path.join(self.root, 'chat', 'js', name), 'wb') as f:
+                f.write(content)
+
+    def middleware(self):
+        from django.test import RequestFactory
+
+        from .assets import StaticAssetMiddleware
+
+        with override_settings(STATIC_ROOT=self.root, STATIC_URL='/static/'):
+            middleware = StaticAssetMiddleware(lambda request: None)
+        middleware._hashed = {'chat/js/app.0123456789ab.js'}
+        return middleware, RequestFactory()
+
+    def fetch(self, path, **headers):
+        middleware, factory = self.middleware()
+        response = middleware(factory.get(path, headers=headers))
+        body = b''.join(response.streaming_content) if response.status_code == 200 else b''
+        response.close()
+        return response, body
+
+    def test_negotiates_encoding(self):
+        for accept, encoding, body in (
+            ('gzip, deflate, br', 'br', b'brotli'),
+            ('gzip', 'gzip', b'gzip'),
+            ('br;q=0, gzip', 'gzip', b'gzip'),
+            ('br;q=0.5, gzip;q=0.9', 'gzip', b'gzip'),
+            ('*;q=0.1, br;q=0', 'gzip', b'gzip'),
+            ('gzip;q=0, br;q=0', None, b'raw'),
+            ('identity', None, b'raw'),
+            ('', None, b'raw'),
+        ):
+            with self.subTest(accept=accept):
+                response, content = self.fetch('/static/chat/js/app.js', accept_encoding=accept)
+                self.assertEqual(response.get('Content-Encoding'), encoding)
+                self.assertEqual(content, body)
+                self.assertEqual(response['Vary'], 'Accept-Encoding')
+                self.assertIn('javascript', response['Content-Type'])
+
+    def test_caching(self):
+        from .assets import IMMUTABLE, REVALIDATE
+
+        response, _ = self.fetch('/static/chat/js/app.0123456789ab.js')
+        self.assertEqual(response['Cache-Control'], IMMUTABLE)
+
+        response, _ = self.fetch('/static/chat/js/app.js')
+        self.assertEqual(response['Cache-Control'], REVALIDATE)
+        last_modified = response['Last-Modified']
+        response, _ = self.fetch('/static/chat/js/app.js', if_modified_since=last_modified)
+        self.assertEqual(response.status_code, 304)
+
+        # Fingerprinted files are never revalidated, so always answered in full
+        response, _ = self.fetch('/static/chat/js/app.0123456789ab.js', if_modified_since=last_modified)
+        self.assertEqual(response.status_code, 200)
+
+    def test_falls_through(self):
+        middleware, factory = self.middleware()
+        for request in (factory.get('/static/chat/js/missing.js'), factory.get('/static/../secret'),
+                        factory.post('/static/chat/js/app.js'), factory.get('/api/diseases/')):
+            with self.subTest(path=request.path, method=request.method):
+                self.assertIsNone(middleware(request))
+
+    def test_static_bundle_tag(self):
+        from django.contrib.staticfiles.storage import staticfiles_storage
+        from django.template import Context, Template
+
+        template = Template("{% load assets %}{% static_bundle 'chat/js/chat.bundle.js' %}")
+        members = settings.STATIC_BUNDLES['chat/js/chat.bundle.js']
+
+        with override_settings(DEBUG=True):
+            html = template.render(Context())
+        self.assertEqual(html.count('<script'), len(members))
+        for member in members:
+            self.assertIn(member, html)
+
+        built = {'chat/js/chat.bundle.js': 'chat/js/chat.bundle.0123456789ab.js'}
+        with mock.patch.object(staticfiles_storage, 'hashed_files', built):
+            with override_settings(DEBUG=True):
+                self.assertEqual(template.render(Context()).count('<script'), len(members))
+            with override_settings(DEBUG=False):
+                html = template.render(Context())
+        self.assertEqual(html, '<script src="/static/chat/js/chat.bundle.0123456789ab.js"></script>')
+
+        css = Template("{% load assets %}{% static_bundle 'chat/css/chat.bundle.css' %}")
+        with override_settings(DEBUG=True):
+            self.assertIn('<link rel="stylesheet"', css.render(Context()))
+
+
+@override_settings(
+    CACHES={**settings.CACHES, 'auth': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+                                        'LOCATION': 'token-auth-test'}},
+    TOKEN_AUTH_CACHE={'LOCAL_TTL': 300, 'LOCAL_MAX_ENTRIES': 100, 'SHARED_CACHE': 'auth', 'SHARED_TTL': 300},
+)
+class TokenCacheTest(TestCase):
+    def setUp(self):
+        from django.contrib.auth.models import User
+        from rest_framework.authtoken.models import Token
+
+        from . import authentication
+
+        self.auth = authentication
+        self.addCleanup(self.auth.shared_cache().clear)
+        self.user = User.objects.create_user('alice', password='old-password')
+        self.key = Token.objects.create(user=self.user).key
+        self.client.defaults['HTTP_AUTHORIZATION'] = f'Token {self.key}'
+
+    def cached(self):
+        """(local entry, shared entry) for the test token."""
+        return (self.auth.local_cache().get(self.key),
+                self.auth.shared_cache().get(self.auth.SHARED_KEY_PREFIX + self.key))
+
+    def warm(self):
+        self.assertEqual(self.client.get('/api/conversations/').status_code, 200)
+        self.assertEqual(self.cached(), ((self.user.pk, 'alice', True), (self.user.pk, 'alice', True)))
+
+    def test_cache_holds_no_password_hash(self):
+        import pickle
+
+        self.warm()
+        self.assertNotIn(self.user.password.encode(), pickle.dumps(self.cached()))
+        # A hit runs no query for the user; other fields load on demand
+        with self.assertNumQueries(1):
+            self.assertEqual(self.client.get('/api/conversations/').status_code, 200)
+        user, _ = self.auth.CachedTokenAuthentication().authenticate_credentials(self.key)
+        with self.assertNumQueries(0):
+            self.assertEqual((user.pk, str(user), user.is_active), (self.user.pk, 'alice', True))
+        with self.assertNumQueries(1):
+            self.assertEqual(user.email, '')
+
+        # A worker with a cold local cache is served from the shared one
+        self.auth.local_cache().clear()
+        with self.assertNumQueries(1):
+            self.assertEqual(self.client.get('/api/conversations/').status_code, 200)
+
+    def test_predict_skips_the_user_query_when_cached(self):
+        from django.db import connection
+        from django.test.utils import CaptureQueriesContext
+
+        def predict():
+            with CaptureQueriesContext(connection) as queries:
+                response = self.client.post('/api/chat/predict/', {'message': 'silvery scales'},
+                                            content_type='application/json')
+            self.assertEqual(response.status_code, 200)
+            return [query['sql'] for query in queries]
+
+        with mock.patch('chat.views.classify', return_value=(DiseaseCatalogTest.RESULT, 'model', None)):
+            cold, warm = predict(), predict()
+        # PredictView logs the user, which must not load it again
+        self.assertEqual(sum('auth_user' in sql for sql in cold), 1)
+        self.assertFalse([sql for sql in warm if 'auth_user' in sql or 'authtoken' in sql])
+        self.assertEqual(len(warm), len(cold) - 1)
+
+    def assert_invalidated_by(self, change, status_after=401):
+        self.warm()
+        change()
+        self.assertEqual(self.cached(), (None, None))
+        self.assertEqual(self.client.get('/api/conversations/').status_code, status_after)
+
+    def test_logout_invalidates(self):
+        self.assert_invalidated_by(lambda: self.assertEqual(self.client.post('/api/logout/').status_code, 204))
+
+    def test_deactivation_invalidates(self):
+        def deactivate():
+            self.user.is_active = False
+            self.user.save()
+        self.assert_invalidated_by(deactivate)
+
+    def test_user_deletion_invalidates(self):
+        self.assert_invalidated_by(self.user.delete)
+
+    def test_password_change_invalidates(self):
+        def change_password():
+            self.user.set_password('new-password')
+            self.user.save()
+        # The token stays valid; the next request re-reads the user
+        self.assert_invalidated_by(change_password, status_after=200)
+        self.assertEqual(self.cached(), ((self.user.pk, 'alice', True), (self.user.pk, 'alice', True)))
+
+    def test_bulk_update_with_invalidate_users(self):
+        from django.contrib.auth.models import User
+
+        def bulk_deactivate():
+            User.objects.filter(pk=self.user.pk).update(is_active=False)
+            self.auth.invalidate_users([self.user.pk])
+        self.assert_invalidated_by(bulk_deactivate)
+
+    def test_bulk_update_without_invalidation_waits_for_the_ttl(self):
+        from django.contrib.auth.models import User
+
+        self.warm()
+        User.objects.filter(pk=self.user.pk).update(is_active=False)
+        self.assertEqual(self.client.get('/api/conversations/').status_code, 200)
+        self.auth.local_cache().clear()
+        self.auth.shared_cache().clear()
+        self.assertEqual(self.client.get('/api/conversations/').status_code, 401)
+
+
+class AdmissionTest(TestCase):
+    MESSAGE = "I have an itchy skin rash with red patches"
+
+    def run_in_thread(self, target):
+        import threading
+
+        thread = threading.Thread(target=target, daemon=True)
+        thread.start()
+        self.addCleanup(thread.join, 5)
+        return thread
+
+    def wait_until(self, condition):
+        deadline = time.monotonic() + 5
+        while not condition():
+            self.assertLess(time.monotonic(), deadline, "timed out")
+            time.sleep(0.005)
+
+    def test_queueing_and_shedding(self):
+        import threading
+
+        from .admission import AdmissionController, Overloaded
+
+        controller = AdmissionController(max_in_flight=1, max_queue=1)
+        release, order = threading.Event(), []
+
+        def hold():
+            with controller.admit():
+                order.append('first')
+                release.wait(5)
+
+        def queued():
+            with controller.admit():
+                order.append('second')
+
+        self.run_in_thread(hold)
+        self.wait_until(lambda: controller.in_flight == 1)
+        second = self.run_in_thread(queued)
+        self.wait_until(lambda: controller.queued == 1)
+
+        # Queue full: shed at once, without waiting
+        with self.assertRaises(Overloaded) as shed:
+            with controller.admit():
+                pass
+        self.assertEqual(shed.exception.reason, 'queue_full')
+        self.assertGreaterEqual(shed.exception.retry_after, 1)
+
+        release.set()
+        second.join(5)
+        self.assertEqual(order, ['first', 'second'])
+        snapshot = controller.snapshot()
+        self.assertEqual((snapshot['admitted'], snapshot['max_queue_depth'], snapshot['shed_queue_full']), (2, 1, 1))
+
+    def test_waiter_giving_up_leaves_the_slot_to_the_next(self):
+        import threading
+
+        from .admission import AdmissionController, Overloaded
+
+        controller = AdmissionController(max_in_flight=1, max_queue=2)
+        release, outcomes = threading.Event(), {}
+
+        def hold():
+            with controller.admit():
+                release.wait(5)
+
+        def wait_with(name, deadline):
+            try:
+                with controller.admit(deadline=deadline):
+                    outcomes[name] = 'admitted'
+            except Overloaded as overload:
+                outcomes[name] = overload.reason
+
+        self.run_in_thread(hold)
+        self.wait_until(lambda: controller.in_flight == 1)
+        impatient = self.run_in_thread(lambda: wait_with('impatient', time.time() + 0.1))
+        patient = self.run_in_thread(lambda: wait_with('patient', None))
+        self.wait_until(lambda: controller.queued == 2)
+        impatient.join(5)
+        release.set()
+        patient.join(5)
+        self.assertEqual(outcomes, {'impatient': 'deadline', 'patient': 'admitted'})
+
+    def predict(self, **headers):
+        return self.client.post('/api/chat/predict/', {'message': self.MESSAGE}, content_type='application/json',
+                                headers=headers)
+
+    @override_settings(ADMISSION={'MAX_IN_FLIGHT': 1, 'MAX_QUEUE': 0, 'BUDGET_MS': 0, 'OVERLOAD_ACTION': 'reject'})
+    def test_busy_worker_answers_503_with_retry_after(self):
+        from .admission import get_admission_controller
+
+        controller = get_admission_controller()
+        controller.service_time = 2.0
+        with mock.patch('chat.views.classify') as classify, controller.admit():
+            response = self.predict()
+        self.assertEqual(response.status_code, 503)
+        # One request in flight at ~2 s each
+        self.assertEqual(response['Retry-After'], '2')
+        classify.assert_not_called()
+        self.assertEqual(controller.snapshot()['shed_queue_full'], 1)
+
+    @override_settings(ADMISSION={'MAX_IN_FLIGHT': 1, 'MAX_QUEUE': 8, 'BUDGET_MS': 500, 'OVERLOAD_ACTION': 'reject'})
+    def test_budget_counts_from_request_start(self):
+        from .admission import get_admission_controller
+
+        with mock.patch('chat.views.classify') as classify:
+            response = self.predict(x_request_start=f't={int((time.time() - 1) * 1000)}')
+        self.assertEqual(response.status_code, 503)
+        self.assertIn('Retry-After', response)
+        classify.assert_not_called()
+        self.assertEqual(get_admission_controller().snapshot()['shed_deadline'], 1)
+
+    @override_settings(ADMISSION={'MAX_IN_FLIGHT': 1, 'MAX_QUEUE': 0, 'BUDGET_MS': 0, 'OVERLOAD_ACTION': 'fallback'})
+    def test_fallback_serves_keyword_predictions(self):
+        from .admission import get_admission_controller
+
+        controller = get_admission_controller()
+        with mock.patch('chat.views.classify') as classify, controller.admit():
+            response = self.predict()
+        self.assertEqual(response.status_code, 200)
+        body = response.json()
+        self.assertTrue(body['degraded'])
+        self.assertTrue(body['data']['predictions'])
+        classify.assert_not_called()
+        self.assertEqual(controller.snapshot()['downgraded'], 1)
+
+    @override_settings(METRICS_TOKEN='scrape-secret')
+    def test_metrics_need_staff_or_token(self):
+        from django.contrib.auth.models import User
+
+        self.assertEqual(self.client.get('/api/metrics/').status_code, 403)
+        self.assertEqual(self.client.get('/api/metrics/', headers={'authorization': 'Bearer wrong'}).status_code, 403)
+        self.assertEqual(
+            self.client.get('/api/metrics/', headers={'authorization': 'Bearer scrape-secret'}).status_code, 200
+        )
+        self.client.force_login(User.objects.create_user('user'))
+        self.assertEqual(self.client.get('/api/metrics/').status_code, 403)
+
+        self.client.force_login(User.objects.create_user('ops', is_staff=True))
+        response = self.client.get('/api/metrics/', headers={'accept': 'application/json'})
+        self.assertEqual(response.status_code, 200)
+        self.assertIn('state', response.json()['model_circuit'])
+        self.assertNotIn('last_error', response.json()['model_circuit'])
+
+    @override_settings(METRICS_TOKEN='')
+    def test_empty_metrics_token_is_not_accepted(self):
+        self.assertEqual(self.client.get('/api/metrics/', headers={'authorization': 'Bearer '}).status_code, 403)
+
+
+class CircuitBreakerTest(TestCase):
+    """PredictView with a corrupted model/ directory (config and tokenizer present, weights garbage)."""
+
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.good_model_dir = tempfile.mkdtemp()
+        build_tiny_model(cls.good_model_dir)
+
+    @classmethod
+    def tearDownClass(cls):
+        shutil.rmtree(cls.good_model_dir, ignore_errors=True)
+        super().tearDownClass()
+
+    def setUp(self):
+        self.model_dir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.model_dir, ignore_errors=True)
+        shutil.copy(os.path.join(REPO_MODEL_DIR, 'config.json'), self.model_dir)
+        copy_tokenizer(self.model_dir)
+        with open(os.path.join(self.model_dir, 'model.safetensors'), 'wb') as f:
+            f.write(b'\x00corrupted weights\x00' * 64)
+
+        overrides = override_settings(INFERENCE=dict(
+            settings.INFERENCE, MODEL_DIR=self.model_dir, BREAKER_FAILURES=2, BREAKER_COOLDOWN=0.2,
+        ))
+        overrides.enable()
+        self.addCleanup(overrides.disable)
+
+    def predict(self, message="I have an itchy skin rash with red patches"):
+        return self.client.post('/api/chat/predict/', {'message': message}, content_type='application/json')
+
+    def repair_model(self):
+        os.remove(os.path.join(self.model_dir, 'model.safetensors'))
+        shutil.copy(os.path.join(self.good_model_dir, 'config.json'), self.model_dir)
+        shutil.copy(os.path.join(self.good_model_dir, 'model.safetensors'), self.model_dir)
+
+    def wait_for_probe(self):
+        breaker = inference.get_breaker()
+        deadline = time.monotonic() + 5
+        while breaker._probe_thread is None and time.monotonic() < deadline:
+            time.sleep(0.01)
+        breaker._probe_thread.join(timeout=60)
+
+    def test_corrupted_model_falls_back_to_keyword_engine(self):
+        response = self.predict()
+        self.assertEqual(response.status_code, 200)
+        body = response.json()
+        self.assertEqual(body['status'], 'success')
+        self.assertTrue(body['degraded'])
+        self.assertTrue(body['data']['predictions'])
+
+    def test_breaker_opens_and_stops_reloading(self):
+        with mock.patch.object(inference, 'load_classifier', wraps=inference.load_classifier) as load:
+            for _ in range(6):
+                self.assertEqual(self.predict().status_code, 200)
+        # Only the first BREAKER_FAILURES requests pay for a load attempt
+        self.assertEqual(load.call_count, 2)
+        self.assertEqual(inference.get_breaker().state, inference.CircuitBreaker.OPEN)
+
+    def test_background_probe_recovers(self):
+        self.predict()
+        self.predict()
+        self.assertEqual(inference.get_breaker().state, inference.CircuitBreaker.OPEN)
+
+        self.repair_model()
+        time.sleep(0.25)
+        # This request starts the probe but is still served by the fallback
+        self.assertTrue(self.predict().json()['degraded'])
+        self.wait_for_probe()
+
+        self.assertEqual(inference.get_breaker().state, inference.CircuitBreaker.CLOSED)
+        self.assertNotIn('degraded', self.predict().json())
+
+    def test_failed_probe_reopens_with_longer_cooldown(self):
+        self.predict()
+        self.predict()
+        time.sleep(0.25)
+        self.predict()
+        self.wait_for_probe()
+
+        breaker = inference.get_breaker()
+        self.assertEqual(breaker.state, inference.CircuitBreaker.OPEN)
+        self.assertAlmostEqual(breaker.cooldown, 0.4)
+
+    def test_predict_symptoms_endpoint_uses_catalog(self):
+        response = self.client.post(
+            '/api/api/predict-symptoms/', {'symptoms': 'itchy skin rash with red patches'}, content_type='application/json'
+        )
+        self.assertEqual(response.status_code, 200)
+        self.assertIn('disease', response.json()['data'])
+
+
+class SimilarCasesTest(TestCase):
+    """Similar-case retrieval from the prediction's own forward pass."""
+
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        from .inference import forward, load_classifier
+        from .similar import model_fingerprint, write_index
+
+        cls.model_dir = tempfile.mkdtemp()
+        cls.index_dir = tempfile.mkdtemp()
+        build_tiny_model(cls.model_dir)
+        cls.cases = [
+            ('Psoriasis', 'My elbows have dry, red patches that flake constantly.'),
+            ('Migraine', 'A throbbing headache on one side with sensitivity to light.'),
+            ('Common Cold', 'Runny nose, sneezing and a mild sore throat.'),
+        ]
+        classifier = load_classifier(cls.model_dir)
+        cls.embeddings = forward(classifier, [text for _, text in cls.cases])[1]
+        write_index(cls.index_dir, cls.embeddings, cls.cases, model_fingerprint(cls.model_dir))
+
+    @classmethod
+    def tearDownClass(cls):
+        shutil.rmtree(cls.model_dir, ignore_errors=True)
+        shutil.rmtree(cls.index_dir, ignore_errors=True)
+        super().tearDownClass()
+
+    def setUp(self):
+        overrides = override_settings(
+            INFERENCE=dict(settings.INFERENCE, MODEL_DIR=self.model_dir),
+            SIMILAR_CASES=dict(settings.SIMILAR_CASES, INDEX_DIR=self.index_dir, TOP_K=2),
+        )
+        overrides.enable()
+        self.addCleanup(overrides.disable)
+
+    def test_forward_matches_pipeline(self):
+        from .inference import forward, get_classifier
+
+        text = self.cases[0][1]
+        expected = get_classifier()(text, truncation=True)
+        result, embeddings = forward(get_classifier(), [text])
+        self.assertEqual([p['label'] for p in result[0]], [p['label'] for p in expected[0]])
+        self.assertAlmostEqual(result[0][0]['score'], expected[0][0]['score'], places=5)
+        self.assertAlmostEqual(float((embeddings[0] ** 2).sum()), 1.0, places=5)
+
+    def test_predict_returns_similar_cases(self):
+        response = self.client.post(
+            '/api/chat/predict/', {'message': self.cases[1][1], 'similar': True}, content_type='application/json'
+        )
+        similar = response.json()['data']['similar_cases']
+        self.assertEqual(len(similar), 2)
+        self.assertEqual(similar[0]['label'], 'Migraine')
+        self.assertAlmostEqual(similar[0]['score'], 1.0, places=3)
+
+    def test_similar_cases_are_opt_in(self):
+        response = self.client.post('/api/chat/predict/', {'message': self.cases[1][1]}, content_type='application/json')
+        self.assertNotIn('similar_cases', response.json()['data'])
+
+    def test_ivf_index_finds_exact_neighbours(self):
+        import numpy as np
+        from .similar import CaseIndex, write_index
+
+        rng = np.random.default_rng(0)
+        vectors = rng.normal(size=(500, 16)).astype(np.float32)
+        vectors /= np.linalg.norm(vectors, axis=1, keepdims=True)
+        cases = [(f'label-{i}', f'text {i}') for i in range(len(vectors))]
+        path = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, path, ignore_errors=True)
+        write_index(path, vectors, cases, 'test', ivf_min_cases=100, nlist=10)
+
+        # Probing every list is an exact search over the reordered rows
+        index = CaseIndex.load(path, nprobe=10)
+        self.assertEqual(index.meta['kind'], 'ivf')
+        for i in (0, 123, 499):
+            self.assertEqual(index.search(vectors[i], k=1)[0]['label'], f'label-{i}')
+
+    def test_rebuild_leaves_mapped_index_intact(self):
+        import numpy as np
+        from .similar import CaseIndex, write_index
+
+        path = os.path.join(tempfile.mkdtemp(), 'index')
+        self.addCleanup(shutil.rmtree, os.path.dirname(path), ignore_errors=True)
+        old = np.eye(4, dtype=np.float32)
+        write_index(path, old, [('old', str(i)) for i in range(4)], 'first')
+        mapped = CaseIndex.load(path)
+
+        write_index(path, old[::-1].copy(), [('new', str(i)) for i in range(4)], 'second')
+        np.testing.assert_array_equal(mapped.embeddings, old)
+        self.assertEqual(mapped.search(old[0], k=1)[0], {'label': 'old', 'text': '0', 'score': 1.0})
+        self.assertEqual(CaseIndex.load(path).meta['model'], 'second')
+        self.assertEqual(os.listdir(os.path.dirname(path)), ['index'])
+
+    def test_fingerprint_follows_weight_content(self):
+        from .similar import model_fingerprint
+
+        model_dir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, model_dir, ignore_errors=True)
+        shutil.copy(os.path.join(self.model_dir, 'config.json'), model_dir)
+        weights = os.path.join(model_dir, 'model.safetensors')
+        with open(weights, 'wb') as f:
+            f.write(b'\x00' * 1024)
+        before = model_fingerprint(model_dir)
+        self.assertEqual(model_fingerprint(model_dir), before)
+
+        # Same size, different bytes (e.g. a fine-tuned copy put in place)
+        stat = os.stat(weights)
+        with open(weights, 'r+b') as f:
+            f.write(b'\x01')
+        os.utime(weights, ns=(stat.st_atime_ns, stat.st_mtime_ns + 1))
+        self.assertNotEqual(model_fingerprint(model_dir), before)
+
+    def test_index_for_another_model_is_ignored(self):
+        from .similar import get_case_index
+
+        with override_settings(INFERENCE=dict(settings.INFERENCE, MODEL_DIR=REPO_MODEL_DIR)):
+            self.assertIsNone(get_case_index())
+        self.assertIsNotNone(get_case_index())
+
+
+class ShadowModelTest(TestCase):
+    """Shadow models score predict traffic in background processes."""
+
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.model_dir = tempfile.mkdtemp()
+        build_tiny_model(cls.model_dir)
+
+    @classmethod
+    def tearDownClass(cls):
+        shutil.rmtree(cls.model_dir, ignore_errors=True)
+        super().tearDownClass()
+
+    def setUp(self):
+        store_dir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, store_dir, ignore_errors=True)
+        self.store = os.path.join(store_dir, 'shadow.sqlite3')
+        overrides = override_settings(
+            INFERENCE=dict(settings.INFERENCE, MODEL_DIR=self.model_dir),
+            SHADOW_MODELS=dict(
+                settings.SHADOW_MODELS, STORE=self.store, QUEUE_SIZE=8,
+                # The primary itself must agree with the primary; a missing model only logs errors
+                MODELS={'same': self.model_dir, 'missing': os.path.join(store_dir, 'nope')},
+            ),
+        )
+        overrides.enable()
+        self.addCleanup(overrides.disable)
+
+    def test_shadow_results_are_stored(self):
+        from .management.commands.shadow_report import summarise
+        from .shadow import get_shadow_pool, open_store
+
+        for message in ('itchy red rash on my elbows', 'throbbing headache and nausea', 'runny nose'):
+            response = self.client.post('/api/chat/predict/', {'message': message}, content_type='application/json')
+            self.assertEqual(response.status_code, 200)
+        pool = get_shadow_pool()
+        self.assertEqual(pool.snapshot()['submitted'], 3)
+        pool.join(timeout=120)
+
+        report = summarise(open_store(self.store))
+        self.assertEqual(report['same']['scored'], 3)
+        self.assertEqual(report['same']['agreement'], 1.0)
+        self.assertEqual(report['same']['topk_overlap'], 1.0)
+        self.assertEqual(report['missing']['errors'], 3)
+
+    def test_full_queue_drops_instead_of_blocking(self):
+        from .shadow import ShadowPool
+
+        pool = ShadowPool({'same': self.model_dir}, self.store, queue_size=1)
+        # No dispatcher consuming yet: the second submit finds the queue full
+        pool._dispatcher = object()
+        result = [[{'label': 'Migraine', 'score': 0.9}]]
+        self.assertTrue(pool.submit('a', result, 1.0))
+        self.assertFalse(pool.submit('b', result, 1.0))
+        self.assertEqual(pool.snapshot()['dropped'], 1)
+
+    def test_dead_worker_pool_is_replaced(self):
+        from concurrent.futures import Future
+        from concurrent.futures.process import BrokenProcessPool
+
+        from .management.commands.shadow_report import summarise
+        from .shadow import ShadowPool, open_store
+
+        class Executor:
+            """Runs nothing; the process scoring 'crashes' dies, which breaks the pool."""
+
+            def __init__(self):
+                self.broken = False
+                self.scored = []
+
+            def submit(self, fn, *args):
+                if self.broken:
+                    raise BrokenProcessPool('A process in the process pool was terminated abruptly')
+                future = Future()
+                if args[0] == 'crashes':
+                    self.broken = True
+                    future.set_exception(BrokenProcessPool('A process in the process pool was terminated abruptly'))
+                else:
+                    self.scored.append(args[0])
+                    future.set_result(1)
+                return future
+
+            def shutdown(self, wait=True, cancel_futures=False):
+                pass
+
+        first, second = Executor(), Executor()
+        pool = ShadowPool({'same': self.model_dir, 'other': self.model_dir}, self.store, workers=1)
+        result = [[{'label': 'Migraine', 'score': 0.9}]]
+        with mock.patch.object(pool, '_start_executor', side_effect=[first, second]):
+            for text in ('before', 'crashes', 'after the crash', 'later'):
+                pool.submit(text, result, 1.0)
+            pool.join(timeout=10)
+        # The input that found the pool broken is resubmitted to the new one, not counted as failed
+        self.assertFalse(pool._dispatcher.is_alive())
+        self.assertEqual((first.scored, second.scored), (['before'], ['after the crash', 'later']))
+        self.assertEqual(pool.snapshot()['failed'], 1)
+        report = summarise(open_store(self.store))
+        self.assertEqual({name: stats['errors'] for name, stats in report.items()}, {'same': 1, 'other': 1})
+
+    def test_input_failing_on_a_fresh_pool_is_counted(self):
+        from concurrent.futures.process import BrokenProcessPool
+
+        from .shadow import ShadowPool
+
+        broken = mock.Mock(**{'submit.side_effect': BrokenProcessPool('terminated abruptly')})
+        pool = ShadowPool({'same': self.model_dir}, self.store, workers=1)
+        with mock.patch.object(pool, '_start_executor', return_value=broken):
+            for text in ('a', 'b'):
+                pool.submit(text, [[{'label': 'Migraine', 'score': 0.9}]], 1.0)
+            pool.join(timeout=10)
+        # One slot: had a failure kept it, the second input would never be dispatched
+        self.assertFalse(pool._dispatcher.is_alive())
+        self.assertEqual(pool.snapshot()['failed'], 2)
+
+    def test_no_shadow_models_configured(self):
+        from .shadow import get_shadow_pool
+
+        with override_settings(SHADOW_MODELS=dict(settings.SHADOW_MODELS, MODELS={})):
+            self.assertIsNone(get_shadow_pool())
+
+
+class HistoryExportTest(TestCase):
+    """Streaming NDJSON/CSV export of a user's messages."""
+
+    # Messages in the memory check, which is skipped unless this is set: EXPORT_TEST_MESSAGES=200000
+    # (a few minutes with 2000000). manage.py bench_export measures the same at any size.
+    LARGE_HISTORY = int(os.environ.get('EXPORT_TEST_MESSAGES', 0))
+
+    def setUp(self):
+        from django.contrib.auth.models import User
+        from rest_framework.authtoken.models import Token
+
+        from .models import Conversation, Message
+
+        self.user = User.objects.create_user(username='exporter', password='x')
+        self.client.defaults['HTTP_AUTHORIZATION'] = f'Token {Token.objects.create(user=self.user).key}'
+        conversation = Conversation.objects.create(user=self.user, title='Rash, "itchy"')
+        Message.objects.create(conversation=conversation, is_user=True, text='Red patches,\nitchy and "dry"')
+        Message.objects.create(conversation=conversation, is_user=False, text='{"predictions": [{"id": 3}]}')
+        other = User.objects.create_user(username='someone-else')
+        Message.objects.create(conversation=Conversation.objects.create(user=other), text='not mine')
+
+    def export(self, query=''):
+        response = self.client.get(f'/api/conversations/export/{query}')
+        self.assertEqual(response.status_code, 200)
+        self.assertTrue(response.streaming)
+        return response, b''.join(response.streaming_content)
+
+    def test_ndjson(self):
+        import json
+
+        response, body = self.export()
+        self.assertEqual(response['Content-Type'], 'application/x-ndjson; charset=utf-8')
+        self.assertIn('attachment; filename="conversations-', response['Content-Disposition'])
+        records = [json.loads(line) for line in body.decode('utf-8').splitlines()]
+        self.assertEqual([r['text'] for r in records], ['Red patches,\nitchy and "dry"', '{"predictions": [{"id": 3}]}'])
+        self.assertEqual(records[0]['conversation_title'], 'Rash, "itchy"')
+        self.assertEqual([r['is_user'] for r in records], [True, False])
+
+    def test_csv_gzip(self):
+        import csv
+        import gzip
+        import io
+
+        response, body = self.export('?fmt=csv&gzip=1')
+        self.assertEqual(response['Content-Type'], 'application/gzip')
+        self.assertTrue(response['Content-Disposition'].endswith('.csv.gz"'))
+        rows = list(csv.DictReader(io.StringIO(gzip.decompress(body).decode('utf-8'))))
+        self.assertEqual(len(rows), 2)
+        self.assertEqual(rows[0]['text'], 'Red patches,\nitchy and "dry"')
+        self.assertEqual(rows[0]['conversation_title'], 'Rash, "itchy"')
+        self.assertEqual([r['is_user'] for r in rows], ['1', '0'])
+
+    def test_rejects_unknown_format_and_anonymous(self):
+        self.assertEqual(self.client.get('/api/conversations/export/?fmt=xml').status_code, 400)
+        del self.client.defaults['HTTP_AUTHORIZATION']
+        self.assertEqual(self.client.get('/api/conversations/export/').status_code, 401)
+
+    def create_history(self, total, per_conversation, batch=20000):
+        from .models import Conversation, Message
+
+        for start in range(0, total, batch):
+            size = min(batch, total - start)
+            conversations = Conversation.objects.bulk_create(
+                Conversation(user=self.user, title=f'Conversation {start + i}')
+                for i in range(-(-size // per_conversation))
+            )
+            Message.objects.bulk_create(
+                Message(conversation=conversations[i // per_conversation], is_user=i % 2 == 0,
+                        text=f'Message {start + i}: fever, headache and a dry cough for three days')
+                for i in range(size)
+            )
+
+    def test_rows_span_many_chunks(self):
+        import json
+
+        from .export import export_stream
+        from .models import Conversation
+
+        # A conversation without messages, between the fixture's and the generated ones, is skipped by the merge
+        Conversation.objects.create(user=self.user, title='Empty')
+        self.create_history(300, per_conversation=7)
+
+        with mock.patch('chat.views.export_stream', lambda *args: export_stream(*args, chunk_size=16)):
+            _, body = self.export()
+        records = [json.loads(line) for line in body.decode('utf-8').splitlines()]
+        self.assertEqual(len(records), 302)
+        generated = records[2:]
+        self.assertEqual([r['text'].split(':')[0] for r in generated], [f'Message {i}' for i in range(300)])
+        self.assertEqual(
+            [r['conversation_title'] for r in generated], [f'Conversation {i // 7}' for i in range(300)]
+        )
+
+    @skipUnless(LARGE_HISTORY, "set EXPORT_TEST_MESSAGES to check memory on a large history")
+    def test_large_history_streams_in_constant_memory(self):
+        import tracemalloc
+        import zlib
+
+        total = self.LARGE_HISTORY
+        self.create_history(total, per_conversation=50)
+
+        for query in ('', '?fmt=csv&gzip=1'):
+            tracemalloc.start()
+            response = self.client.get(f'/api/conversations/export/{query}')
+            compressed = query.endswith('gzip=1')
+            decompressor = zlib.decompressobj(31)
+            lines = 0
+            for chunk in response.streaming_content:
+                lines += (decompressor.decompress(chunk) if compressed else chunk).count(b'\n')
+            _, peak = tracemalloc.get_traced_memory()
+            tracemalloc.stop()
+            # Plus the two fixture messages; the CSV also has a header and the fixture's quoted newline
+            self.assertEqual(lines, total + 2 + (2 if compressed else 0))
+            self.assertLess(peak, 32 * 1024 * 1024)
+
+
+class LoadTestHarnessTest(LiveServerTestCase):
+    """manage.py loadtest against a live server running a tiny model."""
+
+    @classmethod
+    def setUpClass(cls):
+        cls.model_dir = tempfile.mkdtemp()
+        build_tiny_model(cls.model_dir)
+        cls.overrides = override_settings(INFERENCE=dict(settings.INFERENCE, MODEL_DIR=cls.model_dir))
+        cls.overrides.enable()
+        super().setUpClass()
+
+    @classmethod
+    def tearDownClass(cls):
+        super().tearDownClass()
+        cls.overrides.disable()
+        shutil.rmtree(cls.model_dir, ignore_errors=True)
+
+    def test_conversation_action_never_sends_a_prediction(self):
+        import random
+
+        from .management.commands.loadtest import Recorder, Session
+
+        session = Session('http://testserver', [('Migraine', 'headache')], Recorder(), random.Random(0), 5)
+        sent = []
+        conversations = []
+
+        def request(endpoint, method, path, body=None):
+            sent.append((endpoint, path))
+            return 200, conversations
+
+        with mock.patch.object(session, 'request', side_effect=request):
+            # No conversation yet, and none on the server: only the list is fetched
+            session.act('conversation', new_conversation=0)
+            conversations.append({'id': 7, 'title': 'Headache'})
+            session.act('conversation', new_conversation=0)
+            session.act('conversation', new_conversation=0)
+        self.assertEqual(sent, [
+            ('conversations', '/api/conversations/'),
+            ('conversations', '/api/conversations/'), ('conversation', '/api/conversations/7/'),
+            ('conversation', '/api/conversations/7/'),
+        ])
+
+    def test_malformed_mix(self):
+        from django.core.management import CommandError
+
+        from .management.commands.loadtest import parse_mix
+
+        self.assertEqual(parse_mix('predict=3, conversation=1'), {'predict': 3.0, 'conversation': 1.0})
+        for mix in ('predict=3,conversation=x', 'predict', 'predict=1,delete_all=-1', 'predict=1,search=1'):
+            with self.subTest(mix=mix), self.assertRaises(CommandError):
+                parse_mix(mix)
+
+    def test_register_is_public(self):
+        response = self.client.post('/api/register/', {'username': 'new-user', 'password': 'pw'})
+        self.assertEqual(response.status_code, 200)
+        self.assertIn('token', response.json())
+
+    def test_sessions_and_report(self):
+        import io
+        import json
+
+        from django.core.management import call_command
+
+        output_dir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, output_dir, ignore_errors=True)
+        options = dict(
+            url=self.live_server_url, users=2, ramp='linear', ramp_time=1, duration=4, think_time=0,
+            mix='predict=4,conversations=2,conversation=2,delete_all=1', output_dir=output_dir, stdout=io.StringIO(),
+        )
+        call_command('loadtest', label='first', **options)
+        call_command('loadtest', label='second', compare=os.path.join(output_dir, 'first.json'), **options)
+
+        with open(os.path.join(output_dir, 'second.json')) as f:
+            report = json.load(f)
+        self.assertEqual(report['overall']['sessions'], 2)
+        self.assertEqual(report['endpoints']['register']['requests'], 2)
+        for name in ('register', 'login', 'predict', 'conversations', 'conversation', 'delete_all'):
+            self.assertIn(name, report['endpoints'])
+            self.assertEqual(report['endpoints'][name]['error_rate'], 0, report['endpoints'][name])
+        self.assertIn('predict', report['comparison']['endpoints'])
+        self.assertTrue(os.path.exists(os.path.join(output_dir, 'second.html')))
@@ -3,6 +3,8 @@ from rest_framework.routers import DefaultRouter
 from .views import (
     ConversationViewSet, 
     PredictView, 
+    DiseaseCatalogView,
+    predict_metrics,
     predict_symptoms,
     chat_view, 
     welcome_view, 
@@ -26,10 +28,14 @@ urlpatterns = [
     # Single conversation retrieval endpoint
     path('conversations/<int:conversation_id>/', ConversationDetailView.as_view(), name='conversation_detail'),
     
+    # Versioned disease catalog that compact predictions refer to by id
+    path('diseases/', DiseaseCatalogView.as_view(), name='disease_catalog'),
+
     # This is the primary prediction endpoint called by the frontend.
     path('chat/predict/', PredictView.as_view(), name='predict_view'),  # Legacy endpoint
     path('api/chat/predict/', PredictView.as_view(), name='predict_symptoms'),  # New endpoint
     path('api/predict-symptoms/', predict_symptoms, name='predict_symptoms_function'),  # Alternative endpoint
+    path('metrics/', predict_metrics, name='predict_metrics'),  # Queue depth / shed counts of this worker
 
     # UI patterns for rendering HTML pages.
     # These are matched when included from the root urls.py without the /api/ prefix.
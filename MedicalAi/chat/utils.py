@@ -1,6 +1,8 @@
 # chat/utils.py
+import csv
 import json
 import os
+import random
 from django.conf import settings
 
 def load_disease_data():
@@ -32,3 +34,14 @@ def load_disease_data():
     error_msg = "Could not find disease data file. Tried the following paths:\n"
     error_msg += "\n".join([f"- {p} (exists: {os.path.exists(p)})" for p in possible_paths])
     raise FileNotFoundError(error_msg)
+
+
+def load_symptom_cases(filename='AugmentedSymptom2Disease.csv', limit=None, seed=42):
+    """Load (label, text) pairs from the training dataset, optionally a random sample."""
+    path = os.path.join(settings.DATASET_DIR, filename)
+    # utf-8-sig strips the BOM at the start of AugmentedSymptom2Disease.csv
+    with open(path, newline='', encoding='utf-8-sig') as f:
+        cases = [(row['label'], row['text']) for row in csv.DictReader(f)]
+    if limit and limit < len(cases):
+        cases = random.Random(seed).sample(cases, limit)
+    return cases
@@ -7,8 +7,6 @@ from rest_framework.authtoken.models import Token
 from rest_framework.permissions import IsAuthenticated, AllowAny
 from rest_framework import status
 from rest_framework.decorators import api_view, permission_classes, action, authentication_classes
-from rest_framework.authentication import TokenAuthentication
-from transformers import pipeline
 import os
 import json
 from django.utils.decorators import method_decorator
@@ -16,12 +14,17 @@ from django.views.decorators.csrf import csrf_exempt
 from django.shortcuts import get_object_or_404
 
 from .models import Conversation, Message
-from .utils import load_disease_data
+from .authentication import CachedTokenAuthentication
 from .serializers import ConversationDetailSerializer
+from .search import search_conversations
 
 
 # 🟢 Register
+@method_decorator(csrf_exempt, name="dispatch")
 class RegisterView(APIView):
+    authentication_classes = []  # allow unauthenticated access
+    permission_classes = []  # allow unauthenticated access
+
     def post(self, request):
         username = request.data.get("username")
         password = request.data.get("password")
@@ -53,7 +56,7 @@ class LoginView(APIView):
 
 # 🟢 Logout
 class LogoutView(APIView):
-    authentication_classes = [TokenAuthentication]
+    authentication_classes = [CachedTokenAuthentication]
     permission_classes = [IsAuthenticated]
 
     def post(self, request):
@@ -75,12 +78,14 @@ from django.utils.timezone import now
 from rest_framework import viewsets, permissions
 from .models import Conversation
 from .serializers import ConversationSerializer
+from django.http import StreamingHttpResponse
+from .export import FORMATS as EXPORT_FORMATS, export_stream
 
 
 class ConversationViewSet(viewsets.ModelViewSet):
     queryset = Conversation.objects.all().prefetch_related("messages")
     serializer_class = ConversationSerializer
-    authentication_classes = [TokenAuthentication]
+    authentication_classes = [CachedTokenAuthentication]
     permission_classes = [permissions.IsAuthenticated]
 
     def get_queryset(self):
@@ -110,50 +115,118 @@ class ConversationViewSet(viewsets.ModelViewSet):
                 status=status.HTTP_500_INTERNAL_SERVER_ERROR
             )
 
+    @action(detail=False, methods=['get'])
+    def search(self, request):
+        """Ranked full-text search over the user's conversation titles and messages."""
+        query = request.query_params.get('q', '').strip()
+        try:
+            page = max(1, int(request.query_params.get('page', 1)))
+            page_size = min(100, max(1, int(request.query_params.get('page_size', 20))))
+        except ValueError:
+            return Response(
+                {'error': 'page and page_size must be integers'},
+                status=status.HTTP_400_BAD_REQUEST
+            )
 
-# 🟢 Predict
-from django.contrib.auth.models import User
-from django.contrib.auth import authenticate
-from rest_framework.views import APIView
-from rest_framework.response import Response
-from rest_framework.authtoken.models import Token
-from rest_framework.permissions import IsAuthenticated
-from rest_framework import status
-from transformers import (
-    AutoTokenizer,
-    AutoModelForSequenceClassification,
-    TextClassificationPipeline,
-)
-import os
+        total, hits = search_conversations(request.user, query, page=page, page_size=page_size)
+        return Response({
+            'query': query,
+            'count': total,
+            'page': page,
+            'page_size': page_size,
+            'results': hits,
+        })
+
+    @action(detail=False, methods=['get'])
+    def export(self, request):
+        """Stream the user's whole history, one record per message (?fmt=ndjson|csv, ?gzip=1)."""
+        fmt = request.query_params.get('fmt', 'ndjson').lower()
+        if fmt not in EXPORT_FORMATS:
+            return Response(
+                {'error': f"fmt must be one of: {', '.join(EXPORT_FORMATS)}"},
+                status=status.HTTP_400_BAD_REQUEST
+            )
+        compress = request.query_params.get('gzip', '').lower() in ('1', 'true', 'yes')
+
+        filename = f"conversations-{request.user.pk}-{now():%Y%m%d}.{fmt}"
+        if compress:
+            filename += '.gz'
+        response = StreamingHttpResponse(
+            export_stream(request.user, fmt, compress),
+            content_type='application/gzip' if compress else f'{EXPORT_FORMATS[fmt]}; charset=utf-8',
+        )
+        response['Content-Disposition'] = f'attachment; filename="{filename}"'
+        response['Cache-Control'] = 'private, no-store'
+        return response
 
-from .models import Conversation, Message
-from .utils import load_disease_data
-from transformers import AutoTokenizer, AutoModelForSequenceClassification
-from transformers.pipelines import TextClassificationPipeline
-import torch
-
-from transformers import (
-    AutoTokenizer,
-    AutoModelForSequenceClassification,
-    TextClassificationPipeline,
-)
-import torch
-
-from transformers import (
-    AutoConfig,
-    AutoTokenizer,
-    AutoModelForSequenceClassification,
-    TextClassificationPipeline,
-)
-import os
+
+# 🟢 Disease catalog
+from django.http import HttpResponse, HttpResponseNotModified
+from django.utils.http import parse_etags
+from .catalog import get_catalog
+
+
+class DiseaseCatalogView(APIView):
+    """
+    The disease records that compact predictions refer to by id.
+
+    Served with a strong ETag derived from the content. Requests that pin the
+    version (`?v=<version>`) get a year-long immutable cache lifetime; plain
+    requests are revalidated and answered with 304 when unchanged.
+    """
+    authentication_classes = []
+    permission_classes = [AllowAny]
+
+    def get(self, request):
+        catalog = get_catalog()
+        if request.query_params.get('v') == catalog.version:
+            cache_control = 'public, max-age=31536000, immutable'
+        else:
+            cache_control = 'public, no-cache'
+
+        # If-None-Match uses the weak comparison: W/"x" matches "x"
+        etags = {etag.removeprefix('W/') for etag in parse_etags(request.headers.get('If-None-Match', ''))}
+        if '*' in etags or catalog.etag in etags:
+            response = HttpResponseNotModified()
+        else:
+            response = HttpResponse(catalog.body, content_type='application/json')
+        response['ETag'] = catalog.etag
+        response['Cache-Control'] = cache_control
+        response['X-Catalog-Version'] = catalog.version
+        return response
+
+
+# 🟢 Predict
+import time
+from django.conf import settings
+from .admission import Overloaded, get_admission_controller, request_deadline
+from .inference import classify, get_breaker, keyword_classifier
+from .similar import get_case_index
+from .shadow import get_shadow_pool
 
 
 @method_decorator(csrf_exempt, name="dispatch")
 class PredictView(APIView):
-    authentication_classes = [TokenAuthentication]
+    authentication_classes = [CachedTokenAuthentication]
     permission_classes = [AllowAny]
 
     def post(self, request):
+        # Bounded concurrency per worker; shed or downgrade when overloaded
+        admission = get_admission_controller()
+        try:
+            with admission.admit(deadline=request_deadline(request)):
+                return self.predict(request)
+        except Overloaded as overload:
+            print(f"⚠️ Predict overloaded ({overload.reason}), queue: {admission.snapshot()['queue_depth']}")
+            if settings.ADMISSION.get('OVERLOAD_ACTION') == 'fallback':
+                admission.record_downgrade()
+                return self.predict(request, degraded=True)
+            return Response({
+                'status': 'error',
+                'message': 'The server is busy. Please try again in a moment.'
+            }, status=status.HTTP_503_SERVICE_UNAVAILABLE, headers={'Retry-After': str(overload.retry_after)})
+
+    def predict(self, request, degraded=False):
         try:
             # Get data from request with fallbacks
             data = request.data
@@ -169,6 +242,10 @@ class PredictView(APIView):
             
             message = data.get("message") or data.get("symptoms", "")
             conv_id = data.get("conversation_id")
+            # Compact mode: predictions reference /api/diseases/ by id instead of embedding records
+            compact = str(data.get("compact", request.query_params.get("compact", ""))).lower() in ("1", "true", "yes")
+            # Similar cases: nearest training examples to the message, from the prediction's own forward pass
+            similar = str(data.get("similar", request.query_params.get("similar", ""))).lower() in ("1", "true", "yes")
             user = request.user if request.user.is_authenticated else None
             print("📥 Raw request data:", data)
             print("💬 Extracted message:", message)
@@ -212,92 +289,76 @@ class PredictView(APIView):
                     print(f"❌ Error handling conversation: {str(e)}")
                     # Continue without conversation handling if there's an error
 
-            try:
-                # Load model and make prediction
-                model_path = os.path.abspath(os.path.join(os.path.dirname(__file__), "../../model"))
-                if not os.path.isdir(model_path) or not os.path.exists(os.path.join(model_path, "config.json")):
-                    print(f"Model not found at path: {model_path}")
-                    # Fall back to simple keyword matching if model is not available
-                    raise Exception("Model not found, using fallback matching")
-                
-                # Load model and tokenizer
-                tokenizer = AutoTokenizer.from_pretrained(model_path, local_files_only=True)
-                config = AutoConfig.from_pretrained(model_path, local_files_only=True)
-                model = AutoModelForSequenceClassification.from_pretrained(
-                    model_path, config=config, local_files_only=True
-                )
-                classifier = TextClassificationPipeline(
-                    model=model, 
-                    tokenizer=tokenizer, 
-                    return_all_scores=True, 
-                    top_k=3, 
-                    device=-1
-                )
-                
-                # Make prediction
-                result = classifier(message)
-                
-                # Match with disease data
-                diseases = load_disease_data()
-                matched = []
-                for disease_scores in result:
-                    for r in disease_scores:
-                        name = r["label"]
-                        match = next((d for d in diseases if d.get("name", "").lower() == name.lower()), None)
-                        if match:
-                            match["confidence"] = round(r["score"] * 100, 2)
-                            matched.append(match)
-                
-                # Format response
-                if matched:
-                    # The main JS logic expects an array of predictions
-                    response_data = {
-                        'status': 'success',
-                        'data': {
-                            'predictions': matched,  # Pass the list of matched diseases
-                            'conversation_id': str(conv_id) if conv_id else None
-                        },
-                        'conversation_id': str(conv_id) if conv_id else None,
-                        'is_new_conversation': is_new_conversation
-                    }
-                else:
-                    response_data = {
-                        'status': 'not_found',
-                        'message': 'No matching conditions found. Please provide more details about your symptoms.',
-                        'conversation_id': str(conv_id) if conv_id else None,
-                        'is_new_conversation': is_new_conversation
-                    }
-                
-                # Save messages if we have a conversation
-                if conversation:
-                    print("🟢 Saving user and AI messages to conversation:", conversation.id)
-                    try:
-                        # Create user message
-                        user_msg = Message.objects.create(conversation=conversation, is_user=True, text=message)
-                        print("✅ Saved user message:", user_msg.text)
-
-                        # Create AI message
-                        ai_message_text = json.dumps(response_data['data']) if 'data' in response_data else response_data.get('message', '')
-                        ai_msg = Message.objects.create(
-                            conversation=conversation, 
-                            is_user=False, 
-                            text=ai_message_text
-                        )
-                        print("✅ Saved AI message:", ai_msg.text)
-
-                    except Exception as e:
-                        print(f"Error saving messages: {str(e)}")
-                print("User:", user)
-                print("Conversation ID:", conversation.id if conversation else None)
-                print("Messages count:", conversation.messages.count() if conversation else "N/A")
-                print("📤 [RESPONSE] Sending response data:", response_data)
-                return Response(response_data)
-                
-            except Exception as model_error:
-                print(f"Model prediction error, falling back to simple matching: {str(model_error)}")
-                # Fall back to the predict_symptoms function
-                return predict_symptoms(request)
-                
+            # Make prediction: the model sits behind a circuit breaker and is replaced by
+            # the keyword engine while it is failing; requests shed under load skip it
+            embedding = None
+            if degraded:
+                result, engine = keyword_classifier(message), 'keyword'
+            else:
+                started = time.perf_counter()
+                result, engine, embedding = classify(message, embed=similar and get_case_index() is not None)
+                # Candidate models score the same input in the background (no-op unless SHADOW_MODELS is set)
+                shadow_pool = get_shadow_pool()
+                if shadow_pool is not None and engine == 'model':
+                    shadow_pool.submit(message, result, (time.perf_counter() - started) * 1000)
+            
+            # Match with disease data
+            catalog = get_catalog()
+            matched = catalog.match(result, compact=compact)
+            
+            # Format response
+            if matched:
+                # The main JS logic expects an array of predictions
+                response_data = {
+                    'status': 'success',
+                    'data': {
+                        'predictions': matched,  # Pass the list of matched diseases
+                        'conversation_id': str(conv_id) if conv_id else None
+                    },
+                    'conversation_id': str(conv_id) if conv_id else None,
+                    'is_new_conversation': is_new_conversation
+                }
+                if engine != 'model':
+                    response_data['degraded'] = True
+                if compact:
+                    response_data['data']['catalog_version'] = catalog.version
+                if embedding is not None:
+                    response_data['data']['similar_cases'] = get_case_index().search(
+                        embedding, settings.SIMILAR_CASES.get('TOP_K', 5)
+                    )
+            else:
+                response_data = {
+                    'status': 'not_found',
+                    'message': 'No matching conditions found. Please provide more details about your symptoms.',
+                    'conversation_id': str(conv_id) if conv_id else None,
+                    'is_new_conversation': is_new_conversation
+                }
+            
+            # Save messages if we have a conversation
+            if conversation:
+                print("🟢 Saving user and AI messages to conversation:", conversation.id)
+                try:
+                    # Create user message
+                    user_msg = Message.objects.create(conversation=conversation, is_user=True, text=message)
+                    print("✅ Saved user message:", user_msg.text)
+
+                    # Create AI message
+                    ai_message_text = json.dumps(response_data['data']) if 'data' in response_data else response_data.get('message', '')
+                    ai_msg = Message.objects.create(
+                        conversation=conversation, 
+                        is_user=False, 
+                        text=ai_message_text
+                    )
+                    print("✅ Saved AI message:", ai_msg.text)
+
+                except Exception as e:
+                    print(f"Error saving messages: {str(e)}")
+            print("User:", user)
+            print("Conversation ID:", conversation.id if conversation else None)
+            print("Messages count:", conversation.messages.count() if conversation else "N/A")
+            print("📤 [RESPONSE] Sending response data:", response_data)
+            return Response(response_data)
+            
         except Exception as e:
             import traceback
             error_trace = traceback.format_exc()
@@ -309,6 +370,38 @@ class PredictView(APIView):
             }, status=500)
 
 
+# 🟢 Predict metrics
+import hmac
+
+from django.http import HttpResponseForbidden, JsonResponse
+from .admission import prometheus_metrics
+
+
+def metrics_allowed(request):
+    """Staff sessions, or a scraper presenting settings.METRICS_TOKEN as a bearer token."""
+    if request.user.is_authenticated and request.user.is_staff:
+        return True
+    token = settings.METRICS_TOKEN
+    scheme, _, credentials = request.headers.get('Authorization', '').partition(' ')
+    return bool(token) and scheme.lower() == 'bearer' and hmac.compare_digest(credentials.strip(), token)
+
+
+def predict_metrics(request):
+    """Admission, model circuit and shadow metrics of this worker, in Prometheus text format (JSON if asked for)."""
+    if not metrics_allowed(request):
+        return HttpResponseForbidden()
+    snapshot = get_admission_controller().snapshot()
+    breaker = get_breaker().snapshot()
+    shadow_pool = get_shadow_pool()
+    shadow = shadow_pool.snapshot() if shadow_pool is not None else None
+    worker_id = os.environ.get('INFERENCE_WORKER_ID', '0')
+    if 'application/json' in request.headers.get('Accept', ''):
+        return JsonResponse(dict(snapshot, worker=worker_id, model_circuit=breaker, shadow=shadow))
+    return HttpResponse(
+        prometheus_metrics(snapshot, worker_id, breaker, shadow), content_type='text/plain; version=0.0.4'
+    )
+
+
 # Chat view
 @api_view(['GET'])
 @permission_classes([AllowAny])
@@ -328,7 +421,9 @@ def chat_view(request):
     context = {
         'user': user,
         'conversation_id': conversation.id if conversation else None,
-        'title': conversation.title if conversation else 'New Chat'
+        'title': conversation.title if conversation else 'New Chat',
+        # Pins the catalog URL so the browser can cache it as immutable
+        'catalog_version': get_catalog().version
     }
     
     return render(request, 'chat/chat.html', context)
@@ -336,7 +431,7 @@ def chat_view(request):
 
 # API endpoint for chat predictions
 @api_view(['POST'])
-@authentication_classes([TokenAuthentication])
+@authentication_classes([CachedTokenAuthentication])
 @permission_classes([AllowAny])
 def predict_symptoms(request):
     """Handle symptom prediction from the chat interface."""
@@ -393,46 +488,9 @@ def predict_symptoms(request):
                 text=symptoms
             )
         
-        # Use the exact path to the disease data file
         try:
-            # The exact path to the disease data file
-            disease_file_path = r'C:\Users\Faisa\OneDrive\Documents\GitHub\Graduation-Project\chat\static\chat\data\24-Disease.json'
-            
-            print(f"\n=== Loading disease data from: {disease_file_path} ===")
-            
-            # Check if file exists
-            if not os.path.exists(disease_file_path):
-                raise FileNotFoundError(f"Disease data file not found at: {disease_file_path}")
-            
-            with open(disease_file_path, 'r', encoding='utf-8') as f:
-                disease_data = json.load(f)
-                print(f"✅ Successfully loaded disease data with {len(disease_data)} entries")
-            
-            # Simple keyword matching for demo
-            matched_diseases = []
-            for disease in disease_data:
-                # Match based on disease name or description containing the symptoms
-                disease_name = disease.get('name', '').lower()
-                disease_description = disease.get('description', '').lower()
-                symptoms_lower = symptoms.lower()
-                
-                # Check if any part of the symptoms matches the disease name or description
-                if (symptoms_lower in disease_name or 
-                    disease_name in symptoms_lower or
-                    any(word in disease_description for word in symptoms_lower.split()) or
-                    any(word in symptoms_lower for word in disease_name.split())):
-                    
-                    # Format the disease data to match frontend expectations
-                    disease_info = {
-                        'name': disease.get('name', 'Unknown'),
-                        'description': disease.get('description', 'No description available'),
-                        'homeCare': disease.get('homeCare', ''),
-                        'medications': disease.get('medications', ''),
-                        'lifestyle': disease.get('lifestyle', ''),
-                        'whenToSeeDoctor': disease.get('whenToSeeDoctor', ''),
-                        'confidence': 85  # Default confidence score, can be calculated based on matching
-                    }
-                    matched_diseases.append(disease_info)
+            # Keyword matching over the disease catalog (the engine PredictView falls back to)
+            matched_diseases = get_catalog().match(keyword_classifier(symptoms))
             
             if matched_diseases:
                 # Get the first matched disease
@@ -480,12 +538,6 @@ def predict_symptoms(request):
                 
             return Response(response_data)
             
-        except json.JSONDecodeError as e:
-            return Response({
-                'status': 'error',
-                'message': 'Invalid JSON data in disease file'
-            }, status=500)
-            
         except Exception as e:
             import traceback
             traceback.print_exc()
@@ -540,7 +592,7 @@ def topic_test_view(request):
 
 # 🟢 Get single conversation by ID
 class ConversationDetailView(APIView):
-    authentication_classes = [TokenAuthentication]
+    authentication_classes = [CachedTokenAuthentication]
     permission_classes = [IsAuthenticated]
     
     def get(self, request, conversation_id):
@@ -0,0 +1,34 @@
+# Gunicorn settings for serving medical_assistant.wsgi
+# Usage: gunicorn -c gunicorn.conf.py medical_assistant.wsgi
+#
+# Pair GUNICORN_WORKERS with INFERENCE_INTRA_OP_THREADS so that
+# workers x threads <= cores; `python manage.py tune_inference` recommends
+# a combination for the current machine.
+import os
+
+bind = os.environ.get('GUNICORN_BIND', '0.0.0.0:8000')
+workers = int(os.environ.get('GUNICORN_WORKERS', 2))
+timeout = int(os.environ.get('GUNICORN_TIMEOUT', 120))
+# More than one thread switches to the gthread worker, so requests can wait in
+# the admission queue (chat/admission.py) instead of the socket backlog.
+threads = int(os.environ.get('GUNICORN_THREADS', 1))
+
+
+def pre_fork(server, worker):
+    # Runs in the arbiter: hand out the lowest free slot so a restarted
+    # worker reuses the cores of the one it replaces.
+    taken = {getattr(w, 'inference_worker_id', None) for w in server.WORKERS.values()}
+    worker.inference_worker_id = next(i for i in range(len(taken) + 1) if i not in taken)
+
+
+def post_fork(server, worker):
+    # Read by chat.inference.apply_cpu_settings in post_worker_init
+    os.environ['INFERENCE_WORKER_ID'] = str(worker.inference_worker_id)
+
+
+def post_worker_init(worker):
+    # The app is loaded and no request threads exist yet: pin the worker and
+    # size its thread pools now, so every request thread inherits them
+    from chat.inference import configure_cpu
+
+    configure_cpu()
@@ -27,6 +27,43 @@ STATICFILES_DIRS = [
 ]
 STATIC_ROOT = os.path.join(BASE_DIR, 'staticfiles')
 
+# collectstatic minifies, fingerprints and precompresses (see chat/assets.py)
+STORAGES = {
+    'default': {'BACKEND': 'django.core.files.storage.FileSystemStorage'},
+    'staticfiles': {'BACKEND': 'chat.assets.StaticAssetStorage'},
+}
+
+# Files concatenated into one bundle each by collectstatic. {% static_bundle %}
+# renders the bundle in production and the individual files while DEBUG is on.
+# Keep a bundle in the same directory as its members (CSS url()s are relative).
+STATIC_BUNDLES = {
+    'chat/js/chat.bundle.js': [
+        'chat/js/main.js',
+        'chat/js/clinexa.js',
+        'chat/js/chat.js',
+        'chat/js/topic-handler.js',
+        'chat/js/topic-matcher.js',
+        'chat/js/disease-chat.js',
+        'chat/js/search.js',
+        'chat/js/settings.js',
+        'chat/js/auth.js',
+    ],
+    'chat/js/site.bundle.js': [
+        'chat/js/main.js',
+        'chat/js/chat.js',
+        'chat/js/clinexa.js',
+        'chat/js/topic-matcher.js',
+        'chat/js/topic-handler.js',
+        'chat/js/search.js',
+        'chat/js/settings.js',
+        'chat/js/auth.js',
+    ],
+    'chat/css/chat.bundle.css': [
+        'chat/css/styles.css',
+        'chat/css/disease-chat.css',
+    ],
+}
+
 # Media files
 MEDIA_URL = '/media/'
 MEDIA_ROOT = os.path.join(BASE_DIR, 'media')
@@ -65,6 +102,7 @@ INSTALLED_APPS = [
 MIDDLEWARE = [
     'corsheaders.middleware.CorsMiddleware',
     'django.middleware.security.SecurityMiddleware',
+    'chat.assets.StaticAssetMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
     'django.middleware.csrf.CsrfViewMiddleware',
@@ -113,14 +151,92 @@ DATABASES = {
 #     ],
 # }
 REST_FRAMEWORK = {
+    # Token first: API clients send a token, and a match skips the session lookup
     'DEFAULT_AUTHENTICATION_CLASSES': [
+        'chat.authentication.CachedTokenAuthentication',
         "rest_framework.authentication.SessionAuthentication",
-        'rest_framework.authentication.TokenAuthentication',
     ],
     'DEFAULT_PERMISSION_CLASSES': [
         'rest_framework.permissions.IsAuthenticated',
     ],
 }
+
+# Token -> user cache for chat.authentication.CachedTokenAuthentication.
+# LOCAL_TTL bounds how long another worker may still accept a token after
+# logout/deactivation; SHARED_CACHE is an optional CACHES alias (e.g. Redis)
+# shared by all workers, and SHARED_TTL bounds every entry. Changes made with
+# QuerySet.update() send no signals: follow them with
+# chat.authentication.invalidate_users(ids), or they apply only after the TTLs.
+TOKEN_AUTH_CACHE = {
+    'LOCAL_TTL': int(os.environ.get('TOKEN_AUTH_LOCAL_TTL', 30)),
+    'LOCAL_MAX_ENTRIES': 10000,
+    'SHARED_CACHE': os.environ.get('TOKEN_AUTH_SHARED_CACHE', ''),
+    'SHARED_TTL': int(os.environ.get('TOKEN_AUTH_SHARED_TTL', 300)),
+}
+
+# Disease classifier inference
+# Thread counts of 0 keep the torch/OpenMP defaults (one thread per core).
+# With several Gunicorn workers on one box, set INTRA_OP_THREADS so that
+# workers x threads <= cores, and CPU_AFFINITY to 'auto' to pin each worker
+# to its own block of cores (see gunicorn.conf.py and `manage.py tune_inference`).
+DATASET_DIR = os.path.join(BASE_DIR.parent, 'Dataset')
+
+INFERENCE = {
+    'MODEL_DIR': os.environ.get('INFERENCE_MODEL_DIR', os.path.join(BASE_DIR.parent, 'model')),
+    'INTRA_OP_THREADS': int(os.environ.get('INFERENCE_INTRA_OP_THREADS', 0)),
+    'INTER_OP_THREADS': int(os.environ.get('INFERENCE_INTER_OP_THREADS', 0)),
+    # '' = no pinning, 'auto' = one block of INTRA_OP_THREADS cores per worker,
+    # or an explicit core list such as '0-3,8'
+    'CPU_AFFINITY': os.environ.get('INFERENCE_CPU_AFFINITY', ''),
+    # Circuit breaker: after BREAKER_FAILURES consecutive model failures, serve
+    # the keyword fallback and retry the model in the background every
+    # BREAKER_COOLDOWN seconds (doubling while it keeps failing)
+    'BREAKER_FAILURES': int(os.environ.get('INFERENCE_BREAKER_FAILURES', 3)),
+    'BREAKER_COOLDOWN': float(os.environ.get('INFERENCE_BREAKER_COOLDOWN', 30)),
+}
+
+# Similar-case retrieval (see chat/similar.py and `manage.py build_case_index`).
+# Corpora with at least IVF_MIN_CASES texts get an IVF index of which each
+# query scores the NPROBE nearest lists; smaller ones are searched exactly.
+SIMILAR_CASES = {
+    'INDEX_DIR': os.environ.get('SIMILAR_CASES_INDEX_DIR', os.path.join(BASE_DIR.parent, '.cache', 'case_index')),
+    'TOP_K': int(os.environ.get('SIMILAR_CASES_TOP_K', 5)),
+    'IVF_MIN_CASES': int(os.environ.get('SIMILAR_CASES_IVF_MIN_CASES', 50000)),
+    'NPROBE': int(os.environ.get('SIMILAR_CASES_NPROBE', 16)),
+}
+
+# Shadow evaluation (see chat/shadow.py and `manage.py shadow_report`).
+# SHADOW_MODELS="biobert=/models/biobert,clinicalbert=/models/clinicalbert"
+# scores SAMPLE_RATE of the predict traffic with each listed model in WORKERS
+# background processes of THREADS torch threads each; inputs arriving while
+# QUEUE_SIZE are already waiting are dropped rather than delaying requests.
+SHADOW_MODELS = {
+    'MODELS': dict(
+        part.strip().split('=', 1) for part in os.environ.get('SHADOW_MODELS', '').split(',') if '=' in part
+    ),
+    'STORE': os.environ.get('SHADOW_STORE', os.path.join(BASE_DIR.parent, '.cache', 'shadow.sqlite3')),
+    'WORKERS': int(os.environ.get('SHADOW_WORKERS', 1)),
+    'THREADS': int(os.environ.get('SHADOW_THREADS', 1)),
+    'QUEUE_SIZE': int(os.environ.get('SHADOW_QUEUE_SIZE', 256)),
+    'SAMPLE_RATE': float(os.environ.get('SHADOW_SAMPLE_RATE', 1.0)),
+}
+
+# Admission control for /api/chat/predict/, per worker (see chat/admission.py).
+# MAX_IN_FLIGHT concurrent predictions, MAX_QUEUE more waiting; a request that
+# hasn't started within BUDGET_MS of arriving is shed. OVERLOAD_ACTION
+# 'reject' answers shed requests with 503 + Retry-After, 'fallback' serves
+# them from the keyword engine instead.
+ADMISSION = {
+    'MAX_IN_FLIGHT': int(os.environ.get('ADMISSION_MAX_IN_FLIGHT', 1)),
+    'MAX_QUEUE': int(os.environ.get('ADMISSION_MAX_QUEUE', 8)),
+    'BUDGET_MS': int(os.environ.get('ADMISSION_BUDGET_MS', 10000)),
+    'OVERLOAD_ACTION': os.environ.get('ADMISSION_OVERLOAD_ACTION', 'reject'),
+}
+
+# /api/metrics/ is served to staff sessions and to scrapers sending
+# 'Authorization: Bearer <METRICS_TOKEN>'; empty disables the token.
+METRICS_TOKEN = os.environ.get('METRICS_TOKEN', '')
+
 # Password validation
 # https://docs.djangoproject.com/en/5.2/ref/settings/#auth-password-validators
 
@@ -152,11 +268,6 @@ USE_I18N = True
 USE_TZ = True
 
 
-# Static files (CSS, JavaScript, Images)
-# https://docs.djangoproject.com/en/5.2/howto/static-files/
-
-STATIC_URL = 'static/'
-
 # Default primary key field type
 # https://docs.djangoproject.com/en/5.2/ref/settings/#default-auto-field
 
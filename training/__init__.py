@@ -0,0 +1 @@
+"""Scriptable versions of the data and training steps from Disease_Ai_Pipeline.ipynb."""
@@ -0,0 +1,38 @@
+"""Small on-disk key/value cache shared by the preprocessing and training steps."""
+import hashlib
+import os
+import sqlite3
+
+
+def content_key(*parts):
+    """Stable hash of the given strings (texts, config fingerprints, versions)."""
+    return hashlib.sha1('\0'.join(str(p) for p in parts).encode('utf-8')).hexdigest()
+
+
+class DiskCache:
+    """Key -> string store in a single SQLite file."""
+
+    def __init__(self, path):
+        if os.path.dirname(path):
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+        self.conn = sqlite3.connect(path)
+        self.conn.execute("CREATE TABLE IF NOT EXISTS results (key TEXT PRIMARY KEY, value TEXT NOT NULL)")
+
+    def get_many(self, keys):
+        found = {}
+        keys = list(keys)
+        # Stay below SQLite's bound-parameter limit
+        for i in range(0, len(keys), 900):
+            chunk = keys[i:i + 900]
+            rows = self.conn.execute(
+                f"SELECT key, value FROM results WHERE key IN ({','.join('?' * len(chunk))})", chunk
+            )
+            found.update(rows)
+        return found
+
+    def put_many(self, items):
+        with self.conn:
+            self.conn.executemany("INSERT OR REPLACE INTO results (key, value) VALUES (?, ?)", items)
+
+    def close(self):
+        self.conn.close()
@@ -0,0 +1,108 @@
+"""Loading and splitting the Symptom2Disease CSVs."""
+import hashlib
+import json
+import os
+
+import pandas as pd
+
+REPO_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+DATASET_DIR = os.path.join(REPO_ROOT, "Dataset")
+DEFAULT_DATASET = os.path.join(DATASET_DIR, "AugmentedSymptom2Disease.csv")
+
+
+def load_corpus(paths=(DEFAULT_DATASET,), text_column="text", label_column="label"):
+    """Concatenate one or more CSVs into a DataFrame with 'text' and 'label' columns."""
+    frames = []
+    for path in paths:
+        df = pd.read_csv(path, encoding="utf-8-sig")
+        frames.append(pd.DataFrame({"text": df[text_column].astype(str), "label": df[label_column].astype(str)}))
+    return pd.concat(frames, ignore_index=True)
+
+
+def label_mappings(labels):
+    """id2label/label2id in sorted order, the same as LabelEncoder in the notebook."""
+    id2label = {i: label for i, label in enumerate(sorted(set(labels)))}
+    label2id = {label: i for i, label in id2label.items()}
+    return id2label, label2id
+
+
+def stratified_split(df, val_size=0.1, test_size=0.1, seed=42):
+    """80/10/10 stratified train/val/test split as in the notebook."""
+    from sklearn.model_selection import train_test_split
+
+    train, rest = train_test_split(df, test_size=val_size + test_size, stratify=df["label"], random_state=seed)
+    val, test = train_test_split(
+        rest, test_size=test_size / (val_size + test_size), stratify=rest["label"], random_state=seed
+    )
+    return train.reset_index(drop=True), val.reset_index(drop=True), test.reset_index(drop=True)
+
+
+def group_split(df, groups, val_size=0.1, test_size=0.1, seed=42):
+    """
+    Train/val/test split that keeps every group (e.g. a near-duplicate
+    cluster from training.dedup) inside one split, stratified by label as far
+    as the groups allow. `groups` is aligned with the rows of `df`.
+    """
+    import numpy as np
+    from sklearn.model_selection import StratifiedGroupKFold
+
+    def holdout(frame, frame_groups, size):
+        # One fold of round(1 / size) as the held-out part
+        folds = StratifiedGroupKFold(n_splits=max(2, round(1 / size)), shuffle=True, random_state=seed)
+        return next(folds.split(frame, frame["label"], frame_groups))
+
+    df = df.reset_index(drop=True)
+    groups = np.asarray(groups)
+    rest, test = holdout(df, groups, test_size)
+    train, val = holdout(df.iloc[rest], groups[rest], val_size / (1 - test_size))
+    return (
+        df.iloc[rest[train]].reset_index(drop=True),
+        df.iloc[rest[val]].reset_index(drop=True),
+        df.iloc[test].reset_index(drop=True),
+    )
+
+
+def split_corpus(df, dedup_threshold=None, seed=42):
+    """stratified_split, or group_split over near-duplicate clusters when `dedup_threshold` is set."""
+    if dedup_threshold is None:
+        return stratified_split(df, seed=seed)
+    from training.dedup import duplicate_groups
+
+    groups = duplicate_groups(df["text"], threshold=dedup_threshold)
+    print(f"{len(groups) - len(set(groups))} near-duplicate rows kept with their cluster")
+    return group_split(df, groups, seed=seed)
+
+
+SPLIT_FILE = "splits.json"
+
+
+def text_hash(text):
+    return hashlib.sha1(str(text).encode("utf-8")).hexdigest()[:16]
+
+
+def save_split(model_dir, splits):
+    """Record which texts a model was trained, validated and tested on, as hashes, next to the model."""
+    with open(os.path.join(model_dir, SPLIT_FILE), "w") as f:
+        json.dump({name: sorted({text_hash(t) for t in split["text"]}) for name, split in splits.items()}, f)
+
+
+def load_split(model_dir):
+    """The split recorded by save_split, as {name: set of text hashes}, or None if there is none."""
+    path = os.path.join(model_dir, SPLIT_FILE)
+    if not os.path.exists(path):
+        return None
+    with open(path) as f:
+        return {name: set(hashes) for name, hashes in json.load(f).items()}
+
+
+def reuse_split(df, recorded):
+    """
+    train/val/test of `df` following a recorded split. Test only keeps texts
+    the model never trained on (exact copies in its training set are dropped),
+    and texts the recorded model never saw go to train.
+    """
+    hashes = df["text"].map(text_hash)
+    test = hashes.isin(recorded.get("test", ())) & ~hashes.isin(recorded.get("train", ()))
+    val = hashes.isin(recorded.get("val", ())) & ~test & ~hashes.isin(recorded.get("train", ()))
+    train = ~test & ~val
+    return tuple(df[mask].reset_index(drop=True) for mask in (train, val, test))
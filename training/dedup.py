@@ -0,0 +1,330 @@
+"""
+Near-duplicate detection for the symptom corpora with MinHash and LSH.
+
+`df.duplicated()` in the notebook only catches exact copies, but most of
+AugmentedSymptom2Disease.csv is LLM paraphrases of Symptom2Disease.csv rows.
+Near-copies inflate training time and leak across a random train/val/test
+split. Each text is reduced to a MinHash signature of its word shingles. The
+signatures are banded into LSH buckets, and rows sharing a bucket whose
+estimated Jaccard similarity reaches the threshold are merged into one
+cluster (union-find).
+
+The input is read in chunks and signatures are computed by a process pool,
+so the corpus never has to fit in memory as text. Only the signatures
+(num_perm x 4 bytes per row) and one bucket entry per band and row are kept.
+The command line reads the inputs a second time to write the report and
+--dedup-output, rather than holding on to the texts while indexing.
+
+    python -m training.dedup Dataset/Symptom2Disease.csv Dataset/AugmentedSymptom2Disease.csv --report clusters.json
+    python -m training.dedup Dataset/AugmentedSymptom2Disease.csv --threshold 0.6 --dedup-output Dataset/deduped.csv
+
+`duplicate_groups` returns a group id per row, for training.data.group_split.
+"""
+import argparse
+import csv
+import hashlib
+import itertools
+import json
+import os
+import re
+from collections import deque
+from multiprocessing import Pool
+
+import numpy as np
+
+NUM_PERM = 128
+SHINGLE_SIZE = 3
+THRESHOLD = 0.7
+CHUNK_SIZE = 10000
+
+MERSENNE_PRIME = np.uint64((1 << 61) - 1)
+MAX_HASH = np.uint64((1 << 32) - 1)
+WORD_PATTERN = re.compile(r"\w+")
+
+
+def shingles(text, size=SHINGLE_SIZE):
+    """Word `size`-grams of the lower-cased text (the whole text if it is shorter)."""
+    words = WORD_PATTERN.findall(str(text).lower())
+    if len(words) <= size:
+        return {" ".join(words)}
+    return {" ".join(words[i:i + size]) for i in range(len(words) - size + 1)}
+
+
+def permutations(num_perm=NUM_PERM, seed=1):
+    """The (a, b) coefficients of the universal hash functions standing in for permutations."""
+    rng = np.random.RandomState(seed)
+    a = rng.randint(1, int(MERSENNE_PRIME), size=num_perm, dtype=np.uint64)
+    b = rng.randint(0, int(MERSENNE_PRIME), size=num_perm, dtype=np.uint64)
+    return a, b
+
+
+def shingle_hash(shingle):
+    return int.from_bytes(hashlib.blake2b(shingle.encode("utf-8"), digest_size=4).digest(), "little")
+
+
+def signatures(texts, a, b, size=SHINGLE_SIZE):
+    """
+    MinHash signatures of `texts` as a (len(texts), num_perm) uint32 array.
+
+    The shingle hashes of all texts are permuted as one matrix and reduced per
+    text with np.minimum.reduceat, instead of one small numpy call per text.
+    """
+    hashes, counts = [], np.zeros(len(texts), dtype=np.int64)
+    for i, text in enumerate(texts):
+        text_hashes = [shingle_hash(s) for s in shingles(text, size)]
+        hashes.extend(text_hashes)
+        counts[i] = len(text_hashes)
+    hashes = np.asarray(hashes, dtype=np.uint64)
+    # uint64 arithmetic wraps around, as in the usual numpy MinHash implementations
+    values = ((hashes[:, None] * a + b) % MERSENNE_PRIME) & MAX_HASH
+    # Every text has at least one shingle, so the segments are never empty
+    return np.minimum.reduceat(values, np.cumsum(counts) - counts, axis=0).astype(np.uint32)
+
+
+def _signatures(args, batch_size=64):
+    texts, num_perm, seed, size = args
+    a, b = permutations(num_perm, seed)
+    # Small batches keep the (shingles x num_perm) matrix in cache
+    return np.concatenate([signatures(texts[i:i + batch_size], a, b, size) for i in range(0, len(texts), batch_size)])
+
+
+def lsh_params(threshold, num_perm):
+    """(bands, rows) with bands * rows <= num_perm whose S-curve midpoint is closest to `threshold`."""
+    best = None
+    for rows in range(1, num_perm + 1):
+        bands = num_perm // rows
+        midpoint = (1 / bands) ** (1 / rows)
+        if best is None or abs(midpoint - threshold) < best[0]:
+            best = (abs(midpoint - threshold), bands, rows)
+    return best[1], best[2]
+
+
+class UnionFind:
+    def __init__(self):
+        self.parent = []
+
+    def add(self):
+        self.parent.append(len(self.parent))
+
+    def find(self, x):
+        parent = self.parent
+        while parent[x] != x:
+            parent[x] = parent[parent[x]]
+            x = parent[x]
+        return x
+
+    def union(self, x, y):
+        x, y = self.find(x), self.find(y)
+        if x != y:
+            # The older row stays the root, so a cluster is named after its first occurrence
+            self.parent[max(x, y)] = min(x, y)
+
+
+class NearDuplicateIndex:
+    """
+    Streaming MinHash-LSH index: add signature batches in row order, then
+    read the clusters. Each band keeps only the first row that fell into
+    each bucket, and later rows are compared with that row.
+    """
+
+    def __init__(self, threshold=THRESHOLD, num_perm=NUM_PERM):
+        self.threshold = threshold
+        self.num_perm = num_perm
+        self.bands, self.rows = lsh_params(threshold, num_perm)
+        self.buckets = [{} for _ in range(self.bands)]
+        self.signatures = []
+        self.sets = UnionFind()
+        self.candidates = 0
+        self.count = 0
+
+    def signature_of(self, row):
+        return self.signatures[row // CHUNK_SIZE][row % CHUNK_SIZE]
+
+    def add(self, signatures):
+        # Stored in CHUNK_SIZE blocks so a row's signature is found by position
+        for start in range(0, len(signatures), CHUNK_SIZE):
+            block = signatures[start:start + CHUNK_SIZE]
+            if self.signatures and len(self.signatures[-1]) < CHUNK_SIZE:
+                room = CHUNK_SIZE - len(self.signatures[-1])
+                self.signatures[-1] = np.concatenate([self.signatures[-1], block[:room]])
+                self._insert(block[:room])
+                block = block[room:]
+            if len(block):
+                self.signatures.append(block)
+                self._insert(block)
+
+    def _insert(self, block):
+        for sig in block:
+            row = self.count
+            self.count += 1
+            self.sets.add()
+            matched = set()
+            for band, buckets in enumerate(self.buckets):
+                key = sig[band * self.rows:(band + 1) * self.rows].tobytes()
+                other = buckets.setdefault(key, row)
+                if other == row or other in matched:
+                    continue
+                matched.add(other)
+                self.candidates += 1
+                if np.mean(self.signature_of(other) == sig) >= self.threshold:
+                    self.sets.union(row, other)
+
+    def groups(self):
+        """Cluster id of every row: the index of the first row in its cluster."""
+        return np.array([self.sets.find(row) for row in range(self.count)], dtype=np.int64)
+
+
+def iter_chunks(paths, text_column="text", label_column="label", chunksize=CHUNK_SIZE):
+    """(path, DataFrame chunk) for each CSV in turn, with 'text' and 'label' columns."""
+    import pandas as pd
+
+    for path in paths:
+        for chunk in pd.read_csv(path, encoding="utf-8-sig", chunksize=chunksize):
+            yield path, pd.DataFrame({
+                "text": chunk[text_column].astype(str),
+                "label": chunk[label_column].astype(str) if label_column in chunk else "",
+            })
+
+
+def iter_records(paths, text_column="text", label_column="label"):
+    """(source, row in source, label, text) of every row, in the order build_index sees them."""
+    for path in paths:
+        row = 0
+        for _, chunk in iter_chunks([path], text_column, label_column):
+            for label, text in zip(chunk["label"], chunk["text"]):
+                yield path, row, label, text
+                row += 1
+
+
+def build_index(text_chunks, threshold=THRESHOLD, num_perm=NUM_PERM, shingle_size=SHINGLE_SIZE,
+                n_process=None, seed=1):
+    """Index an iterable of text lists, hashing up to `n_process` chunks in parallel."""
+    index = NearDuplicateIndex(threshold, num_perm)
+    n_process = n_process or os.cpu_count() or 1
+    jobs = ((texts, num_perm, seed, shingle_size) for texts in text_chunks)
+    if n_process == 1:
+        for signatures in map(_signatures, jobs):
+            index.add(signatures)
+    else:
+        with Pool(n_process) as pool:
+            # At most two chunks per worker in flight (Pool.imap would read the whole input ahead)
+            pending = deque()
+            for job in jobs:
+                pending.append(pool.apply_async(_signatures, (job,)))
+                if len(pending) >= 2 * n_process:
+                    index.add(pending.popleft().get())
+            while pending:
+                index.add(pending.popleft().get())
+    return index
+
+
+def duplicate_groups(texts, threshold=THRESHOLD, num_perm=NUM_PERM, shingle_size=SHINGLE_SIZE, n_process=None):
+    """Group id per text: rows that are near-duplicates of each other share one."""
+    texts = iter(texts)
+    chunks = iter(lambda: list(itertools.islice(texts, CHUNK_SIZE)), [])
+    return build_index(chunks, threshold, num_perm, shingle_size, n_process).groups()
+
+
+def cluster_report(groups, records, max_members=20):
+    """
+    Summary and the clusters of more than one row, largest first. `records`
+    yields (source, row in source, label, text) for every row in index order
+    (iter_records) and is read once: only the labels of clustered rows and
+    the first `max_members` texts of each cluster are kept.
+    """
+    groups = np.asarray(groups)
+    sizes = np.bincount(groups, minlength=len(groups))
+    clustered = sizes[groups] > 1
+    # Position of each row within its cluster, counting in row order
+    order = np.argsort(groups, kind="stable")
+    rank = np.empty(len(groups), dtype=np.int64)
+    rank[order] = np.arange(len(groups)) - np.searchsorted(groups[order], groups[order])
+    shown = clustered & (rank < max_members)
+
+    labels, members = {}, {}
+    for row, (source, source_row, label, text) in enumerate(records):
+        if not clustered[row]:
+            continue
+        group = int(groups[row])
+        labels.setdefault(group, set()).add(label)
+        if shown[row]:
+            members.setdefault(group, []).append({"source": source, "row": source_row, "label": label, "text": text})
+
+    report = [
+        {"size": int(sizes[group]), "labels": sorted(labels[group]), "members": members[group]}
+        for group in sorted(labels, key=lambda group: (-sizes[group], group))
+    ]
+    duplicates = int(clustered.sum()) - len(report)
+    summary = {
+        "rows": len(groups),
+        "clusters": len(report),
+        "duplicate_rows": duplicates,
+        "unique_rows": len(groups) - duplicates,
+        "mixed_label_clusters": sum(1 for c in report if len(c["labels"]) > 1),
+    }
+    return summary, report
+
+
+def _writing_kept(records, keep, writer):
+    """Pass `records` through, writing the label and text of the kept ones."""
+    for row, record in enumerate(records):
+        if keep[row]:
+            writer.writerow(record[2:])
+        yield record
+
+
+def main():
+    import time
+
+    parser = argparse.ArgumentParser(description="Find near-duplicate texts with MinHash/LSH.")
+    parser.add_argument("inputs", nargs="+", help="CSV files with 'label' and 'text' columns")
+    parser.add_argument("--text-column", default="text")
+    parser.add_argument("--label-column", default="label")
+    parser.add_argument("--threshold", type=float, default=THRESHOLD, help="Jaccard similarity of near-duplicates")
+    parser.add_argument("--num-perm", type=int, default=NUM_PERM)
+    parser.add_argument("--shingle-size", type=int, default=SHINGLE_SIZE, help="Words per shingle")
+    parser.add_argument("--n-process", type=int, default=None, help="Worker processes (default: all cores)")
+    parser.add_argument("--report", default=None, help="Write the summary and clusters as JSON")
+    parser.add_argument("--dedup-output", default=None, help="Write the first row of every cluster to this CSV")
+    args = parser.parse_args()
+
+    start = time.perf_counter()
+    text_chunks = (
+        chunk["text"].tolist() for _, chunk in iter_chunks(args.inputs, args.text_column, args.label_column)
+    )
+    index = build_index(text_chunks, args.threshold, args.num_perm, args.shingle_size, args.n_process)
+    groups = index.groups()
+    keep = groups == np.arange(len(groups))
+
+    # Second pass over the inputs: the texts for the report, and the rows to keep
+    records = iter_records(args.inputs, args.text_column, args.label_column)
+    if args.dedup_output:
+        output = open(args.dedup_output, "w", encoding="utf-8", newline="")
+        writer = csv.writer(output, lineterminator="\n")
+        writer.writerow(["label", "text"])
+        records = _writing_kept(records, keep, writer)
+    try:
+        summary, clusters = cluster_report(groups, records)
+    finally:
+        if args.dedup_output:
+            output.close()
+    summary.update(
+        threshold=args.threshold, bands=index.bands, rows_per_band=index.rows,
+        candidate_pairs=index.candidates, seconds=round(time.perf_counter() - start, 2),
+    )
+    print(json.dumps(summary, indent=2))
+    for cluster in clusters[:5]:
+        print(f"\n{cluster['size']} rows, labels {cluster['labels']}:")
+        for member in cluster["members"][:3]:
+            print(f"  [{os.path.basename(member['source'])}:{member['row']}] {member['text'][:100]}")
+
+    if args.report:
+        with open(args.report, "w", encoding="utf-8") as f:
+            json.dump({"summary": summary, "clusters": clusters}, f, indent=2, ensure_ascii=False)
+        print(f"\nSaved report to {args.report}")
+    if args.dedup_output:
+        print(f"Saved {int(keep.sum())} of {len(groups)} rows to {args.dedup_output}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,304 @@
+"""
+Distil the served classifier into a smaller student for CPU serving.
+
+The teacher (the current `model/` directory) labels the training texts and
+cheap augmented variants of them with soft targets; the student is trained on
+KL(teacher || student) at temperature T plus cross-entropy on the true labels.
+By default the student is the teacher with only a few of its encoder layers
+kept (DistilBERT-style initialisation, same tokenizer); `--student-model` can
+instead start from any smaller pretrained encoder (e.g. a MiniLM).
+
+The output directory is a normal model directory, so it can be served by
+pointing INFERENCE_MODEL_DIR at it. distill_report.json compares teacher and
+student accuracy and single-request CPU latency. Both are scored on texts the
+teacher was not trained on: the teacher's own test split when its directory
+has the splits.json written by training.train, or the CSVs given with
+--test-data. A teacher trained elsewhere (e.g. the notebook) has no record of
+its split; the fresh split used then may overlap its training data, which
+the report marks as "unverified".
+
+    python -m training.distill --teacher model --student-layers 4 --output-dir model-student
+    python -m training.distill --teacher model --test-data held_out.csv --output-dir model-student
+"""
+import argparse
+import copy
+import json
+import os
+import random
+import re
+import statistics
+import time
+
+import numpy as np
+
+from training.data import DEFAULT_DATASET, load_corpus, load_split, reuse_split, split_corpus, text_hash
+
+
+def augment_text(text, rng, drop_prob=0.1):
+    """A cheap paraphrase: drop a few words and swap one adjacent pair."""
+    words = text.split()
+    kept = [w for w in words if rng.random() > drop_prob] or words
+    if len(kept) > 3:
+        i = rng.randrange(len(kept) - 1)
+        kept[i], kept[i + 1] = kept[i + 1], kept[i]
+    return ' '.join(kept)
+
+
+def shrink_encoder(teacher, num_layers):
+    """Copy of `teacher` keeping `num_layers` evenly spaced encoder layers."""
+    from transformers import AutoModelForSequenceClassification
+
+    total = teacher.config.num_hidden_layers
+    keep = sorted(set(np.linspace(0, total - 1, num_layers).round().astype(int).tolist()))
+    config = copy.deepcopy(teacher.config)
+    config.num_hidden_layers = len(keep)
+    student = AutoModelForSequenceClassification.from_config(config)
+
+    state = {}
+    for key, value in teacher.state_dict().items():
+        match = re.search(r"\.layer\.(\d+)\.", key)
+        if not match:
+            state[key] = value
+        elif int(match.group(1)) in keep:
+            state[key.replace(match.group(0), f".layer.{keep.index(int(match.group(1)))}.", 1)] = value
+    # The dropped layers were never copied, so every student weight must come from the teacher
+    missing, unexpected = student.load_state_dict(state, strict=False)
+    if missing or unexpected:
+        raise ValueError(
+            f"Teacher weights do not map onto the student (missing {missing}, unexpected {unexpected})"
+        )
+    return student
+
+
+def predict_logits(model, tokenizer, texts, batch_size=32, max_length=128):
+    """Logits for `texts`, batched in length order to keep padding small."""
+    import torch
+
+    model.eval()
+    order = sorted(range(len(texts)), key=lambda i: len(texts[i]))
+    logits = np.zeros((len(texts), model.config.num_labels), dtype=np.float32)
+    with torch.no_grad():
+        for start in range(0, len(order), batch_size):
+            idx = order[start:start + batch_size]
+            inputs = tokenizer([texts[i] for i in idx], truncation=True, max_length=max_length,
+                               padding=True, return_tensors="pt")
+            logits[idx] = model(**inputs).logits.numpy()
+    return logits
+
+
+def measure_latency(model, tokenizer, texts, max_length=128):
+    """Median and p95 single-text latency in milliseconds (what one API request pays)."""
+    import torch
+
+    model.eval()
+    timings = []
+    with torch.no_grad():
+        for text in texts:
+            start = time.perf_counter()
+            model(**tokenizer(text, truncation=True, max_length=max_length, return_tensors="pt"))
+            timings.append((time.perf_counter() - start) * 1000)
+    timings.sort()
+    return {"p50_ms": statistics.median(timings), "p95_ms": timings[int(0.95 * (len(timings) - 1))]}
+
+
+def summarize(name, model, tokenizer, texts, labels, latency_texts):
+    logits = predict_logits(model, tokenizer, texts)
+    top3 = np.argsort(-logits, axis=1)[:, :3]
+    labels = np.asarray(labels)
+    return {
+        "model": name,
+        "layers": model.config.num_hidden_layers,
+        "hidden_size": model.config.hidden_size,
+        "parameters": sum(p.numel() for p in model.parameters()),
+        "accuracy": float((logits.argmax(axis=1) == labels).mean()),
+        "top3_accuracy": float((top3 == labels[:, None]).any(axis=1).mean()),
+        **measure_latency(model, tokenizer, latency_texts),
+    }
+
+
+def evaluation_split(df, args):
+    """train, val, test and where the test split comes from ('test-data', 'teacher' or 'unverified')."""
+    import pandas as pd
+
+    if args.test_data:
+        test = load_corpus(args.test_data)
+        df = df[~df["text"].map(text_hash).isin(set(test["text"].map(text_hash)))]
+        train, val, rest = split_corpus(df, args.dedup_threshold, args.seed)
+        return pd.concat([train, rest], ignore_index=True), val, test, "test-data"
+
+    recorded = load_split(args.teacher)
+    if recorded is not None:
+        train, val, test = reuse_split(df, recorded)
+        if test.empty:
+            raise SystemExit(f"None of the teacher's test texts are in {args.data}")
+        return train, val, test, "teacher"
+
+    print(f"Warning: {args.teacher} has no splits.json: the test split may overlap the teacher's training data, "
+          f"so its accuracy can be inflated. Pass --test-data with held-out CSVs for a fair comparison.")
+    train, val, test = split_corpus(df, args.dedup_threshold, args.seed)
+    return train, val, test, "unverified"
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="Distil the disease classifier into a smaller student.")
+    parser.add_argument("--teacher", default="model", help="Teacher model directory")
+    parser.add_argument("--data", nargs="+", default=[DEFAULT_DATASET])
+    parser.add_argument("--test-data", nargs="+", default=None,
+                        help="CSVs held out from the teacher's training, used as the test split")
+    parser.add_argument("--student-layers", type=int, default=4, help="Encoder layers kept from the teacher")
+    parser.add_argument("--student-model", default=None, help="Start from this pretrained encoder instead")
+    parser.add_argument("--output-dir", default="model-student")
+    parser.add_argument("--checkpoint-dir", default=os.path.join(".cache", "distill-checkpoints"))
+    parser.add_argument("--augment", type=int, default=2, help="Augmented copies per training text")
+    parser.add_argument("--temperature", type=float, default=2.0)
+    parser.add_argument("--alpha", type=float, default=0.7, help="Weight of the distillation loss vs. hard labels")
+    parser.add_argument("--epochs", type=float, default=10)
+    parser.add_argument("--learning-rate", type=float, default=5e-5)
+    parser.add_argument("--batch-size", type=int, default=16)
+    parser.add_argument("--max-length", type=int, default=128)
+    parser.add_argument("--latency-samples", type=int, default=100)
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--cpu", action="store_true")
+    parser.add_argument("--dedup-threshold", type=float, default=None,
+                        help="Keep near-duplicates (MinHash Jaccard >= this) in the same split")
+    return parser.parse_args(argv)
+
+
+def main(argv=None):
+    args = parse_args(argv)
+
+    import torch
+    import torch.nn.functional as F
+    from transformers import (
+        AutoModelForSequenceClassification,
+        AutoTokenizer,
+        DataCollatorWithPadding,
+        Trainer,
+        TrainingArguments,
+        set_seed,
+    )
+
+    class DistillationTrainer(Trainer):
+        def compute_loss(self, model, inputs, return_outputs=False, num_items_in_batch=None):
+            teacher_logits = inputs.pop("teacher_logits")
+            outputs = model(**inputs)
+            t = args.temperature
+            soft = F.kl_div(
+                F.log_softmax(outputs.logits / t, dim=-1),
+                F.softmax(teacher_logits / t, dim=-1),
+                reduction="batchmean",
+            ) * t * t
+            loss = args.alpha * soft + (1 - args.alpha) * outputs.loss
+            return (loss, outputs) if return_outputs else loss
+
+    set_seed(args.seed)
+    rng = random.Random(args.seed)
+
+    df = load_corpus(args.data)
+    train, val, test, test_split = evaluation_split(df, args)
+
+    teacher_tokenizer = AutoTokenizer.from_pretrained(args.teacher, local_files_only=True)
+    teacher = AutoModelForSequenceClassification.from_pretrained(args.teacher, local_files_only=True)
+    label2id = {label: int(i) for label, i in teacher.config.label2id.items()}
+    missing = set(df["label"]) - set(label2id)
+    if missing:
+        raise SystemExit(f"Labels not known to the teacher: {sorted(missing)}")
+
+    # Training texts plus augmented variants, all soft-labelled by the teacher
+    texts = train["text"].tolist()
+    labels = [label2id[label] for label in train["label"]]
+    for text, label in list(zip(texts, labels)):
+        for _ in range(args.augment):
+            texts.append(augment_text(text, rng))
+            labels.append(label)
+    print(f"Labelling {len(texts)} texts with the teacher")
+    teacher_logits = predict_logits(teacher, teacher_tokenizer, texts, max_length=args.max_length)
+
+    if args.student_model:
+        tokenizer = AutoTokenizer.from_pretrained(args.student_model)
+        student = AutoModelForSequenceClassification.from_pretrained(
+            args.student_model, num_labels=len(label2id),
+            id2label={i: label for label, i in label2id.items()}, label2id=label2id,
+            ignore_mismatched_sizes=True,
+        )
+    else:
+        tokenizer = teacher_tokenizer
+        student = shrink_encoder(teacher, args.student_layers)
+
+    encoded = tokenizer(texts, truncation=True, max_length=args.max_length)
+    train_records = [
+        {"input_ids": ids, "labels": label, "teacher_logits": logits.tolist()}
+        for ids, label, logits in zip(encoded["input_ids"], labels, teacher_logits)
+    ]
+    val_encoded = tokenizer(val["text"].tolist(), truncation=True, max_length=args.max_length)
+    val_logits = predict_logits(teacher, teacher_tokenizer, val["text"].tolist(), max_length=args.max_length)
+    val_records = [
+        {"input_ids": ids, "labels": label2id[label], "teacher_logits": logits.tolist()}
+        for ids, label, logits in zip(val_encoded["input_ids"], val["label"], val_logits)
+    ]
+
+    def compute_metrics(eval_pred):
+        logits, label_ids = eval_pred
+        return {"accuracy": float((np.argmax(logits, axis=1) == label_ids).mean())}
+
+    trainer = DistillationTrainer(
+        model=student,
+        args=TrainingArguments(
+            output_dir=args.checkpoint_dir,
+            eval_strategy="epoch",
+            save_strategy="epoch",
+            learning_rate=args.learning_rate,
+            per_device_train_batch_size=args.batch_size,
+            per_device_eval_batch_size=args.batch_size,
+            num_train_epochs=args.epochs,
+            weight_decay=0.01,
+            warmup_ratio=0.1,
+            lr_scheduler_type="cosine",
+            load_best_model_at_end=True,
+            metric_for_best_model="accuracy",
+            save_total_limit=2,
+            group_by_length=True,
+            remove_unused_columns=False,
+            use_cpu=args.cpu,
+            seed=args.seed,
+            report_to=[],
+        ),
+        train_dataset=train_records,
+        eval_dataset=val_records,
+        processing_class=tokenizer,
+        data_collator=DataCollatorWithPadding(tokenizer),
+        compute_metrics=compute_metrics,
+    )
+    trainer.train()
+
+    os.makedirs(args.output_dir, exist_ok=True)
+    trainer.save_model(args.output_dir)
+    tokenizer.save_pretrained(args.output_dir)
+
+    # Accuracy on the held-out test split; latency is single-text CPU inference
+    torch.set_num_threads(1)
+    student = trainer.model.to("cpu")
+    test_texts = test["text"].tolist()
+    test_labels = [label2id[label] for label in test["label"]]
+    latency_texts = test_texts[:args.latency_samples]
+    report = {
+        "teacher": summarize(args.teacher, teacher, teacher_tokenizer, test_texts, test_labels, latency_texts),
+        "student": summarize(args.output_dir, student, tokenizer, test_texts, test_labels, latency_texts),
+        "settings": {k: v for k, v in vars(args).items()},
+        "test_samples": len(test_texts),
+        "test_split": test_split,
+    }
+    report["speedup_p50"] = report["teacher"]["p50_ms"] / report["student"]["p50_ms"]
+    with open(os.path.join(args.output_dir, "distill_report.json"), "w") as f:
+        json.dump(report, f, indent=2)
+
+    print(f"{'model':<10} {'layers':>6} {'params':>12} {'acc':>7} {'top-3':>7} {'p50 ms':>8} {'p95 ms':>8}")
+    for role in ("teacher", "student"):
+        r = report[role]
+        print(f"{role:<10} {r['layers']:>6} {r['parameters']:>12,} {r['accuracy']:>7.4f} "
+              f"{r['top3_accuracy']:>7.4f} {r['p50_ms']:>8.1f} {r['p95_ms']:>8.1f}")
+    print(f"Student is {report['speedup_p50']:.1f}x faster at p50; saved to {args.output_dir}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,170 @@
+"""
+Text preprocessing from Disease_Ai_Pipeline.ipynb as an importable, parallel module.
+
+Steps (same as the notebook):
+1. Lowercase and remove punctuation except '.' and ','.
+2. Tokenize with spaCy, drop stop words (keeping 'have', 'also', 'has', 'in').
+3. Lemmatize.
+4. Expand the custom contractions ('ve' -> 'have', 'm' -> 'am').
+5. Optionally spell-correct with TextBlob.
+
+Unlike the notebook, each text is parsed by spaCy once: stop words are removed
+and lemmas taken from the same Doc, via `nlp.pipe` with batching and
+`n_process` workers and with the parser/NER disabled. Results are cached on
+disk keyed by a hash of the text, the preprocessing configuration and the
+spaCy pipeline (package name, version, components), so re-running on a grown
+corpus only processes new rows, and a different or upgraded model does not
+reuse the old lemmas.
+
+Usage:
+    python -m training.preprocessing Dataset/AugmentedSymptom2Disease.csv -o Preprocessed_Data.csv
+"""
+import argparse
+import os
+import re
+import string
+from multiprocessing import Pool
+
+from training.cache import DiskCache, content_key
+
+SPACY_MODEL = "en_core_web_sm"
+KEEP_STOP_WORDS = {'have', 'also', 'has', 'in'}
+CONTRACTIONS = {"ve": "have", "m": "am"}
+# The lemmatizer only needs POS tags; the parser and NER are the expensive parts
+DISABLED_COMPONENTS = ["parser", "ner"]
+
+NOISE_PATTERN = re.compile("[%s]" % re.escape(string.punctuation.replace('.', '').replace(',', '')))
+
+DEFAULT_CACHE = os.path.join(".cache", "preprocessing.sqlite3")
+# Bump when the steps above change so cached results are not reused
+PIPELINE_VERSION = "1"
+
+
+def clean_text(text):
+    """Lowercase and strip punctuation other than '.' and ','."""
+    return NOISE_PATTERN.sub('', str(text).lower())
+
+
+def expand_contractions(text):
+    return ' '.join(CONTRACTIONS.get(word, word) for word in text.split())
+
+
+def load_nlp(model=SPACY_MODEL):
+    import spacy
+    return spacy.load(model, disable=DISABLED_COMPONENTS)
+
+
+def stop_words_for(nlp):
+    return set(nlp.Defaults.stop_words) - KEEP_STOP_WORDS
+
+
+def doc_to_text(doc, stop_words):
+    """Stop-word removal and lemmatization from a single parsed Doc."""
+    lemmas = [
+        token.lemma_ or token.lower_
+        for token in doc
+        if token.lower_ not in stop_words and not token.is_space
+    ]
+    return expand_contractions(' '.join(lemmas))
+
+
+def spell_correct(text):
+    from textblob import TextBlob
+    return str(TextBlob(text).correct())
+
+
+def pipeline_fingerprint(nlp):
+    """Identifies a loaded spaCy pipeline in cache keys: package, version, components and stop words."""
+    import spacy
+
+    meta = nlp.meta
+    return content_key(
+        f"{meta.get('lang')}_{meta.get('name')}", meta.get('version'), spacy.__version__,
+        ','.join(nlp.pipe_names), ' '.join(sorted(stop_words_for(nlp))),
+    )
+
+
+def cache_key(stage, text, fingerprint):
+    return content_key(PIPELINE_VERSION, fingerprint, stage, text)
+
+
+def _run_stage(texts, stage, process, cache, fingerprint):
+    """Apply `process` (a function of a list of texts) to the texts missing from the cache."""
+    unique = list(dict.fromkeys(texts))
+    keys = {text: cache_key(stage, text, fingerprint) for text in unique}
+    done = cache.get_many(keys.values()) if cache else {}
+
+    missing = [text for text in unique if keys[text] not in done]
+    if missing:
+        results = process(missing)
+        new = [(keys[text], result) for text, result in zip(missing, results)]
+        if cache:
+            cache.put_many(new)
+        done.update(new)
+    print(f"{stage}: {len(unique) - len(missing)} cached, {len(missing)} processed")
+    return [done[keys[text]] for text in texts]
+
+
+def preprocess_texts(texts, nlp=None, model=SPACY_MODEL, batch_size=256, n_process=None,
+                     spell_check=False, cache_path=DEFAULT_CACHE):
+    """
+    Preprocess a list of texts and return the results in the same order.
+
+    `n_process` defaults to every core. Pass `cache_path=None` to disable caching.
+    """
+    n_process = n_process or os.cpu_count() or 1
+    # Loaded up front: the cache key depends on the pipeline's version
+    nlp = nlp or load_nlp(model)
+    fingerprint = pipeline_fingerprint(nlp)
+    cache = DiskCache(cache_path) if cache_path else None
+
+    def spacy_stage(batch):
+        stop_words = stop_words_for(nlp)
+        docs = nlp.pipe((clean_text(t) for t in batch), batch_size=batch_size, n_process=n_process)
+        return [doc_to_text(doc, stop_words) for doc in docs]
+
+    def spell_stage(batch):
+        with Pool(n_process) as pool:
+            return pool.map(spell_correct, batch, chunksize=max(1, len(batch) // (n_process * 4)))
+
+    try:
+        results = _run_stage(texts, 'spacy', spacy_stage, cache, fingerprint)
+        if spell_check:
+            results = _run_stage(results, 'spell', spell_stage, cache, fingerprint)
+    finally:
+        if cache:
+            cache.close()
+    return results
+
+
+def main():
+    import pandas as pd
+
+    parser = argparse.ArgumentParser(description="Preprocess a Symptom2Disease-style CSV (label,text).")
+    parser.add_argument("input", help="CSV with 'label' and 'text' columns")
+    parser.add_argument("-o", "--output", default="Preprocessed_Data.csv")
+    parser.add_argument("--model", default=SPACY_MODEL, help="spaCy model name")
+    parser.add_argument("--batch-size", type=int, default=256)
+    parser.add_argument("--n-process", type=int, default=None, help="Worker processes (default: all cores)")
+    parser.add_argument("--spell-check", action="store_true", help="Also apply TextBlob spell correction")
+    parser.add_argument("--cache", default=DEFAULT_CACHE, help="Cache file ('' to disable)")
+    args = parser.parse_args()
+
+    df = pd.read_csv(args.input, encoding='utf-8-sig')
+    df = df.rename(columns={'label': 'Disease', 'text': 'Symptoms'})
+    df = df.drop(columns=[c for c in df.columns if c.startswith('Unnamed')])
+
+    df['Symptoms'] = preprocess_texts(
+        df['Symptoms'].astype(str).tolist(),
+        model=args.model,
+        batch_size=args.batch_size,
+        n_process=args.n_process,
+        spell_check=args.spell_check,
+        cache_path=args.cache or None,
+    )
+    df.to_csv(args.output, index=False)
+    print(f"Saved {len(df)} rows to {args.output}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,396 @@
+"""
+Tests for the training scripts. They need the packages in training/requirements.txt
+but no downloaded models, and run from the project root with:
+
+    python -m unittest training.tests
+"""
+import contextlib
+import io
+import os
+import shutil
+import tempfile
+import unittest
+
+
+def blank_nlp():
+    import spacy
+    return spacy.blank("en")
+
+
+class PreprocessingCacheTest(unittest.TestCase):
+    TEXTS = ["I've had a fever, and a rash!", "My joints ache; also I'm tired.", "I've had a fever, and a rash!"]
+
+    def setUp(self):
+        self.tmp = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.tmp, ignore_errors=True)
+        self.cache_path = os.path.join(self.tmp, "cache.sqlite3")
+
+    def run_stage(self, texts, nlp, **kwargs):
+        from training.preprocessing import preprocess_texts
+
+        out = io.StringIO()
+        with contextlib.redirect_stdout(out):
+            results = preprocess_texts(texts, nlp=nlp, n_process=1, cache_path=self.cache_path, **kwargs)
+        return results, out.getvalue().strip()
+
+    def test_hits_and_misses(self):
+        nlp = blank_nlp()
+        first, log = self.run_stage(self.TEXTS, nlp)
+        self.assertEqual(log, "spacy: 0 cached, 2 processed")
+        self.assertEqual(first[0], first[2])
+        self.assertNotIn("!", first[0])
+
+        second, log = self.run_stage(self.TEXTS + ["Blurry vision."], nlp)
+        self.assertEqual(log, "spacy: 2 cached, 1 processed")
+        self.assertEqual(second[:3], first)
+
+    def test_other_pipeline_is_a_miss(self):
+        self.run_stage(self.TEXTS, blank_nlp())
+
+        upgraded = blank_nlp()
+        upgraded.meta["version"] = "9.9.9"
+        _, log = self.run_stage(self.TEXTS, upgraded)
+        self.assertEqual(log, "spacy: 0 cached, 2 processed")
+
+        custom = blank_nlp()
+        custom.add_pipe("sentencizer")
+        _, log = self.run_stage(self.TEXTS, custom)
+        self.assertEqual(log, "spacy: 0 cached, 2 processed")
+
+    def test_multiple_processes(self):
+        from training.preprocessing import preprocess_texts
+
+        texts = [f"Symptom {i}: I've had a cough, and a fever!" for i in range(40)]
+        with contextlib.redirect_stdout(io.StringIO()):
+            serial = preprocess_texts(texts, nlp=blank_nlp(), n_process=1, cache_path=None)
+            parallel = preprocess_texts(texts, nlp=blank_nlp(), n_process=2, batch_size=8, cache_path=None)
+        self.assertEqual(parallel, serial)
+
+
+def tiny_classifier(num_layers=3):
+    """A randomly initialised small model with the repo's labels (model/config.json)."""
+    from transformers import AutoConfig, AutoModelForSequenceClassification
+
+    from training.data import REPO_ROOT
+
+    config = AutoConfig.from_pretrained(os.path.join(REPO_ROOT, "model"))
+    config.update({"num_hidden_layers": num_layers, "hidden_size": 32, "num_attention_heads": 2,
+                   "intermediate_size": 64})
+    return AutoModelForSequenceClassification.from_config(config).eval()
+
+
+class CountingTokenizer:
+    """Stands in for a fast tokenizer: one id per word, and a record of what it was asked to tokenize."""
+
+    special_tokens_map = {}
+
+    def __init__(self, content="vocab-v1"):
+        from unittest import mock
+
+        self.backend_tokenizer = mock.Mock(**{"to_str.return_value": content})
+        self.calls = []
+
+    def __call__(self, texts, truncation, max_length):
+        self.calls.append(list(texts))
+        return {"input_ids": [[len(word) for word in text.split()][:max_length] for text in texts]}
+
+
+class TrainTest(unittest.TestCase):
+    def setUp(self):
+        self.tmp = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.tmp, ignore_errors=True)
+
+    def tokenize(self, texts, tokenizer, max_length=8):
+        from training.cache import DiskCache
+        from training.train import tokenize_cached
+
+        cache = DiskCache(os.path.join(self.tmp, "tokens.sqlite3"))
+        try:
+            with contextlib.redirect_stdout(io.StringIO()):
+                return tokenize_cached(texts, tokenizer, max_length, cache)
+        finally:
+            cache.close()
+
+    def test_only_new_texts_are_tokenized(self):
+        tokenizer = CountingTokenizer()
+        first = self.tokenize(["itchy rash", "dry cough", "itchy rash"], tokenizer)
+        self.assertEqual(tokenizer.calls, [["itchy rash", "dry cough"]])
+        self.assertEqual(first, [[5, 4], [3, 5], [5, 4]])
+
+        second = self.tokenize(["dry cough", "blurry vision", "itchy rash"], tokenizer)
+        self.assertEqual(tokenizer.calls[1:], [["blurry vision"]])
+        self.assertEqual(second, [[3, 5], [6, 6], [5, 4]])
+
+        # Another max_length, or a tokenizer with other content at the same path, is a miss
+        self.tokenize(["itchy rash"], tokenizer, max_length=1)
+        retrained = CountingTokenizer("vocab-v2")
+        self.tokenize(["itchy rash", "dry cough"], retrained)
+        self.assertEqual((tokenizer.calls[2:], retrained.calls), ([["itchy rash"]], [["itchy rash", "dry cough"]]))
+
+    def test_fingerprint_follows_tokenizer_files(self):
+        from transformers import AutoTokenizer
+
+        from training.data import REPO_ROOT
+        from training.train import tokenizer_fingerprint
+
+        path = os.path.join(self.tmp, "tokenizer")
+        shutil.copytree(os.path.join(REPO_ROOT, "model"), path)
+        for use_fast in (True, False):
+            with self.subTest(use_fast=use_fast):
+                before = tokenizer_fingerprint(AutoTokenizer.from_pretrained(path, use_fast=use_fast), 128)
+                self.assertEqual(tokenizer_fingerprint(AutoTokenizer.from_pretrained(path, use_fast=use_fast), 128),
+                                 before)
+                with open(os.path.join(path, "merges.txt"), encoding="utf-8") as f:
+                    merges = f.read().splitlines()
+                # Same vocabulary size, one merge rule dropped
+                with open(os.path.join(path, "merges.txt"), "w", encoding="utf-8") as f:
+                    f.write("\n".join(merges[:-1]) + "\n")
+                self.assertNotEqual(
+                    tokenizer_fingerprint(AutoTokenizer.from_pretrained(path, use_fast=use_fast), 128), before
+                )
+                with open(os.path.join(path, "merges.txt"), "w", encoding="utf-8") as f:
+                    f.write("\n".join(merges) + "\n")
+
+    def test_build_dataset_round_trips_through_arrow(self):
+        from datasets import load_from_disk
+
+        from training.train import build_dataset
+
+        input_ids, labels = [[0, 5, 2], [0, 7, 8, 9, 2]], [3, 1]
+        self.assertEqual(build_dataset(input_ids, labels), [
+            {"input_ids": [0, 5, 2], "labels": 3}, {"input_ids": [0, 7, 8, 9, 2], "labels": 1},
+        ])
+        path = os.path.join(self.tmp, "arrow", "train")
+        with contextlib.redirect_stderr(io.StringIO()):
+            dataset = build_dataset(input_ids, labels, path)
+        for reopened in (dataset, load_from_disk(path)):
+            self.assertEqual(reopened["input_ids"], input_ids)
+            self.assertEqual(reopened["labels"], labels)
+            self.assertEqual(reopened["length"], [3, 5])
+
+    def test_main_writes_a_servable_model_dir(self):
+        import json
+
+        from transformers import AutoTokenizer
+
+        from training.data import REPO_ROOT, load_split
+        from training.train import main
+
+        base = os.path.join(self.tmp, "base")
+        tiny_classifier(1).save_pretrained(base)
+        AutoTokenizer.from_pretrained(os.path.join(REPO_ROOT, "model")).save_pretrained(base)
+        output = os.path.join(self.tmp, "out")
+        argv = [
+            "--base-model", base, "--output-dir", output, "--max-samples", "240", "--epochs", "1", "--cpu",
+            "--batch-size", "32", "--checkpoint-dir", os.path.join(self.tmp, "checkpoints"),
+            "--token-cache", os.path.join(self.tmp, "tokens.sqlite3"), "--arrow-dir", os.path.join(self.tmp, "arrow"),
+        ]
+        with contextlib.redirect_stdout(io.StringIO()), contextlib.redirect_stderr(io.StringIO()):
+            main(argv)
+
+        with open(os.path.join(output, "id2label.json")) as f:
+            id2label = json.load(f)
+        with open(os.path.join(output, "metrics.json")) as f:
+            metrics = json.load(f)
+        self.assertEqual(len(id2label), 24)
+        self.assertEqual(sum(metrics["samples"].values()), 240)
+        self.assertEqual(set(metrics["test"]["report"]) - {"accuracy", "macro avg", "weighted avg"},
+                         set(id2label.values()))
+        splits = load_split(output)
+        self.assertEqual({name: len(hashes) for name, hashes in splits.items()}, metrics["samples"])
+        self.assertTrue(os.path.exists(os.path.join(output, "model.safetensors")))
+
+
+class DistillTest(unittest.TestCase):
+    def test_shrink_encoder_copies_every_weight(self):
+        import torch
+
+        from training.distill import shrink_encoder
+
+        teacher = tiny_classifier(3)
+        inputs = {"input_ids": torch.tensor([[0, 100, 200, 2]])}
+        with torch.no_grad():
+            same = shrink_encoder(teacher, 3).eval()(**inputs).logits
+            self.assertTrue(torch.allclose(same, teacher(**inputs).logits))
+        student = shrink_encoder(teacher, 2)
+        self.assertEqual(student.config.num_hidden_layers, 2)
+        # Layers 0 and 2 are kept; the student's layer 1 is the teacher's layer 2
+        self.assertTrue(torch.equal(
+            student.roberta.encoder.layer[1].output.dense.weight, teacher.roberta.encoder.layer[2].output.dense.weight
+        ))
+
+    def test_shrink_encoder_rejects_mismatched_names(self):
+        from unittest import mock
+
+        from training.distill import shrink_encoder
+
+        teacher = tiny_classifier(2)
+        renamed = {f"encoder_{key}": value for key, value in teacher.state_dict().items()}
+        with mock.patch.object(teacher, "state_dict", return_value=renamed):
+            with self.assertRaises(ValueError):
+                shrink_encoder(teacher, 1)
+
+    def test_reuse_split_keeps_teacher_training_texts_out_of_test(self):
+        import pandas as pd
+
+        from training.data import load_split, reuse_split, save_split
+
+        splits = {
+            "train": pd.DataFrame({"text": ["a", "b", "dup"], "label": ["x", "y", "x"]}),
+            "val": pd.DataFrame({"text": ["c"], "label": ["x"]}),
+            "test": pd.DataFrame({"text": ["d", "dup"], "label": ["y", "x"]}),
+        }
+        model_dir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, model_dir, ignore_errors=True)
+        save_split(model_dir, splits)
+
+        df = pd.DataFrame({"text": ["d", "a", "c", "dup", "new", "b"], "label": ["y", "x", "x", "x", "y", "y"]})
+        train, val, test = reuse_split(df, load_split(model_dir))
+        self.assertEqual(test["text"].tolist(), ["d"])
+        self.assertEqual(val["text"].tolist(), ["c"])
+        self.assertEqual(sorted(train["text"]), ["a", "b", "dup", "new"])
+        empty_dir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, empty_dir, ignore_errors=True)
+        self.assertIsNone(load_split(empty_dir))
+
+
+class GroupSplitTest(unittest.TestCase):
+    def test_groups_stay_in_one_split_and_labels_stay_stratified(self):
+        import numpy as np
+        import pandas as pd
+
+        from training.data import group_split
+
+        rng = np.random.default_rng(0)
+        rows, group = [], 0
+        for label in ("Psoriasis", "Migraine", "Common Cold", "Acne"):
+            for _ in range(60):
+                # Clusters of 1-4 near-copies of one text
+                for copy in range(rng.integers(1, 5)):
+                    rows.append({"text": f"{label} case {group} copy {copy}", "label": label, "group": group})
+                group += 1
+        df = pd.DataFrame(rows)
+
+        splits = group_split(df, df["group"], seed=0)
+        owners = {}
+        for name, split in zip(("train", "val", "test"), splits):
+            for group_id in split["group"].unique():
+                owners.setdefault(group_id, set()).add(name)
+        self.assertEqual(sum(len(split) for split in splits), len(df))
+        self.assertFalse({g: names for g, names in owners.items() if len(names) > 1})
+
+        overall = df["label"].value_counts(normalize=True)
+        for name, split, share in zip(("train", "val", "test"), splits, (0.8, 0.1, 0.1)):
+            with self.subTest(split=name):
+                self.assertAlmostEqual(len(split) / len(df), share, delta=0.05)
+                self.assertEqual(set(split["label"]), set(overall.index))
+                # Each label's share of the split stays close to its share of the corpus
+                difference = (split["label"].value_counts(normalize=True) - overall).abs().max()
+                self.assertLess(difference, 0.06)
+
+    def test_split_corpus_keeps_near_duplicates_together(self):
+        from training.data import DATASET_DIR, load_corpus, split_corpus
+        from training.dedup import duplicate_groups
+
+        df = load_corpus([os.path.join(DATASET_DIR, "Symptom2Disease.csv")])
+        with contextlib.redirect_stdout(io.StringIO()):
+            splits = split_corpus(df, dedup_threshold=0.7)
+        self.assertEqual(sum(len(split) for split in splits), len(df))
+        # Cluster the rows again, now labelled with the split they ended up in
+        texts = [text for split in splits for text in split["text"]]
+        names = [name for name, split in zip("tvs", splits) for _ in range(len(split))]
+        split_of_group = {}
+        for group, name in zip(duplicate_groups(texts, threshold=0.7, n_process=1), names):
+            split_of_group.setdefault(group, set()).add(name)
+        # The corpus does have near-duplicates to keep together
+        self.assertLess(len(split_of_group), len(texts))
+        self.assertFalse([names for names in split_of_group.values() if len(names) > 1])
+
+
+class VectorStoreTest(unittest.TestCase):
+    def test_embeddings_match_the_notebook(self):
+        import numpy as np
+
+        from training.vectors import build_store, corpus_vocabulary
+
+        tmp = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, tmp, ignore_errors=True)
+        vectors = {"have": [1, 0, 0], "fever": [0, 2, 0], "rash": [0, 0, 4], "cough": [3, 3, 3]}
+        vec_path = os.path.join(tmp, "words.vec")
+        with open(vec_path, "w") as f:
+            f.write(f"{len(vectors)} 3\n")
+            for word, values in vectors.items():
+                f.write(f"{word} {' '.join(map(str, values))}\n")
+
+        texts = ["have fever", "Fever rash unknownword", "", "unknownword", "have fever rash"]
+        with contextlib.redirect_stdout(io.StringIO()):
+            store = build_store(vec_path, corpus_vocabulary(texts), os.path.join(tmp, "store"))
+        self.assertNotIn("cough", store)
+        self.assertAlmostEqual(store.coverage(texts), 7 / 9)
+
+        expected = np.array([[0.5, 1, 0], [0, 1, 2], [0, 0, 0], [0, 0, 0], [1 / 3, 2 / 3, 4 / 3]], dtype=np.float32)
+        for chunk_size in (1, 2, 256):
+            np.testing.assert_allclose(store.sentence_embeddings(texts, chunk_size=chunk_size), expected, rtol=1e-6)
+
+
+class DedupTest(unittest.TestCase):
+    RASH = "I have a red itchy rash on my arms and legs that will not go away"
+    COUGH = "a dry cough with a high fever and chills since three days ago"
+
+    def test_duplicate_groups_of_a_generator(self):
+        from training.dedup import duplicate_groups
+
+        texts = (text for text in [self.RASH, self.COUGH, self.RASH + ".", "headache"])
+        self.assertEqual(duplicate_groups(texts, n_process=1).tolist(), [0, 1, 0, 3])
+
+    def test_report_and_output_stream_the_inputs_again(self):
+        import csv
+        import json
+        import sys
+        from unittest import mock
+
+        from training import dedup
+
+        tmp = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, tmp, ignore_errors=True)
+        first, second = os.path.join(tmp, "a.csv"), os.path.join(tmp, "b.csv")
+        for path, rows in ((first, [("Psoriasis", self.RASH), ("Common Cold", self.COUGH)]),
+                           (second, [("Psoriasis", "headache, and\na stiff neck"), ("Eczema", self.RASH + "!")])):
+            with open(path, "w", newline="", encoding="utf-8") as f:
+                csv.writer(f).writerows([("label", "text"), *rows])
+        report, output = os.path.join(tmp, "report.json"), os.path.join(tmp, "dedup.csv")
+
+        argv = ["dedup", first, second, "--n-process", "1", "--report", report, "--dedup-output", output]
+        with mock.patch.object(sys, "argv", argv), contextlib.redirect_stdout(io.StringIO()):
+            dedup.main()
+
+        with open(report, encoding="utf-8") as f:
+            result = json.load(f)
+        self.assertEqual(
+            {key: result["summary"][key] for key in ("rows", "clusters", "duplicate_rows", "mixed_label_clusters")},
+            {"rows": 4, "clusters": 1, "duplicate_rows": 1, "mixed_label_clusters": 1},
+        )
+        self.assertEqual(result["clusters"], [{"size": 2, "labels": ["Eczema", "Psoriasis"], "members": [
+            {"source": first, "row": 0, "label": "Psoriasis", "text": self.RASH},
+            {"source": second, "row": 1, "label": "Eczema", "text": self.RASH + "!"},
+        ]}])
+        with open(output, newline="", encoding="utf-8") as f:
+            self.assertEqual(list(csv.reader(f)), [
+                ["label", "text"], ["Psoriasis", self.RASH], ["Common Cold", self.COUGH],
+                ["Psoriasis", "headache, and\na stiff neck"],
+            ])
+
+    def test_cluster_report_keeps_only_shown_members(self):
+        from training.dedup import cluster_report
+
+        groups = [0, 0, 0, 3, 0]
+        records = (("s.csv", row, "x" if row < 4 else "y", f"text {row}") for row in range(5))
+        summary, report = cluster_report(groups, records, max_members=2)
+        self.assertEqual(summary["duplicate_rows"], 3)
+        self.assertEqual(report[0]["size"], 4)
+        self.assertEqual(report[0]["labels"], ["x", "y"])
+        self.assertEqual([m["row"] for m in report[0]["members"]], [0, 1])
+
+
+if __name__ == "__main__":
+    unittest.main()
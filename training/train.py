@@ -0,0 +1,237 @@
+"""
+Fine-tune a sequence classifier on the symptom datasets and write a servable model directory.
+
+Replaces the training cells of Disease_Ai_Pipeline.ipynb. Texts are tokenized
+without padding and cached per text (keyed by the tokenizer's content and the
+text), so adding rows to the CSV only tokenizes the new ones; batches are
+padded dynamically and grouped by length. The output directory contains the
+model, tokenizer, id2label.json, metrics.json and splits.json (hashes of the
+texts in each split) and can be used as MedicalAi's INFERENCE['MODEL_DIR'].
+
+    python -m training.train --base-model roberta-base --output-dir model
+    python -m training.train --max-samples 240 --epochs 1 --cpu --output-dir /tmp/smoke-model
+"""
+import argparse
+import hashlib
+import json
+import os
+
+import numpy as np
+
+from training.cache import DiskCache, content_key
+from training.data import DEFAULT_DATASET, label_mappings, load_corpus, save_split, split_corpus
+
+DEFAULT_TOKEN_CACHE = os.path.join(".cache", "tokenized.sqlite3")
+
+
+def tokenizer_fingerprint(tokenizer, max_length):
+    """
+    Identifies the input ids a tokenizer produces: its class, max_length and
+    content (vocabulary, merges, normalisation, added tokens), so a tokenizer
+    retrained or replaced at the same path never reuses cached ids.
+    """
+    digest = hashlib.sha256(f"{type(tokenizer).__name__}:{max_length}".encode())
+    backend = getattr(tokenizer, "backend_tokenizer", None)
+    if backend is not None:
+        # Fast tokenizers: the whole tokenizer.json
+        digest.update(backend.to_str().encode("utf-8"))
+    else:
+        # Slow tokenizers: the files they were loaded from (vocab, merges, sentencepiece model),
+        # from the model directory or the Hugging Face cache
+        from transformers.utils import cached_file
+
+        for filename in sorted(tokenizer.vocab_files_names.values()):
+            path = cached_file(
+                tokenizer.name_or_path, filename, local_files_only=True, _raise_exceptions_for_missing_entries=False
+            )
+            if path:
+                with open(path, "rb") as f:
+                    digest.update(f"{filename}:".encode() + hashlib.sha256(f.read()).digest())
+        digest.update(json.dumps(tokenizer.get_vocab(), sort_keys=True).encode("utf-8"))
+    digest.update(json.dumps(tokenizer.special_tokens_map, sort_keys=True).encode("utf-8"))
+    return digest.hexdigest()
+
+
+def tokenize_cached(texts, tokenizer, max_length, cache=None):
+    """Return unpadded input_ids for each text, tokenizing only texts not already cached."""
+    fingerprint = tokenizer_fingerprint(tokenizer, max_length)
+    keys = [content_key(fingerprint, text) for text in texts]
+    found = cache.get_many(set(keys)) if cache else {}
+
+    missing = list(dict.fromkeys(text for text, key in zip(texts, keys) if key not in found))
+    if missing:
+        encoded = tokenizer(missing, truncation=True, max_length=max_length)
+        new = [(content_key(fingerprint, text), json.dumps(ids)) for text, ids in zip(missing, encoded["input_ids"])]
+        if cache:
+            cache.put_many(new)
+        found.update(new)
+    print(f"Tokenized {len(missing)} new texts, {len(set(keys)) - len(missing)} from cache")
+    return [json.loads(found[key]) for key in keys]
+
+
+def build_dataset(input_ids, labels, arrow_path=None):
+    """
+    Records for the Trainer. With `arrow_path`, the split is saved as an Arrow
+    dataset and re-opened memory-mapped instead of being kept in Python lists.
+    """
+    if arrow_path:
+        from datasets import Dataset, load_from_disk
+
+        Dataset.from_dict({
+            "input_ids": input_ids,
+            "labels": labels,
+            "length": [len(ids) for ids in input_ids],
+        }).save_to_disk(arrow_path)
+        return load_from_disk(arrow_path)
+    return [{"input_ids": ids, "labels": label} for ids, label in zip(input_ids, labels)]
+
+
+def evaluate_split(trainer, dataset, id2label):
+    """Accuracy, top-3 accuracy, weighted/macro F1 and a per-class report for one split."""
+    from sklearn.metrics import classification_report, f1_score
+
+    output = trainer.predict(dataset)
+    logits, labels = output.predictions, output.label_ids
+    predictions = logits.argmax(axis=1)
+    top3 = np.argsort(-logits, axis=1)[:, :3]
+    names = [id2label[i] for i in range(len(id2label))]
+    return {
+        "accuracy": float((predictions == labels).mean()),
+        "top3_accuracy": float((top3 == labels[:, None]).any(axis=1).mean()),
+        "f1_weighted": float(f1_score(labels, predictions, average="weighted")),
+        "f1_macro": float(f1_score(labels, predictions, average="macro")),
+        "report": classification_report(
+            labels, predictions, labels=list(range(len(names))), target_names=names,
+            output_dict=True, zero_division=0,
+        ),
+    }
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="Fine-tune the disease classifier.")
+    parser.add_argument("--data", nargs="+", default=[DEFAULT_DATASET], help="CSV files with label/text columns")
+    parser.add_argument("--text-column", default="text", help="e.g. 'input_with_ner' for the text + NER variant")
+    parser.add_argument("--base-model", default="roberta-base")
+    parser.add_argument("--output-dir", default="model")
+    parser.add_argument("--checkpoint-dir", default=os.path.join(".cache", "checkpoints"))
+    parser.add_argument("--epochs", type=float, default=10)
+    parser.add_argument("--learning-rate", type=float, default=2e-5)
+    parser.add_argument("--batch-size", type=int, default=8)
+    parser.add_argument("--weight-decay", type=float, default=0.05)
+    parser.add_argument("--warmup-ratio", type=float, default=0.1)
+    parser.add_argument("--max-length", type=int, default=128)
+    parser.add_argument("--patience", type=int, default=3, help="Early stopping patience in epochs")
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--max-samples", type=int, default=None, help="Train on a stratified subset (quick runs)")
+    parser.add_argument("--cpu", action="store_true", help="Train on CPU even if a GPU is available")
+    parser.add_argument("--dedup-threshold", type=float, default=None,
+                        help="Keep near-duplicates (MinHash Jaccard >= this) in the same split")
+    parser.add_argument("--token-cache", default=DEFAULT_TOKEN_CACHE, help="Tokenization cache file ('' to disable)")
+    parser.add_argument("--arrow-dir", default=None, help="Save tokenized splits as memory-mapped Arrow datasets here")
+    return parser.parse_args(argv)
+
+
+def main(argv=None):
+    args = parse_args(argv)
+
+    from transformers import (
+        AutoModelForSequenceClassification,
+        AutoTokenizer,
+        DataCollatorWithPadding,
+        EarlyStoppingCallback,
+        Trainer,
+        TrainingArguments,
+        set_seed,
+    )
+
+    set_seed(args.seed)
+    os.environ.setdefault("WANDB_DISABLED", "true")
+
+    df = load_corpus(args.data, text_column=args.text_column)
+    if args.max_samples and args.max_samples < len(df):
+        df = df.groupby("label").sample(frac=args.max_samples / len(df), random_state=args.seed)
+    id2label, label2id = label_mappings(df["label"])
+    splits = dict(zip(("train", "val", "test"), split_corpus(df, args.dedup_threshold, args.seed)))
+
+    tokenizer = AutoTokenizer.from_pretrained(args.base_model)
+    cache = DiskCache(args.token_cache) if args.token_cache else None
+    datasets = {}
+    try:
+        for name, split in splits.items():
+            input_ids = tokenize_cached(split["text"].tolist(), tokenizer, args.max_length, cache)
+            labels = [label2id[label] for label in split["label"]]
+            arrow_path = os.path.join(args.arrow_dir, name) if args.arrow_dir else None
+            datasets[name] = build_dataset(input_ids, labels, arrow_path)
+    finally:
+        if cache:
+            cache.close()
+
+    model = AutoModelForSequenceClassification.from_pretrained(
+        args.base_model, num_labels=len(id2label), id2label=id2label, label2id=label2id,
+        ignore_mismatched_sizes=True,
+    )
+
+    def compute_metrics(eval_pred):
+        logits, labels = eval_pred
+        return {"accuracy": float((np.argmax(logits, axis=1) == labels).mean())}
+
+    train_args = TrainingArguments(
+        output_dir=args.checkpoint_dir,
+        eval_strategy="epoch",
+        save_strategy="epoch",
+        learning_rate=args.learning_rate,
+        per_device_train_batch_size=args.batch_size,
+        per_device_eval_batch_size=args.batch_size,
+        num_train_epochs=args.epochs,
+        weight_decay=args.weight_decay,
+        warmup_ratio=args.warmup_ratio,
+        lr_scheduler_type="cosine",
+        load_best_model_at_end=True,
+        metric_for_best_model="accuracy",
+        save_total_limit=2,
+        logging_steps=50,
+        group_by_length=True,
+        length_column_name="length",
+        use_cpu=args.cpu,
+        seed=args.seed,
+        report_to=[],
+    )
+    trainer = Trainer(
+        model=model,
+        args=train_args,
+        train_dataset=datasets["train"],
+        eval_dataset=datasets["val"],
+        processing_class=tokenizer,
+        data_collator=DataCollatorWithPadding(tokenizer),
+        compute_metrics=compute_metrics,
+        callbacks=[EarlyStoppingCallback(early_stopping_patience=args.patience)],
+    )
+    trainer.train()
+
+    os.makedirs(args.output_dir, exist_ok=True)
+    trainer.save_model(args.output_dir)
+    tokenizer.save_pretrained(args.output_dir)
+
+    metrics = {
+        "base_model": args.base_model,
+        "data": args.data,
+        "text_column": args.text_column,
+        "samples": {name: len(split) for name, split in splits.items()},
+        "val": evaluate_split(trainer, datasets["val"], id2label),
+        "test": evaluate_split(trainer, datasets["test"], id2label),
+    }
+    # training.distill evaluates on the same test texts, so the teacher is never scored on its training data
+    save_split(args.output_dir, splits)
+    with open(os.path.join(args.output_dir, "id2label.json"), "w") as f:
+        json.dump({str(i): label for i, label in id2label.items()}, f, indent=2)
+    with open(os.path.join(args.output_dir, "metrics.json"), "w") as f:
+        json.dump(metrics, f, indent=2)
+
+    print(f"Saved model to {args.output_dir}")
+    for name in ("val", "test"):
+        print(f"{name}: accuracy {metrics[name]['accuracy']:.4f}, top-3 {metrics[name]['top3_accuracy']:.4f}, "
+              f"macro F1 {metrics[name]['f1_macro']:.4f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,168 @@
+"""
+Compact FastText vector store for the sentence-embedding features in the notebook.
+
+Instead of loading the whole `cc.en.300.vec` (2M words, several GB) through
+gensim, `build` streams the file once and keeps only the words that occur in
+the corpus, saving them as a float32 .npy matrix plus a word list. `load`
+memory-maps the matrix, and sentence embeddings are computed for all texts at
+once: token ids are concatenated into one array and averaged per sentence with
+np.add.reduceat. Tokenization matches the notebook's get_sentence_embedding
+(lowercase + whitespace split; unknown words ignored; zeros if none known).
+
+Build the store from the same file and column that will be embedded: the
+preprocessed text has lemmas and expansions ("be", "have", "experience") that
+the raw text lacks, and words missing from the store are silently skipped.
+`embed` prints the share of tokens it found, so a mismatch shows up.
+
+    python -m training.vectors build cc.en.300.vec --corpus Preprocessed_Data.csv --columns Symptoms
+    python -m training.vectors embed Preprocessed_Data.csv --column Symptoms -o FastText_Embeddings_Symptoms.npy
+"""
+import argparse
+import gzip
+import json
+import os
+
+import numpy as np
+
+DEFAULT_STORE = os.path.join(".cache", "fasttext")
+
+
+def tokenize(text):
+    return str(text).lower().split()
+
+
+def corpus_vocabulary(texts):
+    vocab = set()
+    for text in texts:
+        vocab.update(tokenize(text))
+    return vocab
+
+
+def build_store(vec_path, vocab, out_dir=DEFAULT_STORE):
+    """Stream a word2vec text file and save the vectors of `vocab` words to `out_dir`."""
+    opener = gzip.open if vec_path.endswith(".gz") else open
+    with opener(vec_path, "rt", encoding="utf-8", errors="ignore") as f:
+        _, dim = map(int, f.readline().split())
+        vectors = np.zeros((len(vocab), dim), dtype=np.float32)
+        words = []
+        for line in f:
+            word, _, rest = line.rstrip().partition(" ")
+            if word in vocab and len(words) < len(vocab):
+                vectors[len(words)] = np.array(rest.split(), dtype=np.float32)
+                words.append(word)
+
+    os.makedirs(out_dir, exist_ok=True)
+    np.save(os.path.join(out_dir, "vectors.npy"), vectors[:len(words)])
+    with open(os.path.join(out_dir, "words.json"), "w", encoding="utf-8") as f:
+        json.dump(words, f)
+    print(f"Saved {len(words)}/{len(vocab)} corpus words ({dim} dims) to {out_dir}")
+    return VectorStore.load(out_dir)
+
+
+class VectorStore:
+    """Word vectors memory-mapped from a directory written by build_store."""
+
+    def __init__(self, vectors, words):
+        self.vectors = vectors
+        self.index = {word: i for i, word in enumerate(words)}
+
+    @classmethod
+    def load(cls, path=DEFAULT_STORE):
+        vectors = np.load(os.path.join(path, "vectors.npy"), mmap_mode="r")
+        with open(os.path.join(path, "words.json"), encoding="utf-8") as f:
+            words = json.load(f)
+        return cls(vectors, words)
+
+    @property
+    def dim(self):
+        return self.vectors.shape[1]
+
+    def __contains__(self, word):
+        return word in self.index
+
+    def __getitem__(self, word):
+        return self.vectors[self.index[word]]
+
+    def token_ids(self, texts):
+        """Known-word ids of all texts concatenated, and each text's number of ids."""
+        ids, counts = [], np.zeros(len(texts), dtype=np.int64)
+        for i, text in enumerate(texts):
+            text_ids = [self.index[w] for w in tokenize(text) if w in self.index]
+            ids.extend(text_ids)
+            counts[i] = len(text_ids)
+        return np.asarray(ids, dtype=np.int64), counts
+
+    def coverage(self, texts):
+        """Share of the tokens of `texts` that have a vector."""
+        total = known = 0
+        for text in texts:
+            words = tokenize(text)
+            total += len(words)
+            known += sum(1 for w in words if w in self.index)
+        return known / total if total else 1.0
+
+    def sentence_embeddings(self, texts, chunk_size=256):
+        """
+        Mean word vector of each text (zeros when no word is known), as an (n, dim) array.
+
+        Each chunk gathers one vector per token, about chunk_size x words per
+        text x dim x 4 bytes (8 MB for 256 texts of 25 words at 300 dims).
+        """
+        out = np.zeros((len(texts), self.dim), dtype=np.float32)
+        for start in range(0, len(texts), chunk_size):
+            chunk = texts[start:start + chunk_size]
+            ids, counts = self.token_ids(chunk)
+            nonempty = np.flatnonzero(counts)
+            if not len(nonempty):
+                continue
+            # Offsets of the non-empty texts only: empty texts add no ids, so the
+            # segments between consecutive offsets are exactly each text's words.
+            offsets = (np.cumsum(counts) - counts)[nonempty]
+            sums = np.add.reduceat(self.vectors[ids], offsets, axis=0)
+            out[start + nonempty] = sums / counts[nonempty, None]
+        return out
+
+
+def main():
+    import pandas as pd
+
+    parser = argparse.ArgumentParser(description="Build and use a pruned FastText vector store.")
+    sub = parser.add_subparsers(dest="command", required=True)
+
+    build = sub.add_parser("build", help="Prune a .vec/.vec.gz file to the corpus vocabulary")
+    build.add_argument("vec_path")
+    build.add_argument("--corpus", nargs="+", required=True, help="CSV files whose words are kept")
+    build.add_argument("--columns", nargs="+", default=["text"], help="Text columns to take words from")
+    build.add_argument("--store", default=DEFAULT_STORE)
+
+    embed = sub.add_parser("embed", help="Write sentence embeddings of a CSV column to .npy")
+    embed.add_argument("csv")
+    embed.add_argument("--column", default="text")
+    embed.add_argument("--store", default=DEFAULT_STORE)
+    embed.add_argument("-o", "--output", required=True)
+
+    args = parser.parse_args()
+    if args.command == "build":
+        texts = []
+        for path in args.corpus:
+            df = pd.read_csv(path, encoding="utf-8-sig")
+            missing = [column for column in args.columns if column not in df]
+            if missing:
+                raise SystemExit(f"{path} has no column {', '.join(missing)} (columns: {', '.join(df.columns)})")
+            for column in args.columns:
+                texts.extend(df[column].astype(str))
+        build_store(args.vec_path, corpus_vocabulary(texts), args.store)
+    else:
+        texts = pd.read_csv(args.csv, encoding="utf-8-sig")[args.column].astype(str).tolist()
+        store = VectorStore.load(args.store)
+        coverage = store.coverage(texts)
+        if coverage < 0.95:
+            print(f"Warning: only {coverage:.1%} of the tokens in '{args.column}' have a vector; "
+                  f"was the store built from this column?")
+        embeddings = store.sentence_embeddings(texts)
+        np.save(args.output, embeddings)
+        print(f"Saved {embeddings.shape} embeddings to {args.output} ({coverage:.1%} of tokens known)")
+
+
+if __name__ == "__main__":
+    main()